@@ -159,10 +159,10 @@ class GitProcessProtocol(SubprocessProtocol):
         :returns bool:
 
         """
-        if self.avatar.project:  # deployment key
-            return self.repository.project == self.avatar.project
-        elif self.avatar.user:  # user key
-            return self.repository.project.has_access(self.avatar.user.id)
+        from git.permissions import has_read_permission
+        return has_read_permission(
+            self.repository, user=self.avatar.user,
+            deploy_project=self.avatar.project)
 
     @staticmethod
     def log(data, system, newline=False):
@@ -507,41 +507,10 @@ class GitReceivePackProcessProtocol(GitProcessProtocol):
         :return bool: whether user has push permissions.
 
         """
-        from solution.models import Solution
-
-        parts = reference.split('/')
-        project = self.repository.project
-
-        # Read only for project keys
-        if self.avatar.project or not self.avatar.user:
-            return False
-
-        user_id = self.avatar.user.id
-        if parts[0] == 'refs' and parts[1] == 'heads':
-            if parts[2] == 'master':
-                return project.is_admin(user_id) or project.is_manager(user_id)
-
-            if parts[2] == 'develop':
-                return (
-                    project.is_admin(user_id) or
-                    project.is_manager(user_id) or
-                    project.is_developer(user_id))
-
-            if parts[2] == 's':  # solution branches
-                try:
-                    solution_id = int(parts[3])
-                    solution = Solution.objects.get(id=solution_id)
-                except (
-                        ValueError,
-                        Solution.DoesNotExist,
-                        Solution.MultipleObjectsReturned):
-                    return False
-                else:
-                    # Only solution owner can push to solution branch.
-                    return solution.is_owner(self.avatar.user)
-
-        # For all other branches and tags creation must be admin or manager.
-        return project.is_admin(user_id) or project.is_manager(user_id)
+        from git.permissions import has_push_permission
+        return has_push_permission(
+            self.repository, reference, user=self.avatar.user,
+            deploy_project=self.avatar.project)
 
     def eof_received(self):
         """ End of file received on git receive pack.
@@ -88,6 +88,10 @@ class GatewaySessionInterface():
                 log.msg("Repository not found.")
                 self._ssh_process_protocol.loseConnection()
             else:
+                if not repository.is_ready:
+                    log.msg("Repository is not ready.")
+                    self._ssh_process_protocol.loseConnection()
+                    return
 
                 # Initiate the git protocol to run on top of the ssh process
                 # protocol, all output from the git process should funnel
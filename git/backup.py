@@ -0,0 +1,221 @@
+""" Incremental backups of hosted repositories.
+
+Every backup run writes a git bundle with only the objects reachable from
+the ref tips that changed since the previous run. The runs of a repository
+are chained in a manifest, so a restore replays the bundles in order and
+then resets the refs to the tips recorded by the last entry.
+
+"""
+import json
+import logging
+import os
+import subprocess
+from shutil import rmtree
+
+from django.conf import settings
+from django.utils import timezone
+
+
+logger = logging.getLogger('joltem')
+
+MANIFEST_NAME = 'manifest.json'
+
+
+class BackupError(Exception):
+
+    """ Backup or restore of a repository failed. """
+
+
+def _git(path, *args, **kwargs):
+    """ Run a git command against a bare repository.
+
+    :return str: Standard output of the command
+    :raise BackupError: When the command exits with non-zero status
+
+    """
+    process = subprocess.Popen(
+        ('git', '--git-dir=%s' % path) + args,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = process.communicate()
+    if process.returncode and not kwargs.get('ignore_errors'):
+        raise BackupError("git %s failed: %s" % (args[0], err.strip()))
+    return out
+
+
+def get_backup_dir(repository_id):
+    """ Get the directory containing the backups of a repository.
+
+    :return str:
+
+    """
+    return os.path.join(settings.GATEWAY_BACKUPS_DIR, str(repository_id))
+
+
+def load_manifest(repository_id):
+    """ Load the manifest chain of a repository.
+
+    :return dict:
+
+    """
+    path = os.path.join(get_backup_dir(repository_id), MANIFEST_NAME)
+    if not os.path.exists(path):
+        return dict(repository=repository_id, entries=[])
+    with open(path) as manifest_file:
+        return json.load(manifest_file)
+
+
+def save_manifest(repository_id, manifest):
+    """ Write the manifest, replacing the previous one atomically. """
+    path = os.path.join(get_backup_dir(repository_id), MANIFEST_NAME)
+    temp_path = '%s.tmp' % path
+    with open(temp_path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+        manifest_file.flush()
+        os.fsync(manifest_file.fileno())
+    os.rename(temp_path, path)
+
+
+def get_refs(path):
+    """ Get ref tips of a repository.
+
+    :return dict: Object ids keyed by ref names
+
+    """
+    output = _git(path, 'for-each-ref', '--format=%(objectname) %(refname)')
+    refs = {}
+    for line in output.splitlines():
+        oid, name = line.split(' ', 1)
+        refs[name] = oid
+    return refs
+
+
+def has_object(path, oid):
+    """ Check whether a repository contains an object.
+
+    :return bool:
+
+    """
+    with open(os.devnull, 'w') as devnull:
+        return not subprocess.call(
+            ('git', '--git-dir=%s' % path, 'cat-file', '-e', oid),
+            stderr=devnull)
+
+
+def get_head(path):
+    """ Get the ref HEAD points to.
+
+    :return str:
+
+    """
+    return _git(path, 'symbolic-ref', 'HEAD', ignore_errors=True).strip() \
+        or None
+
+
+def backup_repository(repository):
+    """ Make an incremental backup of a repository.
+
+    :return dict: A new manifest entry or None when nothing changed
+
+    """
+    path = repository.absolute_path
+    if not os.path.isdir(path):
+        logger.warning("Repository %d is missing on disk.", repository.id)
+        return None
+
+    backup_dir = get_backup_dir(repository.id)
+    if not os.path.isdir(backup_dir):
+        os.makedirs(backup_dir)
+
+    manifest = load_manifest(repository.id)
+    previous = manifest['entries'][-1] if manifest['entries'] else None
+    previous_refs = previous['refs'] if previous else {}
+
+    refs = get_refs(path)
+    head = get_head(path)
+    if previous is not None and refs == previous_refs \
+            and head == previous['head']:
+        return None
+
+    changed = sorted(
+        name for name, oid in refs.items()
+        if previous_refs.get(name) != oid)
+    # Previous tips which are still known to the repository, everything
+    # reachable from them is already stored by earlier bundles.
+    basis = sorted(set(
+        oid for oid in previous_refs.values() if has_object(path, oid)))
+
+    sequence = previous['sequence'] + 1 if previous else 1
+    bundle = None
+    if changed and _git(
+            path, 'rev-list', '--count', *(
+                [refs[name] for name in changed] + ['--not'] + basis)
+    ).strip() != '0':
+        bundle = '%06d.bundle' % sequence
+        _git(path, 'bundle', 'create', os.path.join(backup_dir, bundle),
+             *(changed + ['--not'] + basis))
+
+    entry = dict(
+        sequence=sequence,
+        bundle=bundle,
+        basis=basis,
+        refs=refs,
+        head=head,
+        time_created=timezone.now().isoformat(),
+    )
+    manifest['entries'].append(entry)
+    save_manifest(repository.id, manifest)
+    logger.info("Repository %d backup %d: %d refs changed.",
+                repository.id, sequence, len(changed))
+    return entry
+
+
+def restore_repository(repository_id, path, sequence=None):
+    """ Restore a repository from its manifest chain.
+
+    :param repository_id: Id of the backed up repository
+    :param path: Where to create the restored bare repository
+    :param sequence: Restore up to this entry, the last one by default
+    :return dict: Restored ref tips
+    :raise BackupError: When the chain is broken or tips do not match
+
+    """
+    manifest = load_manifest(repository_id)
+    entries = [e for e in manifest['entries']
+               if sequence is None or e['sequence'] <= sequence]
+    if not entries:
+        raise BackupError("No backups of repository %d." % repository_id)
+
+    if os.path.exists(path):
+        raise BackupError("Restore path %s already exists." % path)
+    from pygit2 import init_repository
+    init_repository(path, bare=True)
+
+    backup_dir = get_backup_dir(repository_id)
+    try:
+        for entry in entries:
+            if entry['bundle'] is None:
+                continue
+            bundle = os.path.join(backup_dir, entry['bundle'])
+            _git(path, 'bundle', 'verify', bundle)
+            _git(path, 'fetch', '--quiet', bundle,
+                 '+refs/*:refs/restore/%d/*' % entry['sequence'])
+
+        final = entries[-1]
+        for name in get_refs(path):
+            _git(path, 'update-ref', '-d', name)
+        for name, oid in final['refs'].items():
+            _git(path, 'update-ref', name, oid)
+        if final['head']:
+            _git(path, 'symbolic-ref', 'HEAD', final['head'])
+
+        refs = get_refs(path)
+        if refs != final['refs']:
+            raise BackupError(
+                "Restored refs of repository %d do not match the manifest."
+                % repository_id)
+        _git(path, 'fsck', '--connectivity-only', '--no-dangling')
+    except BackupError:
+        rmtree(path, ignore_errors=True)
+        raise
+
+    return refs
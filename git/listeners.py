@@ -0,0 +1,9 @@
+from django.db.models.signals import post_save, post_delete
+
+from .models import Repository
+from .receivers import *
+
+
+post_save.connect(provision_repository_from_repository, sender=Repository)
+
+post_delete.connect(deprovision_repository_from_repository, sender=Repository)
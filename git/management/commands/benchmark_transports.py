@@ -0,0 +1,59 @@
+""" Compare fetch latency of git transports. """
+import subprocess
+import tempfile
+import time
+from optparse import make_option
+from shutil import rmtree
+
+from django.core.management import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+
+    """ Measure fetches of the same repository over SSH and HTTP.
+
+    Usage: benchmark_transports <ssh url> <http url> [--runs=N]
+
+    """
+
+    args = '<ssh url> <http url>'
+    option_list = BaseCommand.option_list + (
+        make_option('--runs', type='int', default=10,
+                    help='Number of fetches per transport.'),
+    )
+
+    def handle(self, *args, **options):
+        """ Handle command. """
+        if len(args) != 2:
+            raise CommandError("Specify SSH and HTTP urls of a repository.")
+        for name, url in zip(('ssh', 'http'), args):
+            for operation in ('ls-remote', 'clone'):
+                timings = sorted(
+                    self.measure(operation, url)
+                    for _ in range(options['runs']))
+                self.stdout.write(
+                    "%-5s %-10s min %7.1f ms  median %7.1f ms  max %7.1f ms"
+                    % (name, operation, timings[0] * 1000,
+                       timings[len(timings) // 2] * 1000,
+                       timings[-1] * 1000))
+
+    @staticmethod
+    def measure(operation, url):
+        """ Run a git operation against url.
+
+        :return float: Duration in seconds
+
+        """
+        path = tempfile.mkdtemp()
+        if operation == 'clone':
+            command = ('git', 'clone', '--bare', '--quiet', url, path)
+        else:
+            command = ('git', 'ls-remote', url)
+        try:
+            start = time.time()
+            with open('/dev/null', 'w') as devnull:
+                if subprocess.call(command, stdout=devnull):
+                    raise CommandError("Failed to fetch %s." % url)
+            return time.time() - start
+        finally:
+            rmtree(path, ignore_errors=True)
@@ -13,4 +13,5 @@ class RepositoryQuerySet(QuerySet):
         :return QuerySet:
 
         """
-        return self.filter(is_hidden=False)
+        return self.filter(is_hidden=False).exclude(
+            state=self.model.STATE_CHOICES.deleting)
@@ -1,5 +1,8 @@
 """ Git related modules. """
 import logging
+from binascii import hexlify
+from os import urandom
+
 from django.conf import settings
 from django.db import models
 from model_utils.managers import PassThroughManager
@@ -7,6 +10,7 @@ from pygit2 import Repository as PyGitRepository
 from twisted.conch.ssh.keys import Key, BadKeyError
 
 from .managers import RepositoryQuerySet
+from joltem.models.utils import Choices
 from project.models import Project
 
 
@@ -15,11 +19,24 @@ logger = logging.getLogger('joltem')
 
 class Repository(models.Model):
 
-    """ Git repository. """
+    """ Git repository.
+
+    Repositories on disk are created and removed by workers after the row
+    is saved or deleted, `state` tracks whether the repository may be used.
+
+    """
+
+    STATE_CHOICES = Choices(
+        (0, "pending"),
+        (10, "ready"),
+        (20, "deleting"),
+    )
 
     name = models.CharField(max_length=200)
     description = models.TextField(null=True, blank=True)
     is_hidden = models.BooleanField(default=False)
+    state = models.PositiveSmallIntegerField(
+        default=STATE_CHOICES.pending, choices=STATE_CHOICES)
 
     time_updated = models.DateTimeField(auto_now=True)
 
@@ -52,49 +69,63 @@ class Repository(models.Model):
     def __unicode__(self):
         return self.name
 
-    def save(
-            self, force_insert=False, force_update=False, using=None,
-            update_fields=None):
-        """ Save model and init git repository.
+    @property
+    def is_ready(self):
+        """ Check repository is initiated on disk.
+
+        :return bool:
+
+        """
+        return self.state == self.STATE_CHOICES.ready
+
+    def provision(self):
+        """ Init bare repository on disk and mark it ready.
 
-        :return Model: A saved instance
+        Safe to call again for a repository which already exists.
 
         """
-        new = False if self.pk else True
-        obj = super(Repository, self).save(
-            force_insert, force_update, using, update_fields)
-        if new:
-            from pygit2 import init_repository
-            # Initiate bare repository on server
+        from os.path import isdir
+        from pygit2 import init_repository
+        if not isdir(self.absolute_path):
             init_repository(self.absolute_path, bare=True)
-        return obj
+        Repository.objects.filter(
+            pk=self.pk, state=self.STATE_CHOICES.pending
+        ).update(state=self.STATE_CHOICES.ready)
 
-    def delete(self, using=None):
-        """ Delete repository from disk.
+    def deprovision(self):
+        """ Remove repository from disk, after it is deleted.
 
-        NOTE: Should be backup.
+        Changes since the last backup are saved before removing.
 
         """
+        from os.path import isdir
         from shutil import rmtree
-        rmtree(self.absolute_path)
-
-        super(Repository, self).delete(using)
+        if isdir(self.absolute_path):
+            if settings.GATEWAY_BACKUPS_DIR:
+                from .backup import backup_repository
+                backup_repository(self)
+            rmtree(self.absolute_path)
 
 
 class Authentication(models.Model):
 
-    """ A public authentication key for SSH. """
+    """ A public authentication key for SSH.
+
+    The token authenticates the owner of the key over HTTP.
+
+    """
 
     name = models.CharField(max_length=200)
     key = models.TextField()  # open ssh representation of public rsa key
     fingerprint = models.CharField(max_length=47, blank=True)
+    token = models.CharField(max_length=40, blank=True, db_index=True)
 
     # Relations
     user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True)
     project = models.ForeignKey(Project, null=True, blank=True)
 
     def save(self, **kwargs):
-        """ Calculate fingerprint if not exists.
+        """ Calculate fingerprint and generate token if not exists.
 
         :returns: A saved instance
 
@@ -102,9 +133,20 @@ class Authentication(models.Model):
         if not self.fingerprint:
             key = Authentication.load_key(self.key)
             self.fingerprint = key.fingerprint()
+        if not self.token:
+            self.token = Authentication.generate_token()
 
         return super(Authentication, self).save(**kwargs)
 
+    @staticmethod
+    def generate_token():
+        """ Generate a random token for HTTP authentication.
+
+        :return str:
+
+        """
+        return hexlify(urandom(20))
+
     @classmethod
     def load_key(cls, data):
         """ Attempt to parse data to check if it is a valid public ssh rsa key.
@@ -0,0 +1,77 @@
+""" Access rules for git transports.
+
+Shared by the SSH gateway and the smart-HTTP views. The credentials are
+either a user or a project, the latter for deployment keys.
+
+"""
+
+
+def has_read_permission(repository, user=None, deploy_project=None):
+    """ Check that the credentials allow reading the repository.
+
+    :param repository: an instance of a Repository model
+    :param user: a user authenticated by his key or token
+    :param deploy_project: a project authenticated by a deployment key or
+        token
+    :return bool:
+
+    """
+    if deploy_project:  # deployment key
+        return repository.project == deploy_project
+    elif user:  # user key
+        return repository.project.has_access(user.id)
+    return not repository.project.is_private
+
+
+def has_push_permission(repository, reference, user=None,
+                        deploy_project=None):
+    """ Determine whether the credentials allow to push to the reference.
+
+    Only the solution owners have writes to push to their solution
+    branch. Project admins and managers can push to all other branches.
+    Developers can only push to `refs/heads/develop`.
+
+    :param repository: an instance of a Repository model
+    :param reference: pushing to this reference.
+    :param user: a user authenticated by his key or token
+    :param deploy_project: a project authenticated by a deployment key or
+        token
+    :return bool: whether user has push permissions.
+
+    """
+    from solution.models import Solution
+
+    parts = reference.split('/')
+    project = repository.project
+
+    # Read only for project keys
+    if deploy_project or not user:
+        return False
+
+    user_id = user.id
+    if parts[0] == 'refs' and parts[1] == 'heads':
+        if parts[2] == 'master':
+            return project.is_admin(user_id) or project.is_manager(user_id)
+
+        if parts[2] == 'develop':
+            return (
+                project.is_admin(user_id) or
+                project.is_manager(user_id) or
+                project.is_developer(user_id))
+
+        if parts[2] == 's':  # solution branches
+            try:
+                solution_id = int(parts[3])
+                solution = Solution.objects.get(id=solution_id)
+            except (
+                    ValueError,
+                    IndexError,
+                    Solution.DoesNotExist,
+                    Solution.MultipleObjectsReturned):
+                return False
+            else:
+                # Only solution owner can push to solution branch.
+                return solution.is_owner(user)
+
+    # For all other branches and tags creation must be admin or manager.
+    return project.is_admin(user_id) or project.is_manager(user_id)
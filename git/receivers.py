@@ -0,0 +1,19 @@
+""" Git related receivers for handling signals. """
+
+
+def provision_repository_from_repository(sender, instance=None,
+                                         created=False, **kwargs):
+    """ Schedule init of a new repository on disk. """
+    from .tasks import provision_repository  # avoid circular import
+    if created:
+        provision_repository.delay(instance.pk)
+
+
+def deprovision_repository_from_repository(sender, instance=None, **kwargs):
+    """ Schedule removal of a deleted repository from disk.
+
+    Also sent for repositories deleted with their project.
+
+    """
+    from .tasks import deprovision_repository  # avoid circular import
+    deprovision_repository.delay(instance.pk)
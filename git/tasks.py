@@ -0,0 +1,70 @@
+""" Git related tasks. """
+
+from __future__ import absolute_import
+
+import logging
+
+from .backup import backup_repository, BackupError
+from .models import Repository
+from joltem.celery import app
+
+
+logger = logging.getLogger('joltem')
+
+PROVISION_MAX_RETRIES = 10
+PROVISION_RETRY_DELAY = 5
+
+
+@app.task(bind=True, ignore_result=True,
+          max_retries=PROVISION_MAX_RETRIES,
+          default_retry_delay=PROVISION_RETRY_DELAY)
+def provision_repository(self, repository_id):
+    """ Init a new repository on disk.
+
+    The task is queued within the transaction which saves the repository,
+    it is retried until the transaction is committed.
+
+    :param repository_id: Id of the repository
+
+    """
+    try:
+        repository = Repository.objects.get(pk=repository_id)
+    except Repository.DoesNotExist as exc:
+        raise self.retry(exc=exc)
+    if repository.state == Repository.STATE_CHOICES.pending:
+        repository.provision()
+
+
+@app.task(ignore_result=True)
+def deprovision_repository(repository_id):
+    """ Remove a deleted repository from disk.
+
+    :param repository_id: Id of the repository
+
+    """
+    Repository(pk=repository_id).deprovision()
+
+
+@app.task(ignore_result=True)
+def backup_repositories():
+    """ Make incremental backups of all repositories. """
+    for repository in Repository.objects.filter(
+            state=Repository.STATE_CHOICES.ready).iterator():
+        backup_repository_task.delay(repository.pk)
+
+
+@app.task(ignore_result=True)
+def backup_repository_task(repository_id):
+    """ Make an incremental backup of a repository.
+
+    :param repository_id: Id of the repository
+
+    """
+    try:
+        repository = Repository.objects.get(pk=repository_id)
+    except Repository.DoesNotExist:
+        return
+    try:
+        backup_repository(repository)
+    except BackupError:
+        logger.exception("Backup of repository %d failed.", repository_id)
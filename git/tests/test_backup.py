@@ -0,0 +1,125 @@
+""" Test incremental repository backups. """
+import os
+import tempfile
+from shutil import rmtree
+
+from django.test.utils import override_settings
+
+from .mock import get_mock_signature, make_mock_commit, mock_commits
+from .test_git import RepositoryTestCase
+from git.backup import (
+    backup_repository, restore_repository, load_manifest, get_refs,
+    get_backup_dir, BackupError)
+
+
+class BackupTestCase(RepositoryTestCase):
+
+    """ Backups are restored to temporary repositories. """
+
+    def setUp(self):
+        """ Use temporary directories for backups and restores. """
+        self.temp_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            GATEWAY_BACKUPS_DIR=os.path.join(self.temp_dir, 'backups'))
+        self.settings_override.enable()
+        super(BackupTestCase, self).setUp()
+        self.signature = get_mock_signature('emil')
+
+    def tearDown(self):
+        """ Remove temporary directories. """
+        super(BackupTestCase, self).tearDown()
+        self.settings_override.disable()
+        rmtree(self.temp_dir)
+
+    def restore(self, name='restored.git', sequence=None):
+        """ Restore the repository to a temporary path. """
+        return restore_repository(
+            self.repository.id, os.path.join(self.temp_dir, name), sequence)
+
+    def get_bundle_size(self, entry):
+        """ Size of the bundle of a manifest entry. """
+        return os.path.getsize(os.path.join(
+            get_backup_dir(self.repository.id), entry['bundle']))
+
+    def test_nothing_changed(self):
+        """ No entry is added while refs stay the same. """
+        make_mock_commit(self.pygit_repository, self.signature, 'master', [])
+        self.assertTrue(backup_repository(self.repository))
+        self.assertEqual(backup_repository(self.repository), None)
+        self.assertEqual(len(load_manifest(self.repository.id)['entries']), 1)
+
+    def test_incremental(self):
+        """ Bundles contain only objects from new tips. """
+        commits = list(mock_commits(
+            20, self.pygit_repository, self.signature, 'master', []))
+        first = backup_repository(self.repository)
+        self.assertEqual(first['basis'], [])
+
+        oid = make_mock_commit(
+            self.pygit_repository, self.signature, 's/1', [commits[-1]])
+        second = backup_repository(self.repository)
+        self.assertEqual(second['sequence'], 2)
+        self.assertEqual(second['basis'], [commits[-1].hex])
+        self.assertEqual(second['refs']['refs/heads/s/1'], oid.hex)
+        self.assertTrue(
+            self.get_bundle_size(second) < self.get_bundle_size(first))
+
+        refs = self.restore()
+        self.assertEqual(refs, get_refs(self.repository.absolute_path))
+
+    def test_restore_sequence(self):
+        """ Restore the state of an earlier backup. """
+        oid = make_mock_commit(
+            self.pygit_repository, self.signature, 'master', [])
+        backup_repository(self.repository)
+        make_mock_commit(
+            self.pygit_repository, self.signature, 'master', [oid])
+        backup_repository(self.repository)
+        refs = self.restore(sequence=1)
+        self.assertEqual(refs, {'refs/heads/master': oid.hex})
+
+    def test_moved_and_deleted_refs(self):
+        """ Ref moved to an older commit needs no bundle. """
+        commits = list(mock_commits(
+            3, self.pygit_repository, self.signature, 'develop', []))
+        make_mock_commit(
+            self.pygit_repository, self.signature, 'master', [commits[-1]])
+        backup_repository(self.repository)
+
+        self.pygit_repository.lookup_reference(
+            'refs/heads/develop').set_target(commits[0])
+        self.pygit_repository.lookup_reference(
+            'refs/heads/master').delete()
+        entry = backup_repository(self.repository)
+        self.assertEqual(entry['bundle'], None)
+
+        refs = self.restore()
+        self.assertEqual(refs, {'refs/heads/develop': commits[0].hex})
+
+    def test_missing_bundle(self):
+        """ Broken chain is reported and the restore is removed. """
+        oid = make_mock_commit(
+            self.pygit_repository, self.signature, 'master', [])
+        backup_repository(self.repository)
+        make_mock_commit(
+            self.pygit_repository, self.signature, 'master', [oid])
+        entry = backup_repository(self.repository)
+        os.remove(os.path.join(
+            get_backup_dir(self.repository.id), entry['bundle']))
+        with self.assertRaises(BackupError):
+            self.restore()
+        self.assertFalse(os.path.exists(
+            os.path.join(self.temp_dir, 'restored.git')))
+
+    def test_backup_on_delete(self):
+        """ Deleted repository is restorable. """
+        oid = make_mock_commit(
+            self.pygit_repository, self.signature, 'master', [])
+        repository_id = self.repository.id
+        self.repository.delete()
+        refs = restore_repository(
+            repository_id, os.path.join(self.temp_dir, 'restored.git'))
+        self.assertEqual(refs, {'refs/heads/master': oid.hex})
+        # Recreate repository for tear down
+        self.repository.pk = None
+        self.repository.save()
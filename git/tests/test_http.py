@@ -0,0 +1,181 @@
+""" Test smart HTTP git transport. """
+from base64 import b64encode
+from io import BytesIO
+
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from .mock import get_mock_signature, make_mock_commit
+from gateway.libs.git.utils import get_packet_line, FLUSH_PACKET_LINE
+from git.models import Repository
+from joltem.libs import mixer
+
+ZERO_OID = '0' * 40
+
+
+class BaseGitHttpTestCase(TestCase):
+
+    """ Repository with master and develop branches. """
+
+    is_private = None
+
+    def setUp(self):
+        self.project = mixer.blend(
+            'project.project', is_private=self.is_private)
+        self.repository = Repository.objects.get(pk=mixer.blend(
+            'git.repository', project=self.project).pk)
+        pygit_repository = self.repository.load_pygit_object()
+        signature = get_mock_signature('emil')
+        self.master_oid = make_mock_commit(
+            pygit_repository, signature, 'master', [])
+        self.develop_oid = make_mock_commit(
+            pygit_repository, signature, 'develop', [self.master_oid])
+        self.user = mixer.blend('joltem.user')
+        self.key = mixer.blend('git.authentication', user=self.user)
+
+    def tearDown(self):
+        self.repository.delete()
+
+    def get_auth(self, key=None, username=None):
+        """ Get basic authentication header. """
+        key = key or self.key
+        username = username or (key.user.username if key.user else 'deploy')
+        return dict(HTTP_AUTHORIZATION='Basic %s' % b64encode(
+            '%s:%s' % (username, key.token)))
+
+    def info_refs(self, service, **extra):
+        """ Request references advertisement. """
+        url = reverse('project:git:http_info_refs', kwargs=dict(
+            project_id=self.project.pk, repository_id=self.repository.pk))
+        return self.client.get(url, dict(service=service), **extra)
+
+    def service(self, service, body, **extra):
+        """ Post body to git service. """
+        url = reverse('project:git:http_service', kwargs=dict(
+            project_id=self.project.pk, repository_id=self.repository.pk,
+            service=service))
+        return self.client.post(
+            url, body, content_type='application/x-%s-request' % service,
+            **extra)
+
+    def fetch_master(self, **extra):
+        """ Request pack of master branch. """
+        body = get_packet_line('want %s no-progress\n' % self.master_oid.hex)
+        return self.service(
+            'git-upload-pack',
+            body + FLUSH_PACKET_LINE + get_packet_line('done\n'), **extra)
+
+    def delete_develop(self, **extra):
+        """ Push deletion of develop branch. """
+        body = get_packet_line('%s %s refs/heads/develop\x00report-status '
+                               'delete-refs\n' % (self.develop_oid.hex,
+                                                  ZERO_OID))
+        return self.service(
+            'git-receive-pack', body + FLUSH_PACKET_LINE, **extra)
+
+
+class GitHttpTestCase(BaseGitHttpTestCase):
+
+    """ Test fetching and pushing over HTTP. """
+
+    is_private = False
+
+    def test_info_refs(self):
+        response = self.info_refs('git-upload-pack')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'],
+                         'application/x-git-upload-pack-advertisement')
+        self.assertTrue(response.content.startswith(
+            '001e# service=git-upload-pack\n0000'))
+        self.assertIn('%s refs/heads/develop' % self.develop_oid.hex,
+                      response.content)
+
+    def test_info_refs_receive_pack_anonymous(self):
+        response = self.info_refs('git-receive-pack')
+        self.assertEqual(response.status_code, 401)
+        response = self.info_refs('git-receive-pack', **self.get_auth())
+        self.assertEqual(response.status_code, 200)
+
+    def test_invalid_token(self):
+        self.key.token = 'invalid'
+        response = self.info_refs('git-upload-pack', **self.get_auth())
+        self.assertEqual(response.status_code, 401)
+        response = self.info_refs('git-upload-pack', **self.get_auth(
+            key=mixer.blend('git.authentication', user=mixer.blend(
+                'joltem.user')), username=self.user.username))
+        self.assertEqual(response.status_code, 401)
+
+    def test_upload_pack(self):
+        response = self.fetch_master()
+        self.assertEqual(response.status_code, 200)
+        content = ''.join(response.streaming_content)
+        self.assertTrue(content.startswith(get_packet_line('NAK\n')))
+        self.assertIn('PACK', content)
+
+    def test_receive_pack_denied(self):
+        response = self.delete_develop(**self.get_auth())
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('ng refs/heads/develop permission denied',
+                      response.content)
+        self.assertTrue(self.repository.load_pygit_object().lookup_reference(
+            'refs/heads/develop'))
+
+    def test_receive_pack(self):
+        self.project.admin_set.add(self.user)
+        response = self.delete_develop(**self.get_auth())
+        self.assertEqual(response.status_code, 200)
+        content = ''.join(response.streaming_content)
+        self.assertIn('ok refs/heads/develop', content)
+        self.assertNotIn(
+            'refs/heads/develop',
+            self.repository.load_pygit_object().listall_references())
+
+    def test_receive_pack_deploy_key(self):
+        key = mixer.blend('git.authentication', project=self.project)
+        response = self.delete_develop(**self.get_auth(key=key))
+        self.assertIn('ng refs/heads/develop permission denied',
+                      response.content)
+
+    def test_chunked(self):
+        """ Large bodies are sent chunked, without a content length. """
+        self.project.admin_set.add(self.user)
+        body = get_packet_line('%s %s refs/heads/develop\x00report-status '
+                               'delete-refs\n' % (self.develop_oid.hex,
+                                                  ZERO_OID))
+        extra = {'CONTENT_LENGTH': '', 'HTTP_TRANSFER_ENCODING': 'chunked',
+                 'wsgi.input': BytesIO(body + FLUSH_PACKET_LINE)}
+        extra.update(self.get_auth())
+        response = self.service('git-receive-pack', '', **extra)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('ok refs/heads/develop',
+                      ''.join(response.streaming_content))
+
+
+class PrivateGitHttpTestCase(BaseGitHttpTestCase):
+
+    """ Private repositories require credentials. """
+
+    is_private = True
+
+    def test_info_refs(self):
+        response = self.info_refs('git-upload-pack')
+        self.assertEqual(response.status_code, 401)
+        response = self.info_refs('git-upload-pack', **self.get_auth())
+        self.assertEqual(response.status_code, 403)
+
+    def test_upload_pack(self):
+        self.assertEqual(self.fetch_master().status_code, 401)
+        self.project.invitee_set.add(self.user)
+        response = self.fetch_master(**self.get_auth())
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('PACK', ''.join(response.streaming_content))
+
+    def test_upload_pack_deploy_key(self):
+        key = mixer.blend('git.authentication', project=self.project)
+        response = self.fetch_master(**self.get_auth(key=key))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('PACK', ''.join(response.streaming_content))
+        other_key = mixer.blend('git.authentication', project=mixer.blend(
+            'project.project'))
+        response = self.fetch_master(**self.get_auth(key=other_key))
+        self.assertEqual(response.status_code, 403)
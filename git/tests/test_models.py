@@ -1,5 +1,9 @@
+from os.path import isdir
+
 from django.test import TestCase
 
+from git.models import Repository
+from git.tasks import provision_repository, deprovision_repository
 from joltem.libs import mixer
 
 
@@ -8,3 +12,48 @@ class GitModelsTest(TestCase):
     def test_save(self):
         key = mixer.blend('git.authentication')
         self.assertTrue(key.fingerprint)
+
+
+class RepositoryStateTest(TestCase):
+
+    def test_provision(self):
+        repository = mixer.blend('git.repository')
+        repository = Repository.objects.get(pk=repository.pk)
+        self.assertTrue(repository.is_ready)
+        self.assertTrue(isdir(repository.absolute_path))
+
+        # Worker is idempotent
+        provision_repository(repository.pk)
+        self.assertTrue(Repository.objects.get(pk=repository.pk).is_ready)
+        repository.delete()
+
+    def test_provision_missing(self):
+        # Not committed yet, retried until the retries run out
+        self.assertRaises(Repository.DoesNotExist,
+                          provision_repository.delay, 3434)
+
+    def test_deprovision(self):
+        repository = mixer.blend('git.repository')
+        pk, path = repository.pk, repository.absolute_path
+        repository.delete()
+        self.assertFalse(isdir(path))
+        self.assertFalse(Repository.objects.filter(pk=pk).exists())
+
+        # Worker is idempotent
+        deprovision_repository(pk)
+
+    def test_deprovision_project(self):
+        repository = mixer.blend('git.repository')
+        path = repository.absolute_path
+        self.assertTrue(isdir(path))
+        repository.project.delete()
+        self.assertFalse(isdir(path))
+        self.assertFalse(Repository.objects.filter(pk=repository.pk).exists())
+
+    def test_visible(self):
+        repository = mixer.blend('git.repository', is_hidden=False)
+        self.assertTrue(Repository.objects.visible().exists())
+        Repository.objects.filter(pk=repository.pk).update(
+            state=Repository.STATE_CHOICES.deleting)
+        self.assertFalse(Repository.objects.visible().exists())
+        repository.deprovision()
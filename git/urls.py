@@ -15,4 +15,9 @@ urlpatterns = patterns(
         name='new_repository'),
     url(r'^(?P<repository_id>(\d)+)/$',
         views.RepositoryView.as_view(), name='repository'),
+    url(r'^(?P<repository_id>(\d)+)\.git/info/refs$',
+        views.GitInfoRefsView.as_view(), name='http_info_refs'),
+    url(r'^(?P<repository_id>(\d)+)\.git/'
+        r'(?P<service>git-upload-pack|git-receive-pack)$',
+        views.GitServiceView.as_view(), name='http_service'),
 )
@@ -1,12 +1,27 @@
 """ Git views. """
+import os
+import subprocess
+import zlib
+from base64 import b64decode
+from itertools import chain
+from threading import Thread
+
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
-from django.http import Http404
+from django.http import (
+    Http404, HttpResponse, HttpResponseBadRequest, StreamingHttpResponse)
 from django.shortcuts import redirect
-from django.views.generic import TemplateView, ListView, CreateView
-
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
+from django.views.generic import TemplateView, ListView, CreateView, View
+
+from gateway.libs.git.protocol import (
+    PacketLineSplitter, GitReceivePackProcessProtocol)
+from gateway.libs.git.utils import (
+    get_packet_line, get_report, FLUSH_PACKET_LINE)
 from git.forms import RepositoryActionForm, RepositoryCreateForm
-from git.models import Repository
+from git.models import Repository, Authentication
+from git.permissions import has_read_permission, has_push_permission
 from project.views import ProjectBaseView
 
 
@@ -29,8 +44,9 @@ class RepositoryBaseView(ProjectBaseView):
         super(RepositoryBaseView, self).initiate_variables(
             request, args, kwargs)
         try:
-            self.repository = Repository.objects\
-                .get(id=self.kwargs.get("repository_id"))
+            self.repository = Repository.objects.exclude(
+                state=Repository.STATE_CHOICES.deleting
+            ).get(id=self.kwargs.get("repository_id"))
         except Repository.DoesNotExist:
             raise Http404("Repository not found.")
 
@@ -92,7 +108,7 @@ class RepositoryBaseListView(ListView, ProjectBaseView):
 
         """
         return self.project.repository_set.filter(is_hidden=self.hidden_state)\
-            .order_by('name')
+            .exclude(state=Repository.STATE_CHOICES.deleting).order_by('name')
 
     def post(self, request, *args, **kwargs):
         """ Process toggling of repository hidden state.
@@ -189,3 +205,294 @@ class RepositoryCreateView(CreateView, ProjectBaseView):
         return redirect('project:git:repository',
                         **dict(project_id=self.project.id,
                                repository_id=repository.id))
+
+
+# Smart HTTP transport
+
+GIT_HTTP_CHUNK_SIZE = 65536
+
+GIT_HTTP_SERVICES = ('git-upload-pack', 'git-receive-pack')
+
+
+def iterate_request_body(request):
+    """ Read request body by chunks, decompress if needed.
+
+    Git sends bodies over `http.postBuffer` with chunked transfer encoding
+    and no content length, which Django reads as empty. They are read from
+    the WSGI input, the server decodes the chunks.
+
+    :return generator:
+
+    """
+    stream = request
+    if not request.META.get('CONTENT_LENGTH'):
+        stream = request.META['wsgi.input']
+    decompressor = None
+    if request.META.get('HTTP_CONTENT_ENCODING') in ('gzip', 'x-gzip'):
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    while True:
+        chunk = stream.read(GIT_HTTP_CHUNK_SIZE)
+        if not chunk:
+            break
+        yield decompressor.decompress(chunk) if decompressor else chunk
+    if decompressor:
+        yield decompressor.flush()
+
+
+def run_git_service(service, path, body):
+    """ Run git service stateless process.
+
+    The body is written to the process by a separate thread, so output is
+    streamed while input is still being received.
+
+    :param service: `git-upload-pack` or `git-receive-pack`
+    :param path: path to repository
+    :param body: iterable of input chunks
+    :return generator: output chunks
+
+    """
+    process = subprocess.Popen(
+        ('git', service[4:], '--stateless-rpc', path),
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def feed():
+        try:
+            for chunk in body:
+                process.stdin.write(chunk)
+        except IOError:  # process exited before reading all input
+            pass
+        finally:
+            process.stdin.close()
+
+    feeder = Thread(target=feed)
+    feeder.daemon = True
+    feeder.start()
+
+    try:
+        while True:
+            chunk = os.read(process.stdout.fileno(), GIT_HTTP_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        process.stdout.close()
+        process.wait()
+        feeder.join()
+
+
+def get_no_cache_headers(response):
+    """ Disable caching of response.
+
+    :return HttpResponse:
+
+    """
+    response['Expires'] = 'Fri, 01 Jan 1980 00:00:00 GMT'
+    response['Pragma'] = 'no-cache'
+    response['Cache-Control'] = 'no-cache, max-age=0, must-revalidate'
+    return response
+
+
+class GitHttpBaseView(View):
+
+    """ Base view for smart HTTP git transport.
+
+    Clients use HTTP basic authentication with token of an authentication
+    key as password, the same permissions as for SSH are applied.
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.repository = None
+        self.user = None
+        self.deploy_project = None
+        super(GitHttpBaseView, self).__init__(*args, **kwargs)
+
+    @method_decorator(csrf_exempt)
+    def dispatch(self, request, *args, **kwargs):
+        """ Load repository and credentials.
+
+        :return HttpResponse:
+
+        """
+        try:
+            self.repository = Repository.objects.select_related(
+                'project').get(
+                    id=kwargs.get('repository_id'),
+                    project_id=kwargs.get('project_id'),
+                    state=Repository.STATE_CHOICES.ready)
+        except Repository.DoesNotExist:
+            raise Http404("Repository not found.")
+        if not self.authenticate(request):
+            return self.get_unauthorized_response()
+        return super(GitHttpBaseView, self).dispatch(request, *args, **kwargs)
+
+    def authenticate(self, request):
+        """ Parse basic authentication header.
+
+        Deployment tokens are accepted with any username, user tokens
+        must be used with the username of the key owner.
+
+        :return bool: False if credentials are invalid
+
+        """
+        header = request.META.get('HTTP_AUTHORIZATION')
+        if not header:
+            return True  # anonymous
+        try:
+            method, credentials = header.split(' ', 1)
+            username, token = b64decode(credentials).split(':', 1)
+        except (ValueError, TypeError):
+            return False
+        if method.lower() != 'basic' or not token:
+            return False
+        try:
+            key = Authentication.objects.select_related(
+                'user', 'project').get(token=token)
+        except (Authentication.DoesNotExist,
+                Authentication.MultipleObjectsReturned):
+            return False
+        if key.project_id:
+            self.deploy_project = key.project
+        elif key.user_id and key.user.username == username:
+            self.user = key.user
+        return bool(self.user or self.deploy_project)
+
+    @property
+    def is_anonymous(self):
+        """ Check whether credentials were not provided.
+
+        :return bool:
+
+        """
+        return self.user is None and self.deploy_project is None
+
+    @staticmethod
+    def get_unauthorized_response():
+        """ Ask client for credentials.
+
+        :return HttpResponse:
+
+        """
+        response = HttpResponse('Authentication required.', status=401)
+        response['WWW-Authenticate'] = 'Basic realm="Joltem"'
+        return response
+
+    def check_service(self, service):
+        """ Check permissions to run git service.
+
+        :return HttpResponse: Error response or None if allowed
+
+        """
+        if service not in GIT_HTTP_SERVICES:
+            return HttpResponse('Service not supported.', status=403)
+        if service == 'git-receive-pack' and self.is_anonymous:
+            return self.get_unauthorized_response()
+        if not has_read_permission(self.repository, user=self.user,
+                                   deploy_project=self.deploy_project):
+            if self.is_anonymous:
+                return self.get_unauthorized_response()
+            return HttpResponse('Access denied.', status=403)
+
+
+class GitInfoRefsView(GitHttpBaseView):
+
+    """ Advertise references of repository. """
+
+    def get(self, request, *args, **kwargs):
+        """ Stream references advertisement.
+
+        :return HttpResponse:
+
+        """
+        service = request.GET.get('service')
+        response = self.check_service(service)
+        if response is not None:
+            return response
+        process = subprocess.Popen(
+            ('git', service[4:], '--stateless-rpc', '--advertise-refs',
+             self.repository.absolute_path),
+            stdout=subprocess.PIPE)
+        advertisement = process.communicate()[0]
+        response = HttpResponse(
+            get_packet_line('# service=%s\n' % service) +
+            FLUSH_PACKET_LINE + advertisement,
+            content_type='application/x-%s-advertisement' % service)
+        return get_no_cache_headers(response)
+
+
+class GitServiceView(GitHttpBaseView):
+
+    """ Run git service on request body and stream the result. """
+
+    def post(self, request, *args, **kwargs):
+        """ Stream git service result.
+
+        :return HttpResponse:
+
+        """
+        service = kwargs.get('service')
+        response = self.check_service(service)
+        if response is not None:
+            return response
+        body = iterate_request_body(request)
+        content_type = 'application/x-%s-result' % service
+        if service == 'git-receive-pack':
+            try:
+                head, command_statuses, rejected = \
+                    self.read_push_commands(body)
+            except IOError:
+                return HttpResponseBadRequest('Malformed push commands.')
+            if rejected:
+                response = HttpResponse(
+                    get_report(command_statuses) + FLUSH_PACKET_LINE,
+                    content_type=content_type)
+                return get_no_cache_headers(response)
+            body = chain([head], body)
+        response = StreamingHttpResponse(
+            run_git_service(service, self.repository.absolute_path, body),
+            content_type=content_type)
+        return get_no_cache_headers(response)
+
+    def read_push_commands(self, body):
+        """ Read push commands preceding the PACK data and check them.
+
+        The whole push is rejected if any reference is not permitted.
+
+        :return tuple: (read data, list of (reference, status), rejected)
+        :raise IOError: When commands are malformed
+
+        """
+        lines = []
+        flushed = []
+        splitter = PacketLineSplitter(
+            lambda line: lines.append(str(line)),
+            lambda: flushed.append(True))
+        head = bytearray()
+        for chunk in body:
+            head.extend(chunk)
+            splitter.data_received(chunk)
+            if flushed:
+                break
+
+        if not flushed:
+            raise IOError("Push commands are not terminated.")
+
+        command_statuses = []
+        rejected = False
+        for line in lines:
+            parts = line.split('\x00')[0].strip().split(' ')
+            if len(parts) != 3:
+                raise IOError("Push line does not contain 3 parts.")
+            reference = parts[2]
+            if has_push_permission(
+                    self.repository, reference, user=self.user,
+                    deploy_project=self.deploy_project):
+                command_statuses.append((
+                    reference,
+                    GitReceivePackProcessProtocol.OK_PUSH_SEPARATELY))
+            else:
+                rejected = True
+                command_statuses.append((
+                    reference,
+                    GitReceivePackProcessProtocol.PERMISSION_DENIED))
+        return str(head), command_statuses, rejected
@@ -11,5 +11,6 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'joltem.settings.local')
 
 app = Celery('joltem')
 app.config_from_object('django.conf:settings')
-app.autodiscover_tasks(['joltem', 'project', 'solution', 'gateway'],
+app.autodiscover_tasks(['joltem', 'project', 'solution', 'gateway',
+                        'git'],
                        related_name='tasks')
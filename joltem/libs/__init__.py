@@ -14,3 +14,19 @@ def load_model(model_object):
 def load_models(*objs):
     for obj in objs:
         yield load_model(obj)
+
+
+def iterate_chunks(iterable, size):
+    """ Split iterable to lists of the given size, the last may be shorter.
+
+    :return generator:
+
+    """
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
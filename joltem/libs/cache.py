@@ -0,0 +1,82 @@
+""" Cache namespaces invalidated by generations.
+
+Keys of a namespace embed its generation, a counter kept in the cache.
+Bumping the counter invalidates the whole namespace with one atomic
+increment, no keys are scanned or deleted: entries of old generations are
+never read again and expire by their timeout. A lost counter restarts
+from the current time in microseconds, above the generations used before.
+
+"""
+import time
+
+from django.core.cache import cache
+
+GENERATION_CACHE_KEY = '%s:generation'
+GENERATION_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def _get_start():
+    """ Get the first generation of a counter, from the current time.
+
+    :return int:
+
+    """
+    return int(time.time() * 1000000)
+
+
+class Namespace(object):
+
+    """ Keys under a prefix, e.g. `project:1`, invalidated together.
+
+    :param prefix: prefix of the keys and of the generation counter.
+
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+
+    def get_generation(self):
+        """ Get the current generation, start one when lost.
+
+        :return int:
+
+        """
+        key = GENERATION_CACHE_KEY % self.prefix
+        generation = cache.get(key)
+        if generation is None:
+            cache.add(key, _get_start(), GENERATION_CACHE_TIMEOUT)
+            generation = cache.get(key)
+        return generation
+
+    def bump(self):
+        """ Start a new generation, invalidate the cached entries.
+
+        :return int: the new generation
+
+        """
+        key = GENERATION_CACHE_KEY % self.prefix
+        try:
+            return cache.incr(key)
+        except ValueError:
+            cache.add(key, _get_start(), GENERATION_CACHE_TIMEOUT)
+            return cache.get(key)
+
+    def make_key(self, key):
+        """ Make a key of the current generation.
+
+        :return str:
+
+        """
+        return '%s:%s:%s' % (self.prefix, self.get_generation(), key)
+
+
+def get_generations(namespaces):
+    """ Get current generations of namespaces, with one cache read.
+
+    :return list: generation of each namespace
+
+    """
+    keys = [GENERATION_CACHE_KEY % n.prefix for n in namespaces]
+    found = cache.get_many(keys)
+    return [found[key] if key in found else namespace.get_generation()
+            for key, namespace in zip(keys, namespaces)]
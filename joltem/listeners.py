@@ -1,6 +1,7 @@
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_init, post_save, post_delete
 
 from .models import Comment, Notification, Vote
+from .models.utils import TaggedItem
 from .receivers import *
 
 
@@ -10,13 +11,15 @@ post_save.connect(update_solution_metrics_from_comment, sender=Comment)
 
 post_delete.connect(update_solution_metrics_from_comment, sender=Comment)
 
-post_save.connect(update_project_impact_from_voteables, sender=Comment)
+post_save.connect(update_followers_from_comment, sender=Comment)
 
-post_delete.connect(update_project_impact_from_voteables, sender=Comment)
+post_delete.connect(update_followers_from_comment, sender=Comment)
 
 
 # Notification's signals
 # ----------------------
+post_init.connect(remember_notification_state, sender=Notification)
+
 post_save.connect(update_notification_count, sender=Notification)
 
 post_save.connect(
@@ -29,3 +32,11 @@ post_delete.connect(update_notification_count, sender=Notification)
 # ---------------
 post_save.connect(update_voteable_metrics_from_vote, sender=Vote)
 post_delete.connect(update_voteable_metrics_from_vote, sender=Vote)
+post_save.connect(update_followers_from_vote, sender=Vote)
+post_delete.connect(update_followers_from_vote, sender=Vote)
+
+
+# TaggedItem's signals
+# --------------------
+post_save.connect(update_recommendations_from_tag, sender=TaggedItem)
+post_delete.connect(update_recommendations_from_tag, sender=TaggedItem)
@@ -0,0 +1,72 @@
+""" Benchmark ranking of recommended tasks. """
+import random
+import time
+from optparse import make_option
+
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+
+    """ Rank random tasks for random users in memory.
+
+    Popular tags are drawn more often, like the real ones. The database
+    is not used, only the index and the ranking are measured.
+
+    Usage: benchmark_recommendations [--users=N] [--tasks=N] [--tags=N]
+
+    """
+
+    option_list = BaseCommand.option_list + (
+        make_option('--users', type='int', default=100000,
+                    help='Number of users ranked.'),
+        make_option('--tasks', type='int', default=50000,
+                    help='Number of open tasks.'),
+        make_option('--tags', type='int', default=2000,
+                    help='Number of distinct tags.'),
+        make_option('--user-tags', type='int', default=5,
+                    help='Number of tags of each user.'),
+        make_option('--task-tags', type='int', default=3,
+                    help='Number of tags of each task.'),
+        make_option('--private', type='float', default=0.1,
+                    help='Share of tasks in private projects.'),
+        make_option('--limit', type='int', default=50,
+                    help='Number of tasks ranked for each user.'),
+    )
+
+    def handle(self, *args, **options):
+        """ Handle command. """
+        from task.recommendations import TaskIndex, get_weight
+
+        tags = options['tags']
+
+        def draw(count):
+            return set('tag%d' % min(int(random.expovariate(10.0 / tags)),
+                                     tags - 1) for _ in range(count))
+
+        start = time.time()
+        now = timezone.now()
+        index = TaskIndex()
+        for pk in range(options['tasks']):
+            index.add(pk, draw(options['task_tags']), get_weight(
+                random.randint(0, 2),
+                now - timezone.timedelta(days=random.random() * 365)),
+                pk % 100 if random.random() < options['private'] else None)
+        self.stdout.write("%d tasks indexed in %.1f s, %.1f tasks by tag." % (
+            len(index.tasks), time.time() - start,
+            sum(len(p) for p in index.postings.values()) /
+            float(len(index.postings))))
+
+        start = time.time()
+        ranked = 0
+        for i in range(options['users']):
+            ranked += len(index.rank(
+                draw(options['user_tags']), [i % 100], options['limit']))
+            if (i + 1) % 10000 == 0:
+                self.stdout.write("Users: %d/%d" % (i + 1, options['users']))
+        seconds = time.time() - start
+        self.stdout.write(
+            "%d users ranked in %.1f s, %.0f users/s, %.1f tasks each." % (
+                options['users'], seconds, options['users'] / seconds,
+                ranked / float(options['users'] or 1)))
@@ -0,0 +1,71 @@
+""" Store texts of notifications sent before they were precomputed. """
+import time
+from collections import defaultdict
+from optparse import make_option
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import BaseCommand
+
+
+class Command(BaseCommand):
+
+    """ Render notification texts into their kwargs.
+
+    Usage: fill_notification_texts [--all] [--chunk-size=N]
+
+    """
+
+    option_list = BaseCommand.option_list + (
+        make_option('--all', action='store_true', default=False,
+                    help='Render again the texts stored already.'),
+        make_option('--chunk-size', type='int', default=1000,
+                    help='Number of notifications loaded at once.'),
+    )
+
+    def handle(self, *args, **options):
+        """ Handle command. """
+        from joltem.models import Notification
+
+        start = time.time()
+        chunk_size = options['chunk_size']
+        ids = list(Notification.objects.order_by('pk').values_list(
+            'pk', flat=True))
+        filled = missing = 0
+        for offset in range(0, len(ids), chunk_size):
+            notifications = [
+                n for n in Notification.objects.filter(
+                    pk__in=ids[offset:offset + chunk_size])
+                if options['all'] or 'text' not in (n.kwargs or {})]
+            rendered = self.render(notifications)
+            Notification.objects.save_kwargs(rendered)
+            filled += len(rendered)
+            missing += len(notifications) - len(rendered)
+            self.stdout.write("Notifications: %d/%d" % (
+                min(offset + chunk_size, len(ids)), len(ids)))
+        self.stdout.write(
+            "%d texts stored, %d notifications left in %.1f s." % (
+                filled, missing, time.time() - start))
+
+    @staticmethod
+    def render(notifications):
+        """ Render texts with shared queries for each notifying object.
+
+        :return list: notifications with texts
+
+        """
+        groups = defaultdict(lambda: defaultdict(list))
+        for notification in notifications:
+            groups[notification.notifying_type_id][
+                notification.notifying_id].append(notification)
+
+        rendered = []
+        for notifying_type_id, by_id in groups.items():
+            model = ContentType.objects.get_for_id(
+                notifying_type_id).model_class()
+            for pk, notifying in model.objects.select_related().in_bulk(
+                    by_id.keys()).items():
+                group = by_id[pk]
+                notifying.set_notification_texts(group)
+                rendered.extend(
+                    n for n in group if 'text' in (n.kwargs or {}))
+        return rendered
@@ -0,0 +1,81 @@
+""" Generate a voting dataset for benchmarks. """
+import random
+import time
+from optparse import make_option
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+# SQLite limits the number of rows in one insert
+INSERT_BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+
+    """ Create a project with completed solutions and random votes.
+
+    Rows are inserted in bulk, so no signals are sent and metrics are
+    left for `recompute_impact`.
+
+    Usage: generate_votes [--votes=N] [--solutions=N] [--users=N]
+
+    """
+
+    option_list = BaseCommand.option_list + (
+        make_option('--votes', type='int', default=1000000,
+                    help='Number of votes.'),
+        make_option('--solutions', type='int', default=20000,
+                    help='Number of solutions.'),
+        make_option('--users', type='int', default=2000,
+                    help='Number of users, owners and voters.'),
+        make_option('--chunk-size', type='int', default=10000,
+                    help='Number of rows inserted at once.'),
+    )
+
+    def handle(self, *args, **options):
+        """ Handle command. """
+        from joltem.libs import mixer
+        from joltem.models import User, Vote
+        from solution.models import Solution
+
+        start = time.time()
+        chunk_size = options['chunk_size']
+        project = mixer.blend('project.project')
+        prefix = 'votes%d_' % project.pk
+        User.objects.bulk_create([
+            User(username='%s%d' % (prefix, i), email='%s%d@joltem.local' % (
+                prefix, i), impact=random.randint(0, 1000))
+            for i in range(options['users'])], batch_size=INSERT_BATCH_SIZE)
+        users = list(User.objects.filter(
+            username__startswith=prefix).values_list('pk', 'impact'))
+        project.admin_set.add(users[0][0])
+
+        now = timezone.now()
+        Solution.objects.bulk_create([
+            Solution(project=project, owner_id=random.choice(users)[0],
+                     impact=random.randint(1, 100), is_completed=True,
+                     time_completed=now)
+            for _ in range(options['solutions'])],
+            batch_size=INSERT_BATCH_SIZE)
+        solution_ids = list(Solution.objects.filter(
+            project=project).values_list('pk', flat=True))
+        self.stdout.write("%d users and %d solutions created." % (
+            len(users), len(solution_ids)))
+
+        solution_type = ContentType.objects.get_for_model(Solution)
+        for offset in range(0, options['votes'], chunk_size):
+            votes = []
+            for _ in range(min(chunk_size, options['votes'] - offset)):
+                voter_id, voter_impact = random.choice(users)
+                votes.append(Vote(
+                    voter_id=voter_id, voter_impact=voter_impact,
+                    is_accepted=random.random() < 0.7, time_voted=now,
+                    voteable_type=solution_type,
+                    voteable_id=random.choice(solution_ids)))
+            Vote.objects.bulk_create(votes, batch_size=INSERT_BATCH_SIZE)
+            self.stdout.write("Votes: %d/%d" % (
+                offset + len(votes), options['votes']))
+
+        self.stdout.write("Project %d generated in %.1f s." % (
+            project.pk, time.time() - start))
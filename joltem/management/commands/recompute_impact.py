@@ -0,0 +1,214 @@
+""" Rebuild impact metrics from votes. """
+import time
+from collections import defaultdict
+from optparse import make_option
+
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+
+
+class Command(BaseCommand):
+
+    """ Recompute acceptance and contribution of solutions, project impacts
+    and totals of users without sending signals.
+
+    Usage: recompute_impact [--project=ID] [--dry-run] [--chunk-size=N]
+
+    """
+
+    option_list = BaseCommand.option_list + (
+        make_option('--project', type='int', default=None,
+                    help='Recompute only the impacts of the project.'),
+        make_option('--dry-run', action='store_true', default=False,
+                    help='Print the changes without saving them.'),
+        make_option('--chunk-size', type='int', default=1000,
+                    help='Number of solutions loaded at once.'),
+    )
+
+    def handle(self, *args, **options):
+        """ Handle command. """
+        from project.models import Project
+
+        self.dry_run = options['dry_run']
+        self.chunk_size = options['chunk_size']
+        self.project_id = options['project']
+        if self.project_id is not None and not Project.objects.filter(
+                pk=self.project_id).exists():
+            raise CommandError("Project %d does not exist." % self.project_id)
+
+        start = time.time()
+        changed = self.recompute_solutions()
+        changed += self.recompute_impacts()
+        changed += self.recompute_users()
+        self.stdout.write("%d changes %s in %.1f s." % (
+            changed, 'found' if self.dry_run else 'saved',
+            time.time() - start))
+
+    def get_solutions(self):
+        """ Get solutions of the recomputed projects.
+
+        :return QuerySet:
+
+        """
+        from solution.models import Solution
+        solutions = Solution.objects.all()
+        if self.project_id is not None:
+            solutions = solutions.filter(project_id=self.project_id)
+        return solutions
+
+    def report(self, name, pk, field, old, new):
+        """ Print a change in dry run mode. """
+        if self.dry_run:
+            self.stdout.write(
+                "%s %s %s: %s -> %s" % (name, pk, field, old, new))
+
+    def save(self, queryset, changes):
+        """ Update rows in bulk, one query per distinct set of values.
+
+        :param changes: dict of new values by primary key
+        :return int: number of changed rows
+
+        """
+        if self.dry_run or not changes:
+            return len(changes)
+        by_values = defaultdict(list)
+        for pk, values in changes.items():
+            by_values[tuple(sorted(values.items()))].append(pk)
+        with transaction.atomic():
+            for values, pks in by_values.items():
+                queryset.filter(pk__in=pks).update(**dict(values))
+        return len(changes)
+
+    def recompute_solutions(self):
+        """ Recompute acceptance and contribution of solutions in chunks.
+
+        :return int: number of changed solutions
+
+        """
+        solutions = self.get_solutions()
+        ids = list(solutions.order_by('pk').values_list('pk', flat=True))
+        # impact and completed count by (project id, owner id)
+        self.solution_impacts = defaultdict(lambda: [0, 0])
+        changed = 0
+        for offset in range(0, len(ids), self.chunk_size):
+            chunk = ids[offset:offset + self.chunk_size]
+            changes = {}
+            for solution in solutions.model.objects.filter(
+                    pk__in=chunk).with_vote_metrics():
+                old = dict(acceptance=solution.acceptance,
+                           contribution=solution.contribution)
+                new = dict(acceptance=solution.get_acceptance(),
+                           contribution=solution.get_contribution())
+                if new != old:
+                    for field in new:
+                        if new[field] != old[field]:
+                            self.report('solution', solution.pk, field,
+                                        old[field], new[field])
+                    changes[solution.pk] = new
+                if solution.is_completed:
+                    totals = self.solution_impacts[
+                        (solution.project_id, solution.owner_id)]
+                    totals[0] += new['contribution']
+                    totals[1] += 1
+            changed += self.save(solutions.model.objects, changes)
+            self.stdout.write("Solutions: %d/%d" % (
+                offset + len(chunk), len(ids)))
+        return changed
+
+    def get_expected_impacts(self):
+        """ Add the initial impact of admins to the solution impacts.
+
+        :return dict: [impact, completed] by (project id, user id)
+
+        """
+        from project.models import Project
+
+        expected = defaultdict(lambda: [0, 0])
+        for key, totals in self.solution_impacts.items():
+            expected[key] = list(totals)
+        admins = Project.admin_set.through.objects.all()
+        if self.project_id is not None:
+            admins = admins.filter(project_id=self.project_id)
+        for project_id, user_id in admins.values_list('project', 'user'):
+            expected[(project_id, user_id)][0] += 1
+        return expected
+
+    def recompute_impacts(self):
+        """ Recompute project impacts.
+
+        :return int: number of changed or created impacts
+
+        """
+        from project.models import Impact
+
+        self.expected_impacts = expected = self.get_expected_impacts()
+        impacts = Impact.objects.all()
+        if self.project_id is not None:
+            impacts = impacts.filter(project_id=self.project_id)
+
+        changes = {}
+        for pk, project_id, user_id, impact, completed in impacts.values_list(
+                'pk', 'project', 'user', 'impact', 'completed'):
+            new = expected.get((project_id, user_id), [0, 0])
+            expected[(project_id, user_id)] = new
+            if [impact, completed] != new:
+                self.report('impact', '%d:%d' % (project_id, user_id),
+                            'impact, completed', (impact, completed),
+                            tuple(new))
+                changes[pk] = dict(impact=new[0], completed=new[1])
+        changed = self.save(Impact.objects, changes)
+
+        existing = set(impacts.values_list('project', 'user'))
+        missing = [
+            Impact(project_id=project_id, user_id=user_id,
+                   impact=impact, completed=completed)
+            for (project_id, user_id), (impact, completed) in expected.items()
+            if (project_id, user_id) not in existing]
+        for impact in missing:
+            self.report(
+                'impact', '%d:%d' % (impact.project_id, impact.user_id),
+                'impact, completed', None, (impact.impact, impact.completed))
+        if not self.dry_run:
+            Impact.objects.bulk_create(missing)
+        self.stdout.write("Impacts: %d changed, %d created" % (
+            len(changes), len(missing)))
+        return changed + len(missing)
+
+    def recompute_users(self):
+        """ Recompute totals of users from project impacts.
+
+        :return int: number of changed users
+
+        """
+        from joltem.models import User
+        from project.models import Impact
+
+        users = User.objects.all()
+        impacts = Impact.objects.all()
+        if self.project_id is not None:
+            user_ids = set(
+                user_id for (_, user_id) in self.expected_impacts)
+            users = users.filter(pk__in=user_ids)
+            impacts = impacts.filter(user_id__in=user_ids)
+
+        totals = defaultdict(lambda: [0, 0])
+        for project_id, user_id, impact, completed in impacts.values_list(
+                'project', 'user', 'impact', 'completed'):
+            if (project_id, user_id) not in self.expected_impacts:
+                totals[user_id][0] += impact or 0
+                totals[user_id][1] += completed
+        for (_, user_id), (impact, completed) in \
+                self.expected_impacts.items():
+            totals[user_id][0] += impact
+            totals[user_id][1] += completed
+
+        changes = {}
+        for pk, impact, completed in users.values_list(
+                'pk', 'impact', 'completed'):
+            new = totals.get(pk, [0, 0])
+            if [impact, completed] != new:
+                self.report('user', pk, 'impact, completed',
+                            (impact, completed), tuple(new))
+                changes[pk] = dict(impact=new[0], completed=new[1])
+        self.stdout.write("Users: %d changed" % len(changes))
+        return self.save(User.objects, changes)
@@ -0,0 +1,79 @@
+""" Receive and drop emails for load testing. """
+import asyncore
+import random
+import smtpd
+import time
+from optparse import make_option
+
+from django.core.management import BaseCommand
+
+
+class SinkServer(smtpd.SMTPServer):
+
+    """ SMTP server which counts messages and rejects some of them. """
+
+    def __init__(self, localaddr, fail_rate=0, delay=0):
+        smtpd.SMTPServer.__init__(self, localaddr, None)
+        self.fail_rate = fail_rate
+        self.delay = delay
+        self.received = self.rejected = 0
+
+    def process_message(self, peer, mailfrom, rcpttos, data):
+        """ Count the message, reject it with a temporary error by chance.
+
+        :return str: SMTP error or None when accepted
+
+        """
+        if self.delay:
+            time.sleep(self.delay)
+        if random.random() < self.fail_rate:
+            self.rejected += 1
+            return '451 Rejected by the sink'
+        self.received += 1
+
+
+class Command(BaseCommand):
+
+    """ Run a local SMTP server which drops emails and reports the rate.
+
+    Point EMAIL_HOST and EMAIL_PORT to it and queue emails to measure
+    the outbox throughput.
+
+    Usage: smtp_sink [--port=N] [--fail-rate=F] [--delay=S] [--interval=S]
+
+    """
+
+    option_list = BaseCommand.option_list + (
+        make_option('--port', type='int', default=1025,
+                    help='Port to listen on localhost.'),
+        make_option('--fail-rate', type='float', default=0,
+                    help='Share of messages rejected with a temporary error.'),
+        make_option('--delay', type='float', default=0,
+                    help='Seconds to wait before accepting a message.'),
+        make_option('--interval', type='float', default=10,
+                    help='Seconds between reports.'),
+    )
+
+    def handle(self, *args, **options):
+        """ Handle command. """
+        server = SinkServer(('localhost', options['port']),
+                            options['fail_rate'], options['delay'])
+        self.stdout.write("SMTP sink listens on localhost:%d." % (
+            options['port']))
+        received = 0
+        start = last = time.time()
+        try:
+            while True:
+                asyncore.loop(timeout=1, count=1)
+                now = time.time()
+                if now - last >= options['interval']:
+                    self.stdout.write(
+                        "%d received, %d rejected, %.1f emails/s." % (
+                            server.received, server.rejected,
+                            (server.received - received) / (now - last)))
+                    received, last = server.received, now
+        except KeyboardInterrupt:
+            self.stdout.write("%d received, %d rejected in %.1f s." % (
+                server.received, server.rejected, time.time() - start))
+        finally:
+            server.close()
@@ -7,9 +7,12 @@ from django.db import models
 from django.utils import timezone
 from taggit.managers import TaggableManager
 
-from .notifications import Notification, Notifying  # noqa
+from .notifications import (  # noqa
+    Notification, NotificationArchive, Notifying, Follower)
 from .votes import Vote, Voteable  # noqa
 from .comments import Comment, Commentable  # noqa
+from .recompute import RecomputeKey  # noqa
+from .outbox import OutboundEmail  # noqa
 
 from .utils import Choices, TaggedItem
 
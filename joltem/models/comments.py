@@ -9,7 +9,7 @@ from django.contrib.contenttypes import generic, models as content_type_models
 from django.contrib.contenttypes.models import ContentType
 from django.utils import timezone
 
-from .notifications import Notifying
+from .notifications import Notifying, Follower
 from .generic import Owned, ProjectContext, Updatable
 
 logger = logging.getLogger('django')
@@ -75,6 +75,8 @@ class Commentable(Notifying, Owned, ProjectContext):
 
     """ Abstract, an object that can be commented on. """
 
+    follower_reasons = (Follower.REASON_CHOICES.comment,)
+
     # Generic relations
     comment_set = generic.GenericRelation(
         'joltem.Comment', content_type_field='commentable_type',
@@ -117,22 +119,23 @@ class Commentable(Notifying, Owned, ProjectContext):
         :param comment:
 
         """
-        old_followers = self.followers
         comment.delete()
-        new_followers = self.followers
-        unnotify = old_followers.difference(new_followers)
-        if len(new_followers) == 1:
-            unnotify.add(*new_followers)
+        followers = self.followers
+        # Only the owner of the comment may have stopped following
+        unnotify = set([comment.owner]).difference(followers)
+        if len(followers) == 1:
+            unnotify.update(followers)
         for user in unnotify:
             self.delete_notifications(
                 user, settings.NOTIFICATION_TYPES.comment_added)
+        self.update_notification_texts(
+            settings.NOTIFICATION_TYPES.comment_added)
 
     def notify_comment_added(self, comment):
         """ Notify other commentators of comment, and owner of notifying. """
-        for user in self.followers:
-            if user == comment.owner:
-                continue
-            self.notify(user, settings.NOTIFICATION_TYPES.comment_added, True)
+        self.notify_many(
+            self.followers - set([comment.owner]),
+            settings.NOTIFICATION_TYPES.comment_added, True)
 
     def iterate_commentators(self, queryset=None, exclude=None):
         """ Iterate through comments and return distinct commentators.
@@ -146,10 +149,10 @@ class Commentable(Notifying, Owned, ProjectContext):
         if not exclude is None:
             queryset = queryset.exclude(**exclude)
 
-        commentator_ids = []
+        commentator_ids = set()
         for comment in queryset:
             if not comment.owner_id in commentator_ids:
-                commentator_ids.append(comment.owner_id)
+                commentator_ids.add(comment.owner_id)
                 yield comment.owner
 
     def get_commentator_first_names(self, queryset=None, exclude=None):
@@ -160,12 +163,3 @@ class Commentable(Notifying, Owned, ProjectContext):
         """
         return [commentator.first_name for commentator in
                 self.iterate_commentators(queryset=queryset, exclude=exclude)]
-
-    @property
-    def followers(self):
-        """ Get users for notify.
-
-        :returns: A set of commentators.
-
-        """
-        return set(self.iterate_commentators())
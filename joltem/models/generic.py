@@ -4,7 +4,6 @@ import logging
 
 from django.db import models
 from django.core.exceptions import ImproperlyConfigured
-from django.core.cache import cache
 
 logger = logging.getLogger('django')
 
@@ -56,9 +55,9 @@ class ProjectContext(models.Model):
         if self.project_id is None:
             raise ImproperlyConfigured(
                 "Project foreign key field must be set in implementing class.")
-        if hasattr(cache, 'delete_pattern'):
-            cache.delete_pattern('project:%s:*' % self.project_id)
+        from project.models import Project  # avoid circular import
         super(ProjectContext, self).save(**kwargs)
+        Project(pk=self.project_id).cache_namespace.bump()
 
 
 class Updatable(models.Model):
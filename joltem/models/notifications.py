@@ -1,23 +1,41 @@
 """ Joltem notification support. """
 
+import json
 import jsonfield
 import logging
+from collections import Counter, OrderedDict, defaultdict
+
 from django.conf import settings
 from django.contrib.contenttypes import generic, models as content_type_models
 from django.contrib.contenttypes.generic import ContentType
 from django.core import serializers
-from django.core.exceptions import ImproperlyConfigured
-from django.db import models
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, ObjectDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.db.models import F, Q
 from django.db.models.query import QuerySet
+from django.core.urlresolvers import reverse
 from django.utils import timezone
 from model_utils.managers import PassThroughManager
 
+from .. import pubsub
 from ..notifications import get_notify
-from ..tasks import send_immediately_to_user
+from ..tasks import (
+    flush_notifications, send_immediately_to_user, send_immediately_to_users)
+from .utils import Choices
 
 
 logger = logging.getLogger('django')
 
+UNREAD_CACHE_KEY = 'notifications:unread:%s'
+UNREAD_CACHE_TIMEOUT = 60 * 5
+
+COALESCE_CACHE_KEY = 'notifications:coalesce:%d:%d:%s:%%s'
+
+# Pagination cursors count microseconds from the epoch
+CURSOR_EPOCH = timezone.datetime(1970, 1, 1, tzinfo=timezone.utc)
+
 
 class NotificationQuerySet(QuerySet):
 
@@ -29,14 +47,283 @@ class NotificationQuerySet(QuerySet):
         :return Notification:
 
         """
-        notifications = list(self.select_related('user'))
-        self.update(is_cleared=True, time_cleared=timezone.now())
-        for user in set(n.user for n in notifications):
-            user.notifications = user.notification_set.filter(
-                is_cleared=False).count()
-            user.save()
+        unread = self.filter(is_cleared=False)
+        user_ids = list(unread.values_list('user', flat=True))
+        unread.update(is_cleared=True, time_cleared=timezone.now())
+        self.count_unread(user_ids, -1)
         return self
 
+    def keyset_page(self, size, before=None, after=None):
+        """ Get a page of notifications, the newest first.
+
+        The page is sliced by (time_notified, id) of the notification next
+        to it, so the cost does not depend on how deep the page is.
+
+        :param size: number of notifications on the page
+        :param before: cursor of the notification above the page
+        :param after: cursor of the notification below the page
+        :return tuple: (notifications, whether newer exist, older exist)
+
+        """
+        before = self.parse_cursor(before)
+        after = self.parse_cursor(after)
+        if after:
+            time_notified, pk = after
+            queryset = self.filter(
+                Q(time_notified__gt=time_notified) |
+                Q(time_notified=time_notified, pk__gt=pk)
+            ).order_by('time_notified', 'pk')
+        else:
+            queryset = self.order_by('-time_notified', '-pk')
+            if before:
+                time_notified, pk = before
+                queryset = queryset.filter(
+                    Q(time_notified__lt=time_notified) |
+                    Q(time_notified=time_notified, pk__lt=pk))
+
+        notifications = list(queryset[:size + 1])
+        more = len(notifications) > size
+        notifications = notifications[:size]
+        if after:
+            notifications.reverse()
+            return notifications, more, True
+        return notifications, bool(before), more
+
+    @staticmethod
+    def parse_cursor(cursor):
+        """ Parse a cursor made by Notification.cursor.
+
+        :return tuple: (time notified, id) or None if it is invalid
+
+        """
+        try:
+            microseconds, pk = map(int, cursor.split('-'))
+        except (AttributeError, ValueError):
+            return None
+        return CURSOR_EPOCH + timezone.timedelta(
+            microseconds=microseconds), pk
+
+    @staticmethod
+    def prefetch_notifying(notifications):
+        """ Load the notifying objects with one query per content type.
+
+        Only notifications without a stored text need them to render.
+
+        :param notifications: list of notifications
+        :return list: notifications which can be rendered
+
+        """
+        ids = defaultdict(list)
+        for notification in notifications:
+            if 'text' not in (notification.kwargs or {}):
+                ids[notification.notifying_type_id].append(
+                    notification.notifying_id)
+
+        notifying = {}
+        for notifying_type_id, pks in ids.items():
+            model = ContentType.objects.get_for_id(
+                notifying_type_id).model_class()
+            notifying[notifying_type_id] = \
+                model.objects.select_related().in_bulk(pks)
+
+        loaded = []
+        for notification in notifications:
+            if 'text' in (notification.kwargs or {}):
+                loaded.append(notification)
+                continue
+            obj = notifying[notification.notifying_type_id].get(
+                notification.notifying_id)
+            if obj is not None:
+                notification.notifying = obj
+                loaded.append(notification)
+        return loaded
+
+    def bulk_deliver(self, notifications):
+        """ Create notifications at once and count them to their users.
+
+        Signals are not sent, so the users who want to be notified
+        immediately are emailed here, with one task for the batch.
+
+        :param notifications: list of unsaved notifications
+        :return list: notifications
+
+        """
+        from joltem.models import User
+        if not notifications:
+            return notifications
+
+        time_notified = timezone.now()
+        for notification in notifications:
+            notification.time_notified = time_notified
+        self.bulk_create(notifications)
+        user_ids = [n.user_id for n in notifications]
+        self.count_unread(user_ids)
+
+        # Bulk create does not set primary keys, read them back in order
+        created = defaultdict(list)
+        for n in reversed(notifications):
+            created[(n.user_id, n.type, n.notifying_type_id,
+                     n.notifying_id)].append(n)
+        for values in self.filter(
+                user_id__in=set(user_ids), time_notified=time_notified
+        ).order_by('pk').values_list(
+                'pk', 'user', 'type', 'notifying_type', 'notifying_id'):
+            pending = created.get(values[1:])
+            if pending:
+                pending.pop().pk = values[0]
+        self.publish(notifications)
+
+        immediately = set(User.objects.filter(
+            pk__in=set(user_ids), can_contact=True,
+            notify_by_email=User.NOTIFY_CHOICES.immediately
+        ).values_list('pk', flat=True))
+        notification_ids = [
+            n.pk for n in notifications if n.user_id in immediately]
+        if notification_ids:
+            send_immediately_to_users.delay(notification_ids)
+        return notifications
+
+    def renew(self, notifications):
+        """ Mark notifications unread again as if they were just sent.
+
+        :param notifications: list of saved notifications
+        :return list: notifications
+
+        """
+        if not notifications:
+            return notifications
+
+        time_notified = timezone.now()
+        self.save_kwargs(notifications, is_cleared=False, time_cleared=None,
+                         time_notified=time_notified)
+        self.count_unread([n.user_id for n in notifications if n.is_cleared])
+        for notification in notifications:
+            notification.is_cleared = False
+            notification.time_cleared = None
+            notification.time_notified = time_notified
+        self.publish(notifications)
+        return notifications
+
+    @staticmethod
+    def publish(notifications):
+        """ Send summaries of new or renewed notifications to open pages.
+
+        :param notifications: list of saved notifications
+
+        """
+        pubsub.publish([
+            (n.user_id, 'notification', dict(
+                id=n.pk, type=n.type, text=(n.kwargs or {}).get('text'),
+                url=reverse('notification_redirect', args=[n.pk])))
+            for n in notifications])
+
+    def save_kwargs(self, notifications, **fields):
+        """ Save kwargs of notifications, one update per distinct value.
+
+        :param notifications: list of saved notifications
+        :param fields: other values to update
+
+        """
+        pks = defaultdict(list)
+        values = {}
+        for notification in notifications:
+            key = json.dumps(
+                notification.kwargs, cls=DjangoJSONEncoder, sort_keys=True)
+            pks[key].append(notification.pk)
+            values[key] = notification.kwargs
+        for key, group in pks.items():
+            self.filter(pk__in=group).update(kwargs=values[key], **fields)
+
+    def compact(self, time_cleared, archive=True, after=0, size=500):
+        """ Archive or delete a batch of notifications cleared before time.
+
+        The batch is taken by primary key and its rows are locked only
+        while they are moved.
+
+        :param time_cleared: notifications cleared before are compacted
+        :param archive: whether to keep the texts in NotificationArchive
+        :param after: primary key to continue from
+        :param size: number of notifications in the batch
+        :return tuple: (number compacted, the last primary key) or None
+            when nothing is left
+
+        """
+        with transaction.atomic():
+            notifications = list(self.select_for_update().filter(
+                pk__gt=after, is_cleared=True, time_cleared__lt=time_cleared
+            ).order_by('pk')[:size])
+            if not notifications:
+                return None
+            if archive:
+                texts = [(n, self._get_archive_text(n)) for n in notifications]
+                NotificationArchive.objects.bulk_create([
+                    NotificationArchive(
+                        user_id=n.user_id, type=n.type, text=text,
+                        time_notified=n.time_notified,
+                        time_cleared=n.time_cleared,
+                        notifying_type_id=n.notifying_type_id,
+                        notifying_id=n.notifying_id)
+                    for n, text in texts if text is not None])
+            self.filter(pk__in=[n.pk for n in notifications]).delete()
+        return len(notifications), notifications[-1].pk
+
+    @staticmethod
+    def _get_archive_text(notification):
+        """ Get the text to archive, rendered when it was not stored.
+
+        :return str: the text or None when the notifying object is gone
+
+        """
+        if notification.kwargs and 'text' in notification.kwargs:
+            return notification.kwargs['text']
+        if notification.notifying is None:
+            return None
+        return notification.get_text()
+
+    @staticmethod
+    def count_unread(user_ids, step=1):
+        """ Change unread counters, one update per distinct increment.
+
+        :param user_ids: id of the user for each changed notification
+        :param step: 1 for each new unread notification, -1 for each cleared
+
+        """
+        from joltem.models import User
+        by_count = defaultdict(list)
+        for user_id, count in Counter(user_ids).items():
+            by_count[count * step].append(user_id)
+        for count, ids in by_count.items():
+            User.objects.filter(pk__in=ids).update(
+                notifications=F('notifications') + count)
+        NotificationQuerySet.clear_unread_cache(user_ids)
+        pubsub.publish([
+            (user_id, 'unread', dict(delta=count))
+            for count, ids in by_count.items() for user_id in ids])
+
+    @staticmethod
+    def clear_unread_cache(user_ids):
+        """ Forget cached unread counters of the users. """
+        cache.delete_many([UNREAD_CACHE_KEY % pk for pk in set(user_ids)])
+
+    @staticmethod
+    def get_unread_count(user):
+        """ Get unread counter of the user, cached.
+
+        The cache is filled from the database, the loaded user may be
+        older than a change of the counter.
+
+        :return int:
+
+        """
+        from joltem.models import User
+        key = UNREAD_CACHE_KEY % user.pk
+        count = cache.get(key)
+        if count is None:
+            count = User.objects.filter(pk=user.pk).values_list(
+                'notifications', flat=True)[0]
+            cache.set(key, count, UNREAD_CACHE_TIMEOUT)
+        return count
+
 
 class Notification(models.Model):
 
@@ -78,6 +365,18 @@ class Notification(models.Model):
         self.time_cleared = n.time_cleared
         return self
 
+    @property
+    def cursor(self):
+        """ Get pagination cursor of the notification.
+
+        :return str:
+
+        """
+        delta = self.time_notified - CURSOR_EPOCH
+        return '%d-%d' % (
+            (delta.days * 86400 + delta.seconds) * 10 ** 6 +
+            delta.microseconds, self.pk)
+
     def send_mail(self):
         """ Send email to self.user.
 
@@ -87,18 +386,122 @@ class Notification(models.Model):
         return send_immediately_to_user.delay(self.pk)
 
     def get_text(self):
-        """ Get notification text.
+        """ Get notification text, stored when the notification is sent.
 
         :return str:
 
         """
+        if self.kwargs and 'text' in self.kwargs:
+            return self.kwargs['text']
         return self.notifying.get_notification_text(self)
 
 
+class NotificationArchive(models.Model):
+
+    """ Compact copy of a cleared notification removed by retention.
+
+    Only the text is kept, rendered when it was not stored on send.
+    Notifications about deleted objects have no text and are not archived.
+
+    """
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL)
+    type = models.CharField(max_length=200, null=True, blank=True)
+    text = models.TextField(null=True, blank=True)
+    time_notified = models.DateTimeField()
+    time_cleared = models.DateTimeField(null=True, blank=True)
+    time_archived = models.DateTimeField(default=timezone.now)
+    # Generic relations
+    notifying_type = models.ForeignKey(content_type_models.ContentType)
+    notifying_id = models.PositiveIntegerField()
+    notifying = generic.GenericForeignKey('notifying_type', 'notifying_id')
+
+    class Meta:
+        app_label = "joltem"
+
+    def __unicode__(self):
+        return u"%s [%s]" % (self.type, self.user_id)
+
+
+class FollowerQuerySet(QuerySet):
+
+    """ Operations with followers. """
+
+    def follow(self, notifying_type_id, notifying_id, user_id, reason):
+        """ Make user follow notifying for the reason.
+
+        :return Follower:
+
+        """
+        follower, _ = self.get_or_create(
+            notifying_type_id=notifying_type_id, notifying_id=notifying_id,
+            user_id=user_id, reason=reason)
+        return follower
+
+    def unfollow(self, notifying_type_id, notifying_id, user_id, reason):
+        """ Remove the reason for user to follow notifying. """
+        self.filter(
+            notifying_type_id=notifying_type_id, notifying_id=notifying_id,
+            user_id=user_id, reason=reason).delete()
+
+    def get_users(self, notifying, reasons):
+        """ Get users following notifying for any of the reasons.
+
+        :return set:
+
+        """
+        from joltem.models import User
+        return set(User.objects.filter(
+            follower__notifying_type=ContentType.objects.get_for_model(
+                notifying),
+            follower__notifying_id=notifying.pk,
+            follower__reason__in=reasons).distinct())
+
+
+class Follower(models.Model):
+
+    """ User who is notified about a notifying object.
+
+    A user follows an object for each of the reasons, an object's class
+    determines which of them count.
+
+    """
+
+    REASON_CHOICES = Choices(
+        (0, "owner"),
+        (10, "comment"),
+        (20, "vote"),
+    )
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL)
+    reason = models.PositiveSmallIntegerField(choices=REASON_CHOICES)
+    # Generic relations
+    notifying_type = models.ForeignKey(content_type_models.ContentType)
+    notifying_id = models.PositiveIntegerField()
+    notifying = generic.GenericForeignKey('notifying_type', 'notifying_id')
+
+    objects = PassThroughManager.for_queryset_class(FollowerQuerySet)()
+
+    class Meta:
+        app_label = "joltem"
+        unique_together = ['notifying_type', 'notifying_id', 'user', 'reason']
+
+    def __unicode__(self):
+        return u"%s [%s]" % (self.user_id, self.reason)
+
+
 class Notifying(models.Model):
 
     """ Abstract, an object that can produce notifications. """
 
+    # Reasons of the followers to notify, see Follower.REASON_CHOICES
+    follower_reasons = ()
+
+    # Generic relations, followers are deleted with the object
+    follower_set = generic.GenericRelation(
+        'joltem.Follower', content_type_field='notifying_type',
+        object_id_field='notifying_id')
+
     class Meta:
         abstract = True
 
@@ -111,67 +514,121 @@ class Notifying(models.Model):
             type or create a new notification.
         :param kwargs: extra options to pass for rending the notification.
 
-        :returns: A created/updated notification
+        :returns: A created/updated notification, None if held back
 
         """
-        if kwargs is None:
-            kwargs = {}
+        notifications = self.notify_many([user], ntype, update, kwargs)
+        return notifications[0] if notifications else None
 
-        if update:
-            # Attempt to update the latest notifications instead of creating
-            # a new one
-            notifying_type = ContentType.objects.get_for_model(self)
-            notifications = Notification.objects.filter(
-                user_id=user.id,
-                type=ntype,
-                notifying_type_id=notifying_type.id,
-                notifying_id=self.id
-            )
+    def notify_many(self, users, ntype, update=False, kwargs=None):
+        """ Send notification to users at once.
 
-            if notifications.count() > 0:
-                # update latest notification
-                return self.update_notification(notifications[0])
+        The latest notifications of the users are renewed in one query when
+        `update` is set, the missing ones are created in bulk. Repeated
+        updates are coalesced, see `coalesce_notifications`.
 
-        # Just create a new notification
-        return self.create_notification(user, ntype, kwargs)
+        :param users: users to notify.
+        :param ntype: a string that identifies the notification type.
+        :param update: whether to replace previous notification of the same
+            type or create a new notification.
+        :param kwargs: extra options to pass for rending the notification.
 
-    @staticmethod
-    def update_notification(notification):
-        """ Update notification.
+        :returns: A list of created/updated notifications, without the ones
+            held back
 
-        :returns: A updated notification.
+        """
+        users = list(OrderedDict(
+            (user.pk, user) for user in users).values())
+        if update:
+            users, held = self.coalesce_notifications(users, ntype)
+            if held:
+                flush_notifications.apply_async(
+                    (ContentType.objects.get_for_model(self).id, self.pk,
+                     ntype, held),
+                    countdown=settings.NOTIFICATION_COALESCE_SECONDS)
+        if not users:
+            return []
+
+        renewed = {}
+        if update:
+            renewed = self.get_latest_notifications(
+                [user.pk for user in users], ntype)
+
+        notification = Notification(type=ntype, notifying=self)
+        kwargs = self.get_notification_kwargs(notification, **(kwargs or {}))
+        created = [
+            Notification(user=user, type=ntype, notifying=self,
+                         is_cleared=False, kwargs=dict(kwargs))
+            for user in users if user.pk not in renewed]
+        self.set_notification_texts(list(renewed.values()) + created)
+        Notification.objects.renew(list(renewed.values()))
+        Notification.objects.bulk_deliver(created)
+        created = dict((n.user_id, n) for n in created)
+        return [renewed.get(user.pk) or created[user.pk] for user in users]
+
+    def coalesce_notifications(self, users, ntype):
+        """ Hold back repeated notifications of a user within a window.
+
+        The first notification in the window is sent at once. The repeated
+        ones are absorbed and renewed in one flush when the window ends, so
+        a burst of events makes two writes and at most one email.
+
+        :param users: users to notify.
+        :param ntype: a string that identifies the notification type.
+        :returns: A tuple of users to notify now and ids of users to flush
 
         """
+        window = settings.NOTIFICATION_COALESCE_SECONDS
+        if not window:
+            return users, []
+
+        key = self.get_coalesce_cache_key(ntype)
+        send, held = [], []
+        for user in users:
+            if cache.add(key % user.pk, 1, window):
+                send.append(user)
+            elif cache.add((key % user.pk) + ':held', 1, window * 2):
+                held.append(user.pk)
+        return send, held
+
+    def flush_notifications(self, user_ids, ntype):
+        """ Renew the notifications held back by coalesce_notifications.
 
-        notification.is_cleared = False
-        notification.time_cleared = None
-        notification.time_notified = timezone.now()
-        notification.save()
+        :returns: A list of renewed notifications
 
-        return notification
+        """
+        key = self.get_coalesce_cache_key(ntype)
+        cache.delete_many([(key % pk) + ':held' for pk in user_ids])
+        renewed = list(self.get_latest_notifications(
+            user_ids, ntype).values())
+        self.set_notification_texts(renewed)
+        return Notification.objects.renew(renewed)
 
-    def create_notification(self, user, ntype, kwargs=None):
-        """ Create notification.
+    def get_coalesce_cache_key(self, ntype):
+        """ Get coalescing cache key of notifications, formatted by user id.
 
-        :returns: A created notification.
+        :returns: A string
 
         """
-        if kwargs is None:
-            kwargs = {}
+        return COALESCE_CACHE_KEY % (
+            ContentType.objects.get_for_model(self).id, self.pk, ntype)
 
-        # todo add kwargs
-        notification = Notification(
-            user=user,
-            type=ntype,
-            time_notified=timezone.now(),
-            is_cleared=False,
-            notifying=self,
-        )
-        notification.kwargs = self.get_notification_kwargs(
-            notification, **kwargs)
-        notification.save()
+    def get_latest_notifications(self, user_ids, ntype):
+        """ Get the latest notifications of the type to the users.
 
-        return notification
+        :returns: A dict of notifications by user id
+
+        """
+        notifying_type = ContentType.objects.get_for_model(self)
+        latest = {}
+        for notification in Notification.objects.filter(
+                user_id__in=user_ids,
+                type=ntype,
+                notifying_type_id=notifying_type.id,
+                notifying_id=self.id
+        ).order_by('pk'):
+            latest[notification.user_id] = notification
+        return latest
 
     def delete_notifications(self, user, ntype):
         """ Delete all notifications of this type from this notifying to this user. """ # noqa
@@ -183,6 +640,40 @@ class Notifying(models.Model):
             notifying_id=self.id
         ).delete()
 
+    def set_notification_texts(self, notifications):
+        """ Store texts of notifications about self in their kwargs.
+
+        Texts about related objects that no longer exist are left to be
+        rendered on display, other errors are raised.
+
+        :param notifications: list of notifications
+
+        """
+        by_type = defaultdict(list)
+        for notification in notifications:
+            by_type[notification.type].append(notification)
+        for group in by_type.values():
+            try:
+                texts = get_notify(group[0], self).get_texts(group, self)
+            except ObjectDoesNotExist:
+                logger.warning("Can't render %s notifications of %r.",
+                               group[0].type, self, exc_info=True)
+                continue
+            for notification, text in zip(group, texts):
+                notification.kwargs = dict(notification.kwargs or {},
+                                           text=text)
+
+    def update_notification_texts(self, ntype):
+        """ Render again the stored texts of notifications of the type. """
+        notifying_type = ContentType.objects.get_for_model(self)
+        notifications = list(Notification.objects.filter(
+            type=ntype,
+            notifying_type_id=notifying_type.id,
+            notifying_id=self.id
+        ))
+        self.set_notification_texts(notifications)
+        Notification.objects.save_kwargs(notifications)
+
     def get_notification_text(self, notification=None):
         """ Get notification text for a given notification.
 
@@ -203,13 +694,15 @@ class Notifying(models.Model):
             "Extending class must implement get notification url.")
 
     @property
-    def followers(self): # noqa
+    def followers(self):
         """ Get users for notify.
 
         :returns: A set of users.
 
         """
-        return set()
+        if not self.follower_reasons:
+            return set()
+        return Follower.objects.get_users(self, self.follower_reasons)
 
     def get_notification_kwargs(self, notification=None, **kwargs):
         """ Precache notification kwargs.
@@ -0,0 +1,120 @@
+""" Outbox of rendered emails.
+
+Tasks enqueue their messages instead of sending them, and
+`drain_outbox` task sends the queue in batches over one connection,
+retrying failed messages with a growing delay.
+
+"""
+import jsonfield
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMultiAlternatives
+from django.db import models
+from django.db.models.query import QuerySet
+from django.utils import timezone
+from model_utils.managers import PassThroughManager
+
+from ..tasks import drain_outbox
+from .utils import Choices
+
+SCHEDULED_CACHE_KEY = 'outbox:scheduled'
+
+
+class OutboundEmailQuerySet(QuerySet):
+
+    """ Operations with queued emails. """
+
+    def enqueue(self, messages):
+        """ Store messages and schedule draining of the outbox.
+
+        :param messages: list of EmailMultiAlternatives
+        :return list: queued emails
+
+        """
+        emails = [self.model(
+            subject=message.subject, body=message.body,
+            html=dict((mimetype, content) for content, mimetype in getattr(
+                message, 'alternatives', [])).get('text/html', ''),
+            from_email=message.from_email, to=message.to,
+        ) for message in messages]
+        if not emails:
+            return emails
+
+        self.bulk_create(emails)
+        if cache.add(SCHEDULED_CACHE_KEY, 1,
+                     settings.OUTBOX_COUNTDOWN_SECONDS * 10):
+            drain_outbox.apply_async(
+                countdown=settings.OUTBOX_COUNTDOWN_SECONDS)
+        return emails
+
+    def due(self):
+        """ Filter emails to send now, in the order they were queued.
+
+        :return QuerySet:
+
+        """
+        return self.filter(
+            status=self.model.STATUS_CHOICES.queued,
+            time_next_attempt__lte=timezone.now()).order_by('pk')
+
+
+class OutboundEmail(models.Model):
+
+    """ Rendered email waiting to be sent. """
+
+    STATUS_CHOICES = Choices(
+        (0, "queued"),
+        (10, "failed"),
+    )
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html = models.TextField(blank=True)
+    from_email = models.CharField(max_length=255)
+    to = jsonfield.JSONField()
+    status = models.PositiveSmallIntegerField(
+        choices=STATUS_CHOICES, default=STATUS_CHOICES.queued)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    time_queued = models.DateTimeField(default=timezone.now)
+    time_next_attempt = models.DateTimeField(default=timezone.now)
+
+    objects = PassThroughManager.for_queryset_class(OutboundEmailQuerySet)()
+
+    class Meta:
+        app_label = "joltem"
+        index_together = [['status', 'time_next_attempt']]
+
+    def __unicode__(self):
+        return u"%s [%s]" % (self.subject, ', '.join(self.to))
+
+    def get_message(self, connection=None):
+        """ Build the message to send.
+
+        :return EmailMultiAlternatives:
+
+        """
+        message = EmailMultiAlternatives(
+            self.subject, self.body, self.from_email, self.to,
+            connection=connection)
+        if self.html:
+            message.attach_alternative(self.html, "text/html")
+        return message
+
+    def defer(self, error):
+        """ Retry later with an exponential delay, or give up.
+
+        :param error: exception raised on sending
+
+        """
+        self.attempts += 1
+        self.error = repr(error)
+        if self.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+            self.status = self.STATUS_CHOICES.failed
+        else:
+            self.time_next_attempt = timezone.now() + timezone.timedelta(
+                seconds=settings.OUTBOX_RETRY_SECONDS * 2 ** (
+                    self.attempts - 1))
+        type(self).objects.filter(pk=self.pk).update(
+            attempts=self.attempts, error=self.error, status=self.status,
+            time_next_attempt=self.time_next_attempt)
@@ -0,0 +1,88 @@
+""" Queue of stale metrics.
+
+Receivers mark the keys of voteables, project impacts and users whose
+metrics are outdated. A key is stored only once, so a burst of changes
+results in one recompute by `drain_recompute_queue` task.
+
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models, transaction, IntegrityError
+from django.utils import timezone
+
+from ..tasks import drain_recompute_queue
+from .utils import Choices
+
+SCHEDULED_CACHE_KEY = 'recompute:scheduled'
+
+
+class RecomputeKey(models.Model):
+
+    """ Dirty key of stale metrics. """
+
+    KIND_CHOICES = Choices(
+        (0, "voteable"),
+        (10, "impact"),
+        (20, "user"),
+    )
+
+    kind = models.PositiveSmallIntegerField(choices=KIND_CHOICES)
+    # `voteable:<type id>:<id>`, `impact:<project id>:<user id>` or
+    # `user:<id>`
+    key = models.CharField(max_length=100, unique=True)
+    time_marked = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        app_label = "joltem"
+
+    def __unicode__(self):
+        return self.key
+
+    def get_ids(self):
+        """ Parse ids from the key.
+
+        :return list:
+
+        """
+        return [int(part) for part in self.key.split(':')[1:]]
+
+    @classmethod
+    def mark(cls, kind, *ids, **kwargs):
+        """ Mark the key dirty and schedule draining of the queue.
+
+        Key marked again gets a new time, so the drain running meanwhile
+        does not remove it.
+
+        :param kind: one of KIND_CHOICES
+        :param ids: parts of the key
+        :param schedule: whether to schedule draining, default True
+
+        """
+        key = ':'.join([dict(cls.KIND_CHOICES)[kind]] + [str(i) for i in ids])
+        try:
+            with transaction.atomic():
+                cls.objects.create(kind=kind, key=key)
+        except IntegrityError:
+            cls.objects.filter(key=key).update(time_marked=timezone.now())
+
+        if kwargs.get('schedule', True) \
+                and cache.add(SCHEDULED_CACHE_KEY, 1,
+                              settings.RECOMPUTE_COUNTDOWN_SECONDS * 10):
+            drain_recompute_queue.apply_async(
+                countdown=settings.RECOMPUTE_COUNTDOWN_SECONDS)
+
+    @classmethod
+    def mark_voteable(cls, voteable_type_id, voteable_id, **kwargs):
+        """ Mark acceptance and contribution of voteable stale. """
+        cls.mark(cls.KIND_CHOICES.voteable, voteable_type_id, voteable_id,
+                 **kwargs)
+
+    @classmethod
+    def mark_impact(cls, project_id, user_id, **kwargs):
+        """ Mark project impact of user stale. """
+        cls.mark(cls.KIND_CHOICES.impact, project_id, user_id, **kwargs)
+
+    @classmethod
+    def mark_user(cls, user_id, **kwargs):
+        """ Mark impact and completed count of user stale. """
+        cls.mark(cls.KIND_CHOICES.user, user_id, **kwargs)
@@ -1,12 +1,14 @@
 """ Voting related models. """
 
-from django.db import models
+from django.db import models, connection
+from django.db.models.query import QuerySet
 from django.conf import settings
 from django.contrib.contenttypes import generic, models as content_type_models
 from django.contrib.contenttypes.generic import ContentType
 from django.utils import timezone
+from django.utils.datastructures import SortedDict
 
-from .notifications import Notifying
+from .notifications import Notifying, Follower
 from .generic import Owned, ProjectContext
 
 
@@ -43,6 +45,52 @@ class Vote(models.Model):
 VOTEABLE_THRESHOLD = 50  # int between 0-100
 
 
+def get_percentage(accepted_impact, impact):
+    """ Impact-weighted percentage of acceptance.
+
+    :return int: between 0 and 100, None if there is no impact
+
+    """
+    if not impact:
+        return None
+    return int(round(100 * float(accepted_impact) / impact))
+
+
+class VoteableQuerySet(QuerySet):
+
+    """ Queryset of voteable models. """
+
+    def with_vote_metrics(self):
+        """ Annotate sums of valid votes.
+
+        Instances get `vote_accepted_impact`, `vote_impact` and
+        `vote_valid_count` attributes, which are used instead of
+        queries by `get_acceptance` and `valid_vote_count`.
+
+        :return QuerySet:
+
+        """
+        model = self.model
+        voteable_type = ContentType.objects.get_for_model(model)
+        where = """
+            FROM {vote} v WHERE v.voteable_type_id = %s
+            AND v.voteable_id = {voteable}.{pk} AND {valid}
+        """.format(
+            vote=Vote._meta.db_table, voteable=model._meta.db_table,
+            pk=model._meta.pk.column,
+            valid=model.get_valid_vote_condition('v'))
+        select = SortedDict((
+            ('vote_accepted_impact', """(SELECT COALESCE(SUM(
+                CASE WHEN v.is_accepted THEN v.voter_impact ELSE 0 END), 0)
+                %s AND v.voter_impact > 0)""" % where),
+            ('vote_impact', """(SELECT COALESCE(SUM(v.voter_impact), 0)
+                %s AND v.voter_impact > 0)""" % where),
+            ('vote_valid_count', "(SELECT COUNT(*) %s)" % where),
+        ))
+        return self.extra(
+            select=select, select_params=[voteable_type.id] * len(select))
+
+
 class Voteable(Notifying, Owned, ProjectContext):
 
     """ An abstract object, that can be voted on for impact determination.
@@ -67,6 +115,13 @@ class Voteable(Notifying, Owned, ProjectContext):
         'joltem.Vote', content_type_field='voteable_type',
         object_id_field='voteable_id')
 
+    follower_reasons = (
+        Follower.REASON_CHOICES.owner, Follower.REASON_CHOICES.vote)
+
+    # Whether rejection votes count only if the voter has commented,
+    # must agree with `is_vote_valid`
+    rejection_requires_comment = False
+
     class Meta:
         abstract = True
 
@@ -121,12 +176,9 @@ class Voteable(Notifying, Owned, ProjectContext):
 
     def notify_vote_added(self, vote):
         """ Send out notification that vote was added. """
-        for user in self.followers:
-            if user == vote.voter:
-                continue
-
-            self.notify(
-                user, settings.NOTIFICATION_TYPES.vote_added, True)
+        self.notify_many(
+            self.followers - set([vote.voter]),
+            settings.NOTIFICATION_TYPES.vote_added, True)
 
     def notify_vote_updated(self, vote, old_vote_is_accepted):
         """ Send out notification that vote was updated.
@@ -134,12 +186,12 @@ class Voteable(Notifying, Owned, ProjectContext):
         Override in extending class to disable
 
         """
-        for user in self.followers:
-            if user == vote.voter:
-                continue
+        if self.owner_id != vote.voter_id:
             self.notify(
                 self.owner, settings.NOTIFICATION_TYPES.vote_updated, False,
                 {"voter_first_name": vote.voter.first_name})
+        # the latest voters are listed first
+        self.update_notification_texts(settings.NOTIFICATION_TYPES.vote_added)
 
     def iterate_voters(self, queryset=None, exclude=None):
         """ Iterate through votes and return distinct voters.
@@ -153,10 +205,10 @@ class Voteable(Notifying, Owned, ProjectContext):
         if not exclude is None:
             queryset = queryset.exclude(**exclude)
 
-        voter_ids = []
+        voter_ids = set()
         for vote in queryset:
             if not vote.voter_id in voter_ids:
-                voter_ids.append(vote.voter_id)
+                voter_ids.add(vote.voter_id)
                 yield vote.voter
 
     def get_voter_first_names(self, queryset=None, exclude=None):
@@ -174,19 +226,58 @@ class Voteable(Notifying, Owned, ProjectContext):
         Returns a int between 0 and 100.
 
         """
-        votes = self.vote_set.filter(voter_impact__gt=0)
-        impact_sum = 0
-        weighted_sum = 0
-        for vote in votes:
-            if not self.is_vote_valid(vote):
-                continue
-            elif vote.is_accepted:
-                weighted_sum += vote.voter_impact
-            impact_sum += vote.voter_impact
-        if impact_sum == 0:
-            return None
-        else:
-            return int(round(100 * float(weighted_sum) / impact_sum))
+        if hasattr(self, 'vote_impact'):  # see with_vote_metrics
+            return get_percentage(self.vote_accepted_impact, self.vote_impact)
+        return get_percentage(*self.get_vote_impacts())
+
+    def get_vote_impacts(self):
+        """ Sum impacts of valid votes in one query.
+
+        :return tuple: (accepted impact, impact)
+
+        """
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT SUM(CASE WHEN v.is_accepted THEN v.voter_impact ELSE 0 END),
+                   SUM(v.voter_impact)
+            FROM {vote} v
+            WHERE v.voteable_type_id = %s AND v.voteable_id = %s
+            AND v.voter_impact > 0 AND {valid}
+        """.format(vote=Vote._meta.db_table,
+                   valid=self.get_valid_vote_condition('v')), [
+            ContentType.objects.get_for_model(self).id, self.pk])
+        accepted_impact, impact = cursor.fetchone()
+        return accepted_impact or 0, impact or 0
+
+    @property
+    def valid_vote_count(self):
+        """ Return count of valid votes.
+
+        :return int: count of valid votes.
+
+        """
+        if hasattr(self, 'vote_valid_count'):  # see with_vote_metrics
+            return self.vote_valid_count
+        return self.vote_set.extra(where=[self.get_valid_vote_condition(
+            Vote._meta.db_table)]).count()
+
+    @classmethod
+    def get_valid_vote_condition(cls, alias):
+        """ SQL condition matching valid votes.
+
+        :param alias: alias of the vote table
+        :return str:
+
+        """
+        if not cls.rejection_requires_comment:
+            return '1 = 1'
+        from .comments import Comment
+        return """({alias}.is_accepted OR EXISTS (
+            SELECT 1 FROM {comment} c
+            WHERE c.commentable_type_id = {alias}.voteable_type_id
+            AND c.commentable_id = {alias}.voteable_id
+            AND c.owner_id = {alias}.voter_id))""".format(
+            alias=alias, comment=Comment._meta.db_table)
 
     def get_impact(self):
         """ Calculate impact, analogous to value of contribution.
@@ -211,12 +302,3 @@ class Voteable(Notifying, Owned, ProjectContext):
 
         """
         return True
-
-    @property
-    def followers(self):
-        """ Get users for notify.
-
-        :returns: A set of voters.
-
-        """
-        return set(self.iterate_voters()).union(set([self.owner]))
@@ -71,3 +71,14 @@ class _NotifyInterface(object):
     def get_text(self, notifyng=None, user=None):
         """ Get notification text. """
         raise NotImplementedError
+
+    @classmethod
+    def get_texts(cls, notifications, notifying):
+        """ Get texts of notifications about the same notifying.
+
+        Override to share queries between the recipients.
+
+        :returns: A list of texts
+
+        """
+        return [cls(n).get_text(notifying) for n in notifications]
@@ -0,0 +1,168 @@
+""" Publish notification events to the pages open by their users. """
+import json
+import logging
+import threading
+import time
+from Queue import Empty, Queue
+from collections import defaultdict
+
+import redis
+from django.conf import settings
+from django.utils.module_loading import import_by_path
+
+
+logger = logging.getLogger('joltem')
+
+CHANNEL = '%s:notifications:%s'
+
+_backend = None
+
+
+class RedisPubSub(object):
+
+    """ Events are sent through Redis channels, shared by all processes. """
+
+    def __init__(self, location):
+        self.location = location
+        self.client = redis.StrictRedis.from_url(location)
+
+    def publish(self, messages):
+        """ Publish messages in one round trip.
+
+        Events are optional for the pages, so errors are only logged.
+
+        :param messages: list of (channel, data)
+
+        """
+        try:
+            pipeline = self.client.pipeline(transaction=False)
+            for channel, data in messages:
+                pipeline.publish(channel, json.dumps(data))
+            pipeline.execute()
+        except redis.RedisError:
+            logger.warning("Notification events are not published.",
+                           exc_info=True)
+
+    def listen(self, channel, timeout):
+        """ Subscribe to the channel.
+
+        The subscription is made at once, so no message published after
+        the call is lost. Events are optional, when Redis is unavailable
+        no message is received.
+
+        :return generator: messages received within the timeout
+
+        """
+        client = redis.StrictRedis.from_url(
+            self.location, socket_timeout=timeout)
+        pubsub = client.pubsub()
+        try:
+            pubsub.subscribe(channel)
+        except redis.RedisError:
+            logger.warning("Notification events are not received.",
+                           exc_info=True)
+            pubsub.reset()
+            return (message for message in ())
+        return self.iterate(pubsub, time.time() + timeout)
+
+    @staticmethod
+    def iterate(pubsub, deadline):
+        """ Read messages until the deadline or a socket timeout. """
+        try:
+            for message in pubsub.listen():
+                if message['type'] == 'message':
+                    yield json.loads(message['data'])
+                if time.time() >= deadline:
+                    break
+        except redis.ConnectionError:
+            return
+        finally:
+            pubsub.reset()
+
+
+class LocalPubSub(object):
+
+    """ Events are sent through queues of the current process, for tests. """
+
+    def __init__(self, location=None):
+        self.lock = threading.Lock()
+        self.queues = defaultdict(list)
+
+    def publish(self, messages):
+        """ Put messages to the queues of the listeners.
+
+        :param messages: list of (channel, data)
+
+        """
+        with self.lock:
+            for channel, data in messages:
+                for queue in self.queues[channel]:
+                    queue.put(json.loads(json.dumps(data)))
+
+    def listen(self, channel, timeout):
+        """ Subscribe to the channel.
+
+        :return generator: messages received within the timeout
+
+        """
+        queue = Queue()
+        with self.lock:
+            self.queues[channel].append(queue)
+        return self.iterate(channel, queue, time.time() + timeout)
+
+    def iterate(self, channel, queue, deadline):
+        """ Read messages until the deadline, queued ones are read anyway. """
+        try:
+            while True:
+                try:
+                    yield queue.get(timeout=max(deadline - time.time(), 0))
+                except Empty:
+                    break
+        finally:
+            with self.lock:
+                self.queues[channel].remove(queue)
+
+
+def get_backend():
+    """ Get the backend set by NOTIFICATION_PUBSUB, created once.
+
+    :return RedisPubSub|LocalPubSub:
+
+    """
+    global _backend
+    if _backend is None:
+        options = settings.NOTIFICATION_PUBSUB
+        _backend = import_by_path(options['BACKEND'])(
+            options.get('LOCATION'))
+    return _backend
+
+
+def get_channel(user_id):
+    """ Get channel of the events sent to the user.
+
+    :return str:
+
+    """
+    return CHANNEL % (settings.NOTIFICATION_PUBSUB['PREFIX'], user_id)
+
+
+def publish(events):
+    """ Send events to the users.
+
+    :param events: list of (user id, event name, data)
+
+    """
+    if events:
+        get_backend().publish([
+            (get_channel(user_id), dict(data, event=event))
+            for user_id, event, data in events])
+
+
+def listen(user_id, timeout):
+    """ Listen to the events sent to the user.
+
+    :return generator: (event name, data) received within the timeout
+
+    """
+    messages = get_backend().listen(get_channel(user_id), timeout)
+    return ((data.pop('event'), data) for data in messages)
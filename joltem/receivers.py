@@ -5,60 +5,136 @@ from django.db.models.signals import post_save
 
 
 def update_solution_metrics_from_comment(sender, **kwargs):
-    """ Update vote metrics for a solution when it's comment is updated.
+    """ Mark vote metrics of a solution stale when it's comment is updated.
 
     Because a rejected vote's validity depends on whether there is a comment.
 
     """
-    from solution.models import Solution  # avoid circular import
+    from joltem.models import RecomputeKey  # avoid circular import
+    from solution.models import Solution
     comment = kwargs.get('instance')
     solution_type = ContentType.objects.get_for_model(Solution)
     # todo check that comment is part of the commentable comment_set and not
     # outside of it
     if comment and comment.commentable_id \
             and comment.commentable_type_id == solution_type.id:
-        solution = comment.commentable
-        solution.acceptance = solution.get_acceptance()
-        Solution.objects.filter(pk=solution.pk).update(
-            acceptance=solution.acceptance)
-        post_save.send(Solution, instance=solution)
+        RecomputeKey.mark_voteable(solution_type.id, comment.commentable_id)
 
 
 def update_voteable_metrics_from_vote(sender, **kwargs):
-    """ Update vote metrics (acceptance and impact) and save to DB. """
+    """ Mark vote metrics (acceptance and impact) of voteable stale. """
+    from joltem.models import RecomputeKey  # avoid circular import
     vote = kwargs.get('instance')
-    if vote and vote.voteable:
-        voteable = vote.voteable
-        voteable.acceptance = voteable.get_acceptance()
-        type(voteable).objects.filter(pk=voteable.pk).update(
-            acceptance=voteable.acceptance)
-        post_save.send(type(voteable), instance=voteable)
+    if vote and vote.voteable_id:
+        RecomputeKey.mark_voteable(vote.voteable_type_id, vote.voteable_id)
 
 
 def update_project_impact_from_voteables(sender, **kwargs):
-    """ Update project specific impact due to vote on voteable. """
-    from project.models import Impact  # avoid circular import
-
+    """ Mark contribution of saved voteable to project impact stale. """
+    from joltem.models import RecomputeKey  # avoid circular import
     voteable = kwargs.get('instance')
     if voteable:
-        (project_impact, _) = Impact.objects.get_or_create(
-            project_id=voteable.project_id,
-            user_id=voteable.owner_id
-        )
-        project_impact.impact = project_impact.get_impact()
-        project_impact.completed = project_impact.get_completed()
-        project_impact.save()
+        RecomputeKey.mark_voteable(
+            ContentType.objects.get_for_model(voteable).id, voteable.pk)
 
 
-def update_notification_count(sender, **kwargs):
-    """ Update notification count (excluding cleared) for the user. """
-    from joltem.models import User
-    notification = kwargs.get('instance')
-    # Reload user otherwise, the instance send by the signal
-    # may be outdated already
-    user = User.objects.get(id=notification.user_id)
-    user.notifications = user.notification_set.filter(is_cleared=False).count()
-    user.save()
+def update_project_impact_from_deleted_voteables(sender, **kwargs):
+    """ Mark project impact of deleted voteable's owner stale.
+
+    Project impact is recomputed from the stored contributions of remaining
+    voteables, because votes of the voteable may be deleted before or
+    after it.
+
+    """
+    from joltem.models import RecomputeKey  # avoid circular import
+    voteable = kwargs.get('instance')
+    if voteable:
+        RecomputeKey.mark_impact(voteable.project_id, voteable.owner_id)
+
+
+def update_followers_from_comment(sender, instance=None, **kwargs):
+    """ Make commentator follow the commentable until his last comment. """
+    from joltem.models import Comment, Follower  # avoid circular import
+    comment = instance
+    if comment and comment.commentable_id:
+        args = (comment.commentable_type_id, comment.commentable_id,
+                comment.owner_id, Follower.REASON_CHOICES.comment)
+        if Comment.objects.filter(
+                commentable_type_id=comment.commentable_type_id,
+                commentable_id=comment.commentable_id,
+                owner_id=comment.owner_id).exists():
+            Follower.objects.follow(*args)
+        else:
+            Follower.objects.unfollow(*args)
+
+
+def update_followers_from_vote(sender, instance=None, **kwargs):
+    """ Make voter follow the voteable while his vote exists. """
+    from joltem.models import Follower  # avoid circular import
+    vote = instance
+    if vote and vote.voteable_id:
+        args = (vote.voteable_type_id, vote.voteable_id, vote.voter_id,
+                Follower.REASON_CHOICES.vote)
+        if sender.objects.filter(
+                voteable_type_id=vote.voteable_type_id,
+                voteable_id=vote.voteable_id,
+                voter_id=vote.voter_id).exists():
+            Follower.objects.follow(*args)
+        else:
+            Follower.objects.unfollow(*args)
+
+
+def update_followers_from_task_vote(sender, instance=None, **kwargs):
+    """ Make voter follow the reviewed task while his vote exists. """
+    from joltem.models import Follower  # avoid circular import
+    from task.models import Task
+    vote = instance
+    if vote and vote.task_id:
+        args = (ContentType.objects.get_for_model(Task).id, vote.task_id,
+                vote.voter_id, Follower.REASON_CHOICES.vote)
+        if sender.objects.filter(
+                task_id=vote.task_id, voter_id=vote.voter_id).exists():
+            Follower.objects.follow(*args)
+        else:
+            Follower.objects.unfollow(*args)
+
+
+def update_followers_from_owned(sender, instance=None, **kwargs):
+    """ Make the current owner follow the saved object. """
+    from joltem.models import Follower  # avoid circular import
+    if instance:
+        notifying_type = ContentType.objects.get_for_model(instance)
+        Follower.objects.filter(
+            notifying_type=notifying_type, notifying_id=instance.pk,
+            reason=Follower.REASON_CHOICES.owner
+        ).exclude(user_id=instance.owner_id).delete()
+        Follower.objects.follow(
+            notifying_type.id, instance.pk, instance.owner_id,
+            Follower.REASON_CHOICES.owner)
+
+
+def remember_notification_state(sender, instance=None, **kwargs):
+    """ Remember whether the stored notification is counted as unread. """
+    instance._was_unread = bool(instance.pk) and not instance.is_cleared
+
+
+def update_notification_count(sender, instance=None, created=False,
+                              **kwargs):
+    """ Update notification count (excluding cleared) for the user.
+
+    The counter is changed only when the notification is created unread,
+    cleared, reopened or deleted.
+
+    """
+    was_unread = getattr(instance, '_was_unread', not instance.is_cleared)
+    is_unread = kwargs.get('signal') is post_save and \
+        not instance.is_cleared
+    if created:
+        was_unread = False
+    if is_unread != was_unread:
+        sender.objects.count_unread(
+            [instance.user_id], 1 if is_unread else -1)
+    instance._was_unread = is_unread
 
 
 def immediately_send_email_about_notification(sender, created=False,
@@ -75,3 +151,56 @@ def immediately_send_email_about_notification(sender, created=False,
             or not created:
         return False
     instance.send_mail()
+
+
+def update_recommendations_from_task(sender, instance=None, **kwargs):
+    """ Reindex a saved or deleted task for recommendations. """
+    from task.recommendations import mark_changed
+    mark_changed([instance.pk])
+
+
+def update_recommendations_from_tag(sender, instance=None, **kwargs):
+    """ Reindex a task or forget tasks ranked for a user, tagged or not. """
+    from joltem.models import User
+    from task.models import Task
+    from task.recommendations import forget_user, mark_changed
+    model = ContentType.objects.get_for_id(
+        instance.content_type_id).model_class()
+    if model is Task:
+        mark_changed([instance.object_id], [instance.tag_id])
+    elif model is User:
+        forget_user(instance.object_id)
+
+
+def update_recommendations_from_membership(sender, instance=None,
+                                           action=None, reverse=False,
+                                           pk_set=None, **kwargs):
+    """ Forget tasks ranked for users who joined or left a project. """
+    from task.recommendations import forget_user
+    if reverse:
+        user_ids = [instance.pk]
+    elif action == 'pre_clear':
+        user_ids = sender.objects.filter(project=instance).values_list(
+            'user', flat=True)
+    else:
+        user_ids = pk_set or ()
+    if action in ('post_add', 'post_remove', 'pre_clear'):
+        for user_id in user_ids:
+            forget_user(user_id)
+
+
+def check_project_privacy(sender, instance=None, **kwargs):
+    """ Note if a saved project changes privacy, before the save. """
+    instance._privacy_changed = instance.pk is not None and \
+        sender.objects.filter(pk=instance.pk).exclude(
+            is_private=instance.is_private).exists()
+
+
+def update_recommendations_from_project(sender, instance=None, **kwargs):
+    """ Reindex open tasks of a project which changed privacy. """
+    from task.recommendations import mark_changed
+    if instance.__dict__.pop('_privacy_changed', False):
+        task_ids = list(instance.task_set.filter(
+            is_accepted=True, is_closed=False).values_list('pk', flat=True))
+        if task_ids:
+            mark_changed(task_ids)
@@ -118,6 +118,7 @@ GATEWAY_PORT = 22
 GATEWAY_HOST = 'joltem.com'
 GATEWAY_DIR = op.join(PROJECT_ROOT, 'gateway')
 GATEWAY_REPOSITORIES_DIR = op.join(GATEWAY_DIR, 'repositories')
+GATEWAY_BACKUPS_DIR = op.join(GATEWAY_DIR, 'backups')
 GATEWAY_PRIVATE_KEY_FILE_PATH = op.join(GATEWAY_DIR, 'id_rsa')
 GATEWAY_PUBLIC_KEY_FILE_PATH = op.join(GATEWAY_DIR, 'id_rsa.pub')
 
@@ -125,6 +126,51 @@ GATEWAY_PUBLIC_KEY_FILE_PATH = op.join(GATEWAY_DIR, 'id_rsa.pub')
 BROKER_URL = "redis://localhost:6379/0"
 CELERY_ACCEPT_CONTENT = ['pickle', 'json', 'msgpack', 'yaml']
 
+# Repeated updates of a notification are coalesced within the window
+NOTIFICATION_COALESCE_SECONDS = 30
+
+# Notification events published to open pages
+NOTIFICATION_PUBSUB = {
+    'BACKEND': 'joltem.pubsub.RedisPubSub',
+    'LOCATION': 'redis://localhost:6379/0',
+    'PREFIX': '_'.join((PROJECT_NAME, ENVIRONMENT_NAME)),
+}
+
+# Open pages poll the unread counter every interval, 0 to disable, and get
+# summaries of at most POLL_SIZE new notifications
+NOTIFICATION_POLL_INTERVAL = 60
+NOTIFICATION_POLL_SIZE = 5
+
+# Cleared notifications are archived ('archive') or deleted ('delete') after
+# the retention, in batches with pauses, for a limited time per run
+NOTIFICATION_RETENTION_DAYS = 90
+NOTIFICATION_RETENTION_POLICY = 'archive'
+NOTIFICATION_RETENTION_BATCH_SIZE = 500
+NOTIFICATION_RETENTION_PAUSE_SECONDS = 0.5
+NOTIFICATION_RETENTION_SECONDS = 60 * 10
+
+# Emails are queued and sent in batches over one connection, failed ones
+# are retried after a growing delay. A drain stops after OUTBOX_SECONDS,
+# well before its lock expires, and the next one goes on
+OUTBOX_COUNTDOWN_SECONDS = 1
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_RETRY_SECONDS = 60
+OUTBOX_MAX_ATTEMPTS = 6
+OUTBOX_SECONDS = 60 * 5
+
+# Recommended tasks ranked for each user are cached, newer tasks weigh
+# twice as much as tasks posted a half life earlier
+RECOMMEND_LIMIT = 50
+RECOMMEND_HALF_LIFE_DAYS = 14
+RECOMMEND_CACHE_TIMEOUT = 60 * 60
+
+# Daily digests are rendered and sent by tasks of this many users
+DIGEST_CHUNK_SIZE = 100
+
+# Stale metrics are recomputed in batches shortly after marking
+RECOMPUTE_COUNTDOWN_SECONDS = 5
+RECOMPUTE_BATCH_SIZE = 500
+
 CELERYBEAT_SCHEDULE = {
     'daily-digest': {
         'task': 'joltem.tasks.daily_digest',
@@ -151,6 +197,31 @@ CELERYBEAT_SCHEDULE = {
         'schedule': timedelta(hours=4),
         'args': (),
     },
+    'drain-recompute-queue': {
+        'task': 'joltem.tasks.drain_recompute_queue',
+        'schedule': timedelta(minutes=5),
+        'args': (),
+    },
+    'reconcile-notification-counts': {
+        'task': 'joltem.tasks.reconcile_notification_counts',
+        'schedule': timedelta(hours=1),
+        'args': (),
+    },
+    'drain-outbox': {
+        'task': 'joltem.tasks.drain_outbox',
+        'schedule': timedelta(minutes=1),
+        'args': (),
+    },
+    'compact-notifications': {
+        'task': 'joltem.tasks.compact_notifications',
+        'schedule': crontab(hour=4, minute=0),
+        'args': (),
+    },
+    'backup-repositories': {
+        'task': 'git.tasks.backup_repositories',
+        'schedule': crontab(hour=3, minute=0),
+        'args': (),
+    },
     'send-new-relic-report-gateway': {
         'task': 'gateway.tasks.send_new_relic_report',
         'schedule': timedelta(seconds=NEW_RELIC_REPORT_DURATION),
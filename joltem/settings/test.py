@@ -27,6 +27,19 @@ TEST_RUNNER = 'django_nose.NoseTestSuiteRunner'
 CELERY_ALWAYS_EAGER = True
 CELERY_EAGER_PROPAGATES_EXCEPTIONS = True
 
+# Repository backups are enabled only by the tests which need them
+GATEWAY_BACKUPS_DIR = None
+
+# Notifications are coalesced only by the tests which need it
+NOTIFICATION_COALESCE_SECONDS = 0
+
+# Notification events stay in the process
+NOTIFICATION_PUBSUB = {
+    'BACKEND': 'joltem.pubsub.LocalPubSub',
+    'PREFIX': '_'.join((PROJECT_NAME, ENVIRONMENT_NAME)),
+}
+NOTIFICATION_RETENTION_PAUSE_SECONDS = 0
+
 # Haystack
 HAYSTACK_CONNECTIONS['default']['PATH'] = '/tmp/whoosh'
 
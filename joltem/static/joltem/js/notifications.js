@@ -0,0 +1,46 @@
+/**
+ * Live notification counter.
+ *
+ * Polls the unread counter and updates it in the navigation bar, so the
+ * page does not have to be reloaded to see it. Each poll passes the cursor
+ * of the previous one and gets summaries of the notifications sent since,
+ * the newest is shown as the title of the counter. Updates are tracked to
+ * compare them with the page views.
+ *
+ */
+
+(function ($) {
+    var $counter = $('.notification-counter'),
+        url = $counter.data('poll-url'),
+        interval = $counter.data('poll-interval'),
+        count = parseInt($counter.text(), 10) || 0,
+        cursor = $counter.data('poll-cursor');
+
+    if (!url || !interval) {
+        return;
+    }
+
+    function show(value) {
+        if (value !== count && window.TRACK) {
+            TRACK.notifications.live_update(value > count ? "New" : "Cleared");
+        }
+        count = Math.max(value, 0);
+        $counter.text(count)
+            .toggleClass('notifications-some', count > 0)
+            .toggleClass('notifications-none', count === 0);
+    }
+
+    function poll() {
+        $.getJSON(url, {since: cursor}).done(function (data) {
+            show(data.count);
+            cursor = data.cursor;
+            if (data.notifications.length) {
+                $counter.closest('a').attr('title', data.notifications[0].text);
+            }
+        }).always(function () {
+            setTimeout(poll, interval);
+        });
+    }
+
+    setTimeout(poll, interval);
+})(jQuery);
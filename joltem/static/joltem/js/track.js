@@ -99,5 +99,11 @@ TRACK = {
         edit : function (label){
             TRACK._track_event(this.category, "Edit", label, 0, false);
         }
+    },
+    notifications: {
+        category: "Notifications",
+        live_update : function (label){
+            TRACK._track_event(this.category, "Live Update", label, 0, true);
+        }
     }
 }
\ No newline at end of file
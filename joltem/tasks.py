@@ -1,50 +1,93 @@
 """ Joltem related tasks. """
 from __future__ import absolute_import
 
+import logging
+import time
+from collections import Counter, defaultdict
+
 from celery import group
 from django.conf import settings
-from django.core.mail import send_mail, EmailMultiAlternatives
+from django.core.mail import (
+    send_mail, get_connection, EmailMultiAlternatives)
+from django.db import connection
 from django.db.models import F, Q
 from django.template import Context
 from django.template.loader import get_template
 
 from .celery import app
 
+RECOMPUTE_LOCK_CACHE_KEY = 'recompute:lock'
+RECOMPUTE_LOCK_TIMEOUT = 60 * 10
+
+COMPACT_LOCK_CACHE_KEY = 'notifications:compact:lock'
+
+OUTBOX_LOCK_CACHE_KEY = 'outbox:lock'
+OUTBOX_LOCK_TIMEOUT = 60 * 10
+
+logger = logging.getLogger('joltem')
+
 
 @app.task(ignore_result=True)
 def send_immediately_to_user(notification_id):
     """ Send notification immediately. """
+    send_immediately_to_users([notification_id])
+
+
+@app.task(ignore_result=True)
+def send_immediately_to_users(notification_ids):
+    """ Send notifications immediately. """
     from joltem.models import Notification
-    notification = Notification.objects.select_related('user').get(
-        pk=notification_id)
-    if notification.user.can_contact:
-        subject = "[joltem.com] %s" % notification.type
-        msg = _prepare_msg(
-            subject, 'joltem/emails/immediately.txt',
-            'joltem/emails/immediately.html', dict(
+    templates = (get_template('joltem/emails/immediately.txt'),
+                 get_template('joltem/emails/immediately.html'))
+    _send([
+        _render_msg(
+            "[joltem.com] %s" % notification.type, templates, dict(
                 host=settings.URL,
                 user=notification.user,
                 notification=notification,
             ), [notification.user.email]
         )
-        msg.send()
+        for notification in Notification.objects.select_related(
+            'user').filter(pk__in=notification_ids, user__can_contact=True)
+    ])
+
+
+@app.task(ignore_result=True)
+def flush_notifications(notifying_type_id, notifying_id, ntype, user_ids):
+    """ Renew notifications held back within the coalescing window. """
+    from django.contrib.contenttypes.models import ContentType
+    model = ContentType.objects.get_for_id(notifying_type_id).model_class()
+    notifying = model.objects.filter(pk=notifying_id).first()
+    if notifying is not None:
+        notifying.flush_notifications(user_ids, ntype)
 
 
 @app.task(ignore_result=True)
 def daily_digest():
     """ Send daily digest to users.
 
+    Users with new notifications are selected by one query, streamed in
+    chunks of DIGEST_CHUNK_SIZE, one task for each chunk.
+
     :return celery.group:
 
     """
     from joltem.models import User
-    tasks = []
-    for user in set(User.objects.filter(
-            can_contact=True,
-            time_notified__lt=F('notification__time_notified'),
-            notification__is_cleared=False,
-            notify_by_email=User.NOTIFY_CHOICES.daily)):
-        tasks.append(send_digest_to_user.si(user.id))
+    user_ids = User.objects.filter(
+        can_contact=True,
+        time_notified__lt=F('notification__time_notified'),
+        notification__is_cleared=False,
+        notify_by_email=User.NOTIFY_CHOICES.daily
+    ).values_list('pk', flat=True).order_by('pk').distinct()
+
+    tasks, chunk = [], []
+    for user_id in user_ids.iterator():
+        chunk.append(user_id)
+        if len(chunk) == settings.DIGEST_CHUNK_SIZE:
+            tasks.append(send_digests.si(chunk))
+            chunk = []
+    if chunk:
+        tasks.append(send_digests.si(chunk))
 
     digests = group(tasks)
     return digests.delay()
@@ -57,23 +100,48 @@ def send_digest_to_user(user_id):
     :param user_id:
     :return:
 
+    """
+    send_digests([user_id])
+    return True
+
+
+@app.task(ignore_result=True)
+def send_digests(user_ids):
+    """ Send daily digests to users over one connection.
+
+    Notifications and their targets are loaded in bulk, the templates
+    are compiled once for all users.
+
+    :param user_ids:
+    :return int: number of sent digests
+
     """
     from joltem.models import Notification, User, timezone
     subject = "[joltem.com] Daily digest"
-    user = User.objects.get(pk=user_id)
-    notifies = Notification.objects.select_related('notifying').filter(
-        user=user, is_cleared=False, time_notified__gt=user.time_notified)
-    msg = _prepare_msg(
-        subject, 'joltem/emails/daily.txt', 'joltem/emails/daily.html', dict(
+    users = User.objects.filter(can_contact=True).in_bulk(user_ids)
+    notifications = defaultdict(list)
+    for notification in Notification.objects.prefetch_notifying(list(
+            Notification.objects.filter(
+                user_id__in=user_ids, is_cleared=False,
+                time_notified__gt=F('user__time_notified'),
+            ).order_by('user', 'time_notified', 'pk'))):
+        notifications[notification.user_id].append(notification)
+
+    templates = (get_template('joltem/emails/daily.txt'),
+                 get_template('joltem/emails/daily.html'))
+    users = [users[pk] for pk in notifications if pk in users]
+    messages = [
+        _render_msg(subject, templates, dict(
             host=settings.URL,
             user=user,
-            notifies=notifies,
-        ), [user.email]
-    )
-    msg.send()
-    user.time_notified = timezone.now()
-    user.save()
-    return True
+            notifies=notifications[user.pk],
+        ), [user.email])
+        for user in users]
+    if messages:
+        _send(messages)
+        User.objects.filter(pk__in=[user.pk for user in users]).update(
+            time_notified=timezone.now())
+    return len(messages)
 
 
 @app.task(ignore_result=True)
@@ -117,7 +185,7 @@ def send_meeting_invitation_to_user(user_id):
             user=user
         ), [user.email], from_email=settings.PERSONAL_FROM_EMAIL
     )
-    msg.send()
+    _send([msg])
     user.sent_meeting_invitation = True
     user.save()
     return True
@@ -144,36 +212,84 @@ def _get_distribute_tasks_queryset(user):
         ).distinct()
 
 
+def _get_distribute_index():
+    """ Index open tasks by their tags, once for all users.
+
+    :return tuple: (task ids by tag name, private project id by task id,
+        private project ids by member id)
+
+    """
+    from project.models import Project
+    from task.models import Task
+
+    task_ids = defaultdict(set)
+    private = {}
+    for pk, project_id, is_private, tag in Task.objects.filter(
+            is_accepted=True, is_closed=False, tags__name__isnull=False
+    ).values_list('pk', 'project', 'project__is_private', 'tags__name'):
+        task_ids[tag].add(pk)
+        if is_private:
+            private[pk] = project_id
+
+    members = defaultdict(set)
+    for field in ('invitee_set', 'manager_set', 'admin_set', 'developer_set'):
+        through = getattr(Project, field).through
+        for user_id, project_id in through.objects.filter(
+                project__is_private=True).values_list('user', 'project'):
+            members[user_id].add(project_id)
+    return task_ids, private, members
+
+
 @app.task(ignore_result=True)
 def distribute_tasks():
     """ Prepare and send list of open tasks tagged with same tags as user.
 
+    Tasks of each user are matched in memory by the index of tags, only
+    users with matches get a task.
+
     :return:
 
     """
     from joltem.models import User
+    task_ids, private, members = _get_distribute_index()
+    user_tags = defaultdict(set)
+    for pk, tag in User.objects.filter(
+            can_contact=True, can_distribute_tasks=True,
+            tags__name__isnull=False).values_list('pk', 'tags__name'):
+        user_tags[pk].add(tag)
+
     tasks = []
-    for user in set(User.objects.filter(
-            can_contact=True, can_distribute_tasks=True)):
-        if _get_distribute_tasks_queryset(user).exists():
-            tasks.append(send_distribute_task_to_user.si(user.id))
+    for user_id, tags in user_tags.items():
+        matched = set().union(*(task_ids.get(tag, ()) for tag in tags))
+        matched = [pk for pk in matched
+                   if pk not in private or private[pk] in members[user_id]]
+        if matched:
+            tasks.append(send_distribute_task_to_user.si(
+                user_id, sorted(matched)))
     distributions = group(tasks)
     return distributions.delay()
 
 
 @app.task(ignore_result=True)
-def send_distribute_task_to_user(user_id):
+def send_distribute_task_to_user(user_id, task_ids=None):
     """ Send email to distribute open tasks.
 
     :param user_id:
+    :param task_ids: tasks matched by distribute_tasks, they are matched
+        again when not given
     :return:
 
     """
     from joltem.models import User
+    from task.models import Task
     subject = "Open Tasks"
     user = User.objects.get(pk=user_id)
-    tasks = list(_get_distribute_tasks_queryset(user)\
-        .order_by('-priority', '-time_posted'))
+    if task_ids is None:
+        tasks = _get_distribute_tasks_queryset(user)
+    else:
+        tasks = Task.objects.filter(
+            pk__in=task_ids, is_accepted=True, is_closed=False)
+    tasks = list(tasks.order_by('-priority', '-time_posted'))
     if not tasks:
         return False;
     else:
@@ -187,10 +303,288 @@ def send_distribute_task_to_user(user_id):
                 tasks=tasks,
             ), [user.email], from_email=settings.NOTIFY_FROM_EMAIL
         )
-        msg.send()
+        _send([msg])
         return True
 
 
+@app.task(ignore_result=True)
+def rank_recommended_tasks(user_id):
+    """ Rank recommended tasks of the user, refresh the index first. """
+    from task.recommendations import rank
+    rank(user_id)
+
+
+@app.task(ignore_result=True)
+def drain_recompute_queue():
+    """ Recompute metrics of the keys marked stale.
+
+    Keys are processed in batches by kind. Voteables apply changes of
+    their contributions to impacts, project impacts marked by deletions and
+    admin changes are recomputed and mark users. Only one drain runs at a
+    time, others quit.
+
+    :return int: number of processed keys
+
+    """
+    from django.core.cache import cache
+    from joltem.models import RecomputeKey
+    from joltem.models.recompute import SCHEDULED_CACHE_KEY
+
+    cache.delete(SCHEDULED_CACHE_KEY)
+    if not cache.add(RECOMPUTE_LOCK_CACHE_KEY, 1, RECOMPUTE_LOCK_TIMEOUT):
+        return 0
+
+    recompute = {
+        RecomputeKey.KIND_CHOICES.voteable: _recompute_voteables,
+        RecomputeKey.KIND_CHOICES.impact: _recompute_impacts,
+        RecomputeKey.KIND_CHOICES.user: _recompute_users,
+    }
+    processed = 0
+    try:
+        while True:
+            keys = list(RecomputeKey.objects.order_by(
+                'kind', 'time_marked')[:settings.RECOMPUTE_BATCH_SIZE])
+            if not keys:
+                break
+            keys = [k for k in keys if k.kind == keys[0].kind]
+            recompute[keys[0].kind](keys)
+            # Keys marked again during the recompute are left for the next
+            # batch
+            RecomputeKey.objects.filter(
+                pk__in=[k.pk for k in keys],
+                time_marked__lte=max(k.time_marked for k in keys)).delete()
+            processed += len(keys)
+    finally:
+        cache.delete(RECOMPUTE_LOCK_CACHE_KEY)
+    return processed
+
+
+def _recompute_voteables(keys):
+    """ Update acceptance and contribution of voteables.
+
+    Changes of contributions are applied to impacts by the ledger, see
+    `SolutionQuerySet.update_contributions`, so impacts are not computed
+    again here, only completed counts of the owners. Impacts are computed
+    from scratch by `recompute_impact`, which reports drifts.
+
+    """
+    from django.contrib.contenttypes.models import ContentType
+
+    voteable_ids = defaultdict(list)
+    for key in keys:
+        voteable_type_id, voteable_id = key.get_ids()
+        voteable_ids[voteable_type_id].append(voteable_id)
+
+    for voteable_type_id, ids in voteable_ids.items():
+        model = ContentType.objects.get_for_id(voteable_type_id).model_class()
+        queryset = model.objects.filter(pk__in=ids)
+        for voteable in queryset.with_vote_metrics():
+            acceptance = voteable.get_acceptance()
+            if acceptance != voteable.acceptance:
+                model.objects.filter(pk=voteable.pk).update(
+                    acceptance=acceptance)
+        queryset.update_contributions()
+        _update_completed(set(queryset.values_list('project_id', 'owner_id')))
+
+
+def _update_completed(owners):
+    """ Update completed counts of project impacts and users.
+
+    :param owners: set of (project id, user id)
+
+    """
+    from joltem.models import User
+    from project.models import Impact
+    from solution.models import Solution
+
+    for project_id, user_id in owners:
+        Impact.objects.get_or_create(project_id=project_id, user_id=user_id)
+        Impact.objects.filter(project_id=project_id, user_id=user_id).update(
+            completed=Solution.objects.filter(
+                project_id=project_id, owner_id=user_id, is_completed=True
+            ).count())
+    for user in User.objects.filter(pk__in=set(u for _, u in owners)):
+        User.objects.filter(pk=user.pk).update(completed=user.get_completed())
+
+
+def _recompute_impacts(keys):
+    """ Update project impacts and completed counts. """
+    from joltem.models import RecomputeKey, User
+    from project.models import Impact, Project
+
+    for key in keys:
+        project_id, user_id = key.get_ids()
+        if not Project.objects.filter(pk=project_id).exists() \
+                or not User.objects.filter(pk=user_id).exists():
+            continue
+        (project_impact, _) = Impact.objects.get_or_create(
+            project_id=project_id, user_id=user_id)
+        Impact.objects.filter(pk=project_impact.pk).update(
+            impact=project_impact.get_impact(),
+            completed=project_impact.get_completed())
+        RecomputeKey.mark_user(user_id, schedule=False)
+
+
+def _recompute_users(keys):
+    """ Update impact and completed counts of users. """
+    from joltem.models import User
+
+    users = User.objects.filter(pk__in=[k.get_ids()[0] for k in keys])
+    for user in users:
+        User.objects.filter(pk=user.pk).update(
+            impact=user.get_impact(), completed=user.get_completed())
+
+
+@app.task(ignore_result=True)
+def reconcile_notification_counts():
+    """ Repair unread notification counters that drifted from the rows.
+
+    :return int: number of repaired users
+
+    """
+    from django.db.models import Count
+    from joltem.models import Notification, User
+
+    unread = dict(Notification.objects.filter(is_cleared=False).values_list(
+        'user').annotate(Count('pk')).order_by())
+    changes = defaultdict(list)
+    for pk, count in User.objects.values_list('pk', 'notifications'):
+        if count != unread.get(pk, 0):
+            changes[unread.get(pk, 0)].append(pk)
+    for count, pks in changes.items():
+        User.objects.filter(pk__in=pks).update(notifications=count)
+        Notification.objects.clear_unread_cache(pks)
+    return sum(len(pks) for pks in changes.values())
+
+
+@app.task(ignore_result=True)
+def compact_notifications():
+    """ Archive or delete notifications cleared before the retention.
+
+    Batches of NOTIFICATION_RETENTION_BATCH_SIZE are moved with pauses
+    between them, the job stops after NOTIFICATION_RETENTION_SECONDS and
+    the next run continues. Only one job runs at a time.
+
+    :return dict: compacted count and table sizes before and after
+
+    """
+    from django.core.cache import cache
+    from django.utils import timezone
+    from joltem.models import Notification
+
+    if not cache.add(COMPACT_LOCK_CACHE_KEY, 1,
+                     settings.NOTIFICATION_RETENTION_SECONDS * 2):
+        return None
+
+    archive = settings.NOTIFICATION_RETENTION_POLICY != 'delete'
+    time_cleared = timezone.now() - timezone.timedelta(
+        days=settings.NOTIFICATION_RETENTION_DAYS)
+    before = _get_table_size(Notification)
+    start, compacted, last = time.time(), 0, 0
+    try:
+        while time.time() - start < settings.NOTIFICATION_RETENTION_SECONDS:
+            batch = Notification.objects.compact(
+                time_cleared, archive=archive, after=last,
+                size=settings.NOTIFICATION_RETENTION_BATCH_SIZE)
+            if batch is None:
+                break
+            count, last = batch
+            compacted += count
+            time.sleep(settings.NOTIFICATION_RETENTION_PAUSE_SECONDS)
+    finally:
+        cache.delete(COMPACT_LOCK_CACHE_KEY)
+
+    report = dict(compacted=compacted, before=before,
+                  after=_get_table_size(Notification))
+    logger.info(
+        "%d notifications %s in %.1f s, table size %s -> %s.", compacted,
+        'archived' if archive else 'deleted', time.time() - start,
+        report['before'], report['after'])
+    return report
+
+
+@app.task(ignore_result=True)
+def drain_outbox():
+    """ Send queued emails in batches over one connection.
+
+    A message which fails is deferred alone, and the connection is opened
+    again for the next one. Sent messages are deleted one by one. Only one
+    drain runs at a time, others quit, and it stops after OUTBOX_SECONDS,
+    so the lock does not expire while it runs.
+
+    :return dict: counts of sent, deferred and failed emails and the rate
+
+    """
+    from django.core.cache import cache
+    from joltem.models import OutboundEmail
+    from joltem.models.outbox import SCHEDULED_CACHE_KEY
+
+    cache.delete(SCHEDULED_CACHE_KEY)
+    if not cache.add(OUTBOX_LOCK_CACHE_KEY, 1, OUTBOX_LOCK_TIMEOUT):
+        return None
+
+    start, last = time.time(), 0
+    stats = Counter(sent=0, deferred=0, failed=0)
+    connection = get_connection()
+    deadline = start + settings.OUTBOX_SECONDS
+    try:
+        while time.time() < deadline:
+            emails = list(OutboundEmail.objects.due().filter(
+                pk__gt=last)[:settings.OUTBOX_BATCH_SIZE])
+            if not emails:
+                break
+            last = emails[-1].pk
+            for email in emails:
+                if time.time() >= deadline:
+                    break
+                try:
+                    connection.open()
+                    connection.send_messages([email.get_message()])
+                except Exception as error:
+                    logger.warning("Email %d is not sent: %r", email.pk, error)
+                    connection.close()
+                    email.defer(error)
+                    stats['failed' if email.status ==
+                          OutboundEmail.STATUS_CHOICES.failed
+                          else 'deferred'] += 1
+                else:
+                    OutboundEmail.objects.filter(pk=email.pk).delete()
+                    stats['sent'] += 1
+    finally:
+        connection.close()
+        cache.delete(OUTBOX_LOCK_CACHE_KEY)
+
+    seconds = time.time() - start
+    report = dict(stats, seconds=seconds,
+                  rate=stats['sent'] / seconds if seconds else 0)
+    if sum(stats.values()):
+        logger.info("Outbox: %(sent)d sent, %(deferred)d deferred, "
+                    "%(failed)d failed in %(seconds).1f s, "
+                    "%(rate).1f emails/s.", report)
+    return report
+
+
+def _send(messages):
+    """ Put messages to the outbox. """
+    from joltem.models import OutboundEmail
+    OutboundEmail.objects.enqueue(messages)
+
+
+def _get_table_size(model):
+    """ Get the number of rows and the bytes taken by a table.
+
+    :return tuple: (rows, bytes), bytes are None unless on PostgreSQL
+
+    """
+    size = None
+    if connection.vendor == 'postgresql':
+        cursor = connection.cursor()
+        cursor.execute("SELECT pg_total_relation_size(%s)",
+                       [model._meta.db_table])
+        size = cursor.fetchone()[0]
+    return model.objects.count(), size
+
+
 def _prepare_msg(
         subject, txt_template, html_template, context, to_emails,
         from_email=settings.NOTIFY_FROM_EMAIL):
@@ -206,9 +600,25 @@ def _prepare_msg(
 
     """
 
+    return _render_msg(
+        subject, (get_template(txt_template), get_template(html_template)),
+        context, to_emails, from_email)
+
+
+def _render_msg(
+        subject, templates, context, to_emails,
+        from_email=settings.NOTIFY_FROM_EMAIL):
+    """ Render email message with HTML alternative by compiled templates.
+
+    :param templates: text and HTML templates
+    :return EmailMultiAlternatives: instance of email message.
+
+    """
+
     context = Context(context)
-    txt = get_template(txt_template).render(context)
-    html = get_template(html_template).render(context)
+    txt_template, html_template = templates
+    txt = txt_template.render(context)
+    html = html_template.render(context)
 
     msg = EmailMultiAlternatives(
         subject, txt, from_email, to_emails)
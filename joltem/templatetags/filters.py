@@ -1,6 +1,9 @@
 """ Joltem filters. """
 
 from django import template
+from django.conf import settings
+
+from joltem.models import Notification
 
 register = template.Library()
 
@@ -96,3 +99,23 @@ def btn_warning(actual, expected):
 
     """
     return is_match('btn-warning', actual, expected)
+
+
+@register.filter
+def unread_notifications(user):
+    """ Get unread notification count of the user, cached.
+
+    :return int:
+
+    """
+    return Notification.objects.get_unread_count(user)
+
+
+@register.assignment_tag
+def notification_poll_interval():
+    """ Get milliseconds between polls of the unread counter, 0 if off.
+
+    :return int:
+
+    """
+    return settings.NOTIFICATION_POLL_INTERVAL * 1000
@@ -0,0 +1,36 @@
+""" Test cache namespaces. """
+import time
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from joltem.libs.cache import (
+    Namespace, GENERATION_CACHE_KEY, get_generations)
+
+
+class NamespaceTest(TestCase):
+
+    """ Keys of a namespace change with its generation. """
+
+    def test_bump(self):
+        namespace = Namespace('test:1')
+        key = namespace.make_key('tabs')
+        self.assertEqual(namespace.make_key('tabs'), key)
+        self.assertNotEqual(Namespace('test:2').make_key('tabs'), key)
+
+        namespace.bump()
+        self.assertNotEqual(namespace.make_key('tabs'), key)
+
+    def test_lost(self):
+        namespace = Namespace('test:1')
+        generation = namespace.get_generation()
+        namespace.bump()
+        time.sleep(0.01)
+        cache.delete(GENERATION_CACHE_KEY % 'test:1')
+        self.assertGreater(namespace.get_generation(), generation + 1)
+
+    def test_get_generations(self):
+        first, second = Namespace('test:1'), Namespace('test:2')
+        first.bump()
+        self.assertEqual(get_generations([first, second]), [
+            first.get_generation(), second.get_generation()])
@@ -0,0 +1,93 @@
+""" Test management commands. """
+from StringIO import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from joltem.libs import mixer
+from joltem.models import Notification, User
+from project.models import Impact
+from solution.models import Solution
+
+
+class RecomputeImpactTest(TestCase):
+
+    """ Metrics are restored after being corrupted. """
+
+    def setUp(self):
+        self.project = mixer.blend('project.project')
+        self.admin = mixer.blend('joltem.user')
+        self.project.admin_set.add(self.admin)
+        self.project.save()
+        self.owner = mixer.blend('joltem.user')
+        self.solution = mixer.blend(
+            'solution.solution', project=self.project, owner=self.owner)
+        self.solution.mark_complete(100)
+        self.solution.add_vote(User.objects.get(pk=self.admin.pk), True)
+        self.expected = self.get_metrics()
+        self.assertEqual(self.expected['owner'], (100, 1))
+
+        Solution.objects.update(acceptance=None, contribution=0)
+        Impact.objects.filter(user=self.admin).delete()
+        Impact.objects.update(impact=0, completed=0)
+        User.objects.update(impact=0, completed=0)
+
+    def get_metrics(self):
+        """ Get metrics stored in the database. """
+        solution = Solution.objects.get(pk=self.solution.pk)
+        impact = Impact.objects.get(user=self.owner)
+        admin = User.objects.get(pk=self.admin.pk)
+        owner = User.objects.get(pk=self.owner.pk)
+        return dict(
+            solution=(solution.acceptance, solution.contribution),
+            impact=(impact.impact, impact.completed),
+            admin=(admin.impact, admin.completed),
+            owner=(owner.impact, owner.completed),
+        )
+
+    def test_recompute(self):
+        call_command('recompute_impact', stdout=StringIO())
+        self.assertEqual(self.get_metrics(), self.expected)
+        self.assertEqual(Impact.objects.get(user=self.admin).impact, 1)
+
+    def test_project(self):
+        call_command('recompute_impact', project=mixer.blend(
+            'project.project').pk, stdout=StringIO())
+        self.assertEqual(self.get_metrics()['owner'], (0, 0))
+        call_command(
+            'recompute_impact', project=self.project.pk, stdout=StringIO())
+        self.assertEqual(self.get_metrics(), self.expected)
+
+    def test_dry_run(self):
+        output = StringIO()
+        corrupted = self.get_metrics()
+        call_command('recompute_impact', dry_run=True, stdout=output)
+        self.assertEqual(self.get_metrics(), corrupted)
+        output = output.getvalue()
+        self.assertIn(
+            'solution %d contribution: 0 -> 100' % self.solution.pk, output)
+        self.assertIn('user %d impact, completed: (0, 0) -> (100, 1)' % (
+            self.owner.pk), output)
+        self.assertIn('impact %d:%d impact, completed: None -> (1, 0)' % (
+            self.project.pk, self.admin.pk), output)
+
+
+class FillNotificationTextsTest(TestCase):
+
+    """ Texts are stored for notifications sent without them. """
+
+    def test_fill(self):
+        solution = mixer.blend('solution.solution', title="Old")
+        solution.add_comment(mixer.blend('joltem.user'), "Comment.")
+        [notification] = solution.owner.notification_set.all()
+        text = notification.get_text()
+        del notification.kwargs['text']
+        Notification.objects.save_kwargs([notification])
+        mixer.blend('joltem.notification', notifying=mixer.blend(
+            'task.task'), type='task_posted').notifying.delete()
+
+        output = StringIO()
+        call_command('fill_notification_texts', stdout=output)
+        self.assertIn('1 texts stored, 1 notifications left', output.getvalue())
+        notification = Notification.objects.get(pk=notification.pk)
+        self.assertEqual(notification.kwargs['text'], text)
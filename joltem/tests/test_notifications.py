@@ -4,13 +4,16 @@ import time
 
 from django.contrib.contenttypes.generic import ContentType
 from django.core import mail
+from django.core.cache import cache
 from django.conf import settings
 from django.test import TestCase, testcases
+from django.test.utils import override_settings
+from django.utils import timezone
 
 from ..libs import mixer, load_model
 from ..libs.mock.models import (get_mock_project, get_mock_task,
                                 get_mock_solution, get_mock_user)
-from ..models import User, Notification
+from ..models import User, Notification, Follower
 
 
 class NotificationTestCase(TestCase):
@@ -122,6 +125,99 @@ class CommonNotificationTestCase(BaseNotificationTestCase):
         self.assertEqual(self.bob.notifications, 0)
 
 
+    def test_unread_counter(self):
+        """ Test counter changes on state transitions only. """
+        n = mixer.blend('joltem.notification', user=self.bob)
+        mixer.blend('joltem.notification', user=self.bob, is_cleared=True)
+        self.assertEqual(load_model(self.bob).notifications, 1)
+
+        n.time_notified = timezone.now()
+        n.save()
+        self.assertEqual(load_model(self.bob).notifications, 1)
+
+        n.is_cleared = True
+        n.save()
+        self.assertEqual(load_model(self.bob).notifications, 0)
+
+        n = Notification.objects.get(pk=n.pk)
+        n.is_cleared = False
+        n.save()
+        self.assertEqual(load_model(self.bob).notifications, 1)
+
+        Notification.objects.filter(user=self.bob).delete()
+        self.assertEqual(load_model(self.bob).notifications, 0)
+
+    def test_reconcile_counts(self):
+        """ Test drifted counters are repaired. """
+        from joltem.tasks import reconcile_notification_counts
+        mixer.cycle(2).blend('joltem.notification', user=self.bob)
+        User.objects.filter(pk__in=[self.bob.pk, self.jill.pk]).update(
+            notifications=5)
+        self.assertEqual(reconcile_notification_counts(), 2)
+        self.assertEqual(load_model(self.bob).notifications, 2)
+        self.assertEqual(load_model(self.jill).notifications, 0)
+
+        # Loaded users may be older than their counters
+        self.assertEqual(
+            Notification.objects.get_unread_count(self.bob), 2)
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                Notification.objects.get_unread_count(self.bob), 2)
+        Notification.objects.filter(user=self.bob).mark_cleared()
+        self.assertEqual(
+            Notification.objects.get_unread_count(self.bob), 0)
+
+    @override_settings(NOTIFICATION_RETENTION_BATCH_SIZE=2)
+    def test_compact(self):
+        """ Test old cleared notifications are archived in batches. """
+        from joltem.models import NotificationArchive
+        from joltem.tasks import compact_notifications
+        old = timezone.now() - timezone.timedelta(
+            days=settings.NOTIFICATION_RETENTION_DAYS + 1)
+        mixer.cycle(3).blend(
+            'joltem.notification', user=self.bob, is_cleared=True,
+            time_cleared=old, kwargs=dict(text="Old"))
+        recent = mixer.blend(
+            'joltem.notification', user=self.bob, is_cleared=True,
+            time_cleared=timezone.now())
+        unread = mixer.blend('joltem.notification', user=self.bob)
+
+        report = compact_notifications()
+        self.assertEqual(report['compacted'], 3)
+        self.assertEqual(report['before'][0], 5)
+        self.assertEqual(report['after'][0], 2)
+        self.assertEqual(
+            set(Notification.objects.all()), set([recent, unread]))
+        self.assertEqual(list(NotificationArchive.objects.values_list(
+            'user', 'text')), [(self.bob.pk, "Old")] * 3)
+        self.assertEqual(load_model(self.bob).notifications, 1)
+
+        Notification.objects.filter(pk=recent.pk).update(time_cleared=old)
+        with self.settings(NOTIFICATION_RETENTION_POLICY='delete'):
+            self.assertEqual(compact_notifications()['compacted'], 1)
+        self.assertEqual(NotificationArchive.objects.count(), 3)
+
+    def test_compact_texts(self):
+        """ Test texts not stored on send are rendered for the archive. """
+        from joltem.models import NotificationArchive
+        from joltem.tasks import compact_notifications
+        old = timezone.now() - timezone.timedelta(
+            days=settings.NOTIFICATION_RETENTION_DAYS + 1)
+        task = mixer.blend('task.task', owner=self.bob)
+        gone = mixer.blend('task.task', owner=self.bob)
+        rendered, _ = [mixer.blend(
+            'joltem.notification', user=self.bob, type='comment_added',
+            notifying=notifying, is_cleared=True, time_cleared=old, kwargs={}
+        ) for notifying in (task, gone)]
+        gone.delete()
+
+        self.assertEqual(compact_notifications()['compacted'], 2)
+        self.assertFalse(Notification.objects.exists())
+        self.assertEqual(
+            list(NotificationArchive.objects.values_list('text', flat=True)),
+            [task.get_notification_text(rendered)])
+
+
 class CommentNotificationTestCase(NotificationTestCase):
 
     """ Test comment notifications. """
@@ -168,6 +264,26 @@ class CommentNotificationTestCase(NotificationTestCase):
         self.assertNotificationReceived(
             s.owner, s, settings.NOTIFICATION_TYPES.comment_added,
             'Bill commented on your solution "My Solution"')
+        self.assertEqual(
+            s.owner.notification_set.get().kwargs['text'],
+            'Bill commented on your solution "My Solution"')
+
+    def test_texts_not_rendered(self):
+        """ Test texts about missing objects are left to display. """
+        from task.models import Task
+        task = mixer.blend(Task)
+        Task.objects.filter(pk=task.pk).update(parent=3434)
+        task = load_model(task)
+        notification = Notification(
+            user=task.owner, type=settings.NOTIFICATION_TYPES.task_posted,
+            kwargs=dict(role='parent_solution',
+                        owner=dict(fields=dict(first_name="Bill"))))
+        task.set_notification_texts([notification])
+        self.assertFalse('text' in notification.kwargs)
+
+        notification.type = 'unknown'
+        self.assertRaises(
+            Exception, task.set_notification_texts, [notification])
 
     def test_not_found(self):
         """ Test a notification that is not found.
@@ -183,6 +299,48 @@ class CommentNotificationTestCase(NotificationTestCase):
         self.assertContains(response, "Activity not found")
 
 
+class FollowerTestCase(TestCase):
+
+    """ Test followers stored for owners, commentators and voters. """
+
+    def test_followers(self):
+        s = mixer.blend('solution.solution', is_completed=True)
+        bill = mixer.blend('joltem.user')
+        jill = mixer.blend('joltem.user')
+        self.assertEqual(set(s.followers), {s.owner})
+
+        comment = s.add_comment(bill, "Bill was here.")
+        s.add_vote(jill, True)
+        self.assertEqual(set(s.followers), {s.owner, bill})
+        self.assertEqual(set(s.follower_set.filter(user=jill).values_list(
+            'reason', flat=True)), {Follower.REASON_CHOICES.vote})
+
+        s.delete_comment(comment)
+        self.assertEqual(set(s.followers), {s.owner})
+
+    def test_owner_changed(self):
+        s = mixer.blend('solution.solution')
+        owner = s.owner
+        s.owner = mixer.blend('joltem.user')
+        s.save()
+        self.assertEqual(set(s.followers), {s.owner})
+        self.assertFalse(owner.follower_set.exists())
+
+    def test_deleted(self):
+        from task.models import Task
+        task = mixer.blend(Task)
+        s = mixer.blend('solution.solution', task=task)
+        s.add_vote(mixer.blend('joltem.user'), True)
+        mixer.blend('solution.solution').add_comment(s.owner, "Kept.")
+        self.assertEqual(Follower.objects.count(), 5)
+
+        # Solutions of the task are deleted with it
+        Task.objects.filter(pk=task.pk).delete()
+        self.assertFalse(task.follower_set.exists())
+        self.assertFalse(s.follower_set.exists())
+        self.assertEqual(Follower.objects.count(), 2)
+
+
 class TasksNotificationTestCase(BaseNotificationTestCase):
 
     """ Test task related notifications. """
@@ -536,6 +694,22 @@ class SolutionNotificationTestCase(BaseNotificationTestCase):
             "Bob updated a vote on your solution \"%s\"" %
             solution.default_title, expected_count=2)
 
+    def test_vote_updated_many_followers(self):
+        """ Test owner notified once about vote update. """
+        solution = get_mock_solution(self.project, self.jill,
+                                     title="Cleaning up")
+        ted = get_mock_user("ted", first_name="Ted")
+        solution.add_comment(ted, "Ted was here.")
+        solution.add_comment(
+            get_mock_user("katy", first_name="Katy"), "Katy was here.")
+        solution.put_vote(self.bob, False)
+        solution.put_vote(self.bob, True)
+        self.assertReceivedNotificationCount(
+            self.jill, solution, settings.NOTIFICATION_TYPES.vote_updated,
+            expected_count=1)
+        self.assertNotificationNotReceived(
+            ted, solution, settings.NOTIFICATION_TYPES.vote_updated)
+
     def test_solution_evaluation_changed(self):
         """ Test notification when solution evaluation changes.
 
@@ -622,6 +796,81 @@ class EmailNotificationTestCase(TestCase):
         """ Test immediate message not sent to those can't contact. """
         self._test_immediately(False, can_contact=False)
 
+    def test_bulk_deliver(self):
+        """ Test counters and immediate messages of bulk delivery. """
+        task = mixer.blend('task.task', owner=self.mike)
+        immediate = mixer.blend(
+            User, notify_by_email=User.NOTIFY_CHOICES.immediately)
+        users = [self.mike, self.mike, immediate]
+        Notification.objects.bulk_deliver([
+            Notification(user=user, type='comment_added', notifying=task)
+            for user in users])
+        self.assertEqual(load_model(self.mike).notifications, 2)
+        self.assertEqual(load_model(immediate).notifications, 1)
+        self.assertMessageSent(immediate.email, '[joltem.com] comment_added')
+        self.assertMessageSent(
+            self.mike.email, '[joltem.com] comment_added', False)
+
+    def test_notify_many(self):
+        """ Test renewing and creating notifications at once. """
+        task = mixer.blend('task.task', owner=self.mike)
+        users = [self.mike] + mixer.cycle(3).blend(User)
+        task.notify(self.mike, 'comment_added').mark_cleared()
+
+        with self.assertNumQueries(8):
+            notifications = task.notify_many(
+                users + users[:1], 'comment_added', True)
+        self.assertEqual(
+            [n.user_id for n in notifications], [u.pk for u in users])
+        self.assertEqual(
+            set(n.pk for n in notifications),
+            set(Notification.objects.values_list('pk', flat=True)))
+        for user in users:
+            self.assertEqual(load_model(user).notifications, 1)
+
+        task.notify_many(users, 'comment_added', True)
+        self.assertEqual(Notification.objects.count(), 4)
+        self.assertEqual(load_model(self.mike).notifications, 1)
+
+    def test_notify_many_immediately(self):
+        """ Test one message per new notification. """
+        task = mixer.blend('task.task', owner=self.mike)
+        users = mixer.cycle(2).blend(
+            User, notify_by_email=User.NOTIFY_CHOICES.immediately)
+        task.notify_many(users + [self.mike], 'comment_added', True)
+        task.notify_many(users, 'comment_added', True)
+        self.assertEqual(
+            sorted(m.recipients()[0] for m in mail.outbox),
+            sorted(user.email for user in users))
+
+    @override_settings(NOTIFICATION_COALESCE_SECONDS=60)
+    def test_coalesce(self):
+        """ Test burst of comments makes one email. """
+        task = mixer.blend(
+            'task.task', title="Bug on index page.",
+            owner__notify_by_email=User.NOTIFY_CHOICES.immediately)
+        key = task.get_coalesce_cache_key('comment_added') % task.owner_id
+        self.addCleanup(cache.delete_many, [key, key + ':held'])
+
+        self.assertEqual(
+            task.coalesce_notifications([task.owner], 'comment_added'),
+            ([task.owner], []))
+        self.assertEqual(
+            task.coalesce_notifications([task.owner], 'comment_added'),
+            ([], [task.owner_id]))
+        self.assertEqual(
+            task.coalesce_notifications([task.owner], 'comment_added'),
+            ([], []))
+        cache.delete_many([key, key + ':held'])
+
+        for _ in range(5):
+            task.add_comment(self.mike, "Mike was here.")
+        [notification] = task.owner.notification_set.all()
+        self.assertEqual(notification.get_text(),
+                         '%s commented on your task "%s"' % (
+                             self.mike.first_name, task.title))
+        self.assertEqual(len(mail.outbox), 1)
+
     def _test_digest(self, expected, notify_by_email, can_contact=True):
         """ Test digest receiving based on notification setting.
 
@@ -647,6 +896,24 @@ class EmailNotificationTestCase(TestCase):
             self.assertTrue('/unsubscribe/%s/' % task.owner.username \
                 in m.alternatives[0][0])  # html alternative
 
+    @override_settings(DIGEST_CHUNK_SIZE=2)
+    def test_digest_chunks(self):
+        """ Test digests are sent by chunks of users once. """
+        from joltem.tasks import daily_digest
+        tasks = mixer.cycle(3).blend(
+            'task.task', owner__notify_by_email=User.NOTIFY_CHOICES.daily)
+        for task in tasks:
+            task.add_comment(self.mike, "Mike's comment.")
+            task.add_comment(self.mike, "Mike's second comment.")
+        daily_digest.delay()
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox),
+                         sorted(task.owner.email for task in tasks))
+        self.assertIn(
+            "%s commented" % self.mike.first_name, mail.outbox[0].body)
+
+        daily_digest.delay()
+        self.assertEqual(len(mail.outbox), 3)
+
     def test_digest_positive(self):
         """ Test that users w/ daily setting get digest. """
         self._test_digest(True, User.NOTIFY_CHOICES.daily)
@@ -838,4 +1105,37 @@ class DistributeTaskTest(TestCase):
         user = self._mock_user(tags=('python',))
         task = self._mock_task(is_private=True, tags=('python','django'))
         task.project.developer_set.add(user)
-        self._test_distribute_task(True, user=user, make_task=False)
\ No newline at end of file
+        self._test_distribute_task(True, user=user, make_task=False)
+
+    def test_index(self):
+        """ Test tasks are indexed by tags with private memberships. """
+        from joltem.tasks import _get_distribute_index
+        public = self._mock_task(tags=('python', 'django'))
+        secret = self._mock_task(is_private=True, tags=('python',))
+        self._mock_task(is_closed=True, tags=('python',))
+        member = self._mock_user()
+        secret.project.developer_set.add(member)
+
+        with self.assertNumQueries(5):
+            task_ids, private, members = _get_distribute_index()
+        self.assertEqual(dict(task_ids), dict(
+            python=set([public.pk, secret.pk]), django=set([public.pk])))
+        self.assertEqual(private, {secret.pk: secret.project_id})
+        self.assertEqual(dict(members), {member.pk: set([secret.project_id])})
+
+    def test_index_distribute(self):
+        """ Test users get indexed tasks of their tags and memberships. """
+        from joltem.tasks import distribute_tasks
+        self._mock_task(tags=('python', 'django'))
+        secret = self._mock_task(is_private=True, tags=('python',))
+        self._mock_task(is_closed=True, tags=('python',))
+        member = self._mock_user()
+        secret.project.developer_set.add(member)
+        self._mock_user(tags=('django', 'python'))
+
+        distribute_tasks.delay()
+        self.assertEqual(len(mail.outbox), 2)
+        counts = dict((m.to[0], m.body.count("Email distribution email"))
+                      for m in mail.outbox)
+        self.assertEqual(counts[member.email], 2)
+        self.assertEqual(sorted(counts.values()), [1, 2])
@@ -0,0 +1,113 @@
+""" Test delivery of queued emails. """
+import asyncore
+import threading
+
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail import EmailMultiAlternatives
+from django.core.mail.backends.locmem import EmailBackend
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from joltem.management.commands.smtp_sink import SinkServer
+from joltem.models import OutboundEmail
+from joltem.tasks import drain_outbox, OUTBOX_LOCK_CACHE_KEY
+
+
+class FailingBackend(EmailBackend):
+
+    """ Fail to send messages to the failing addresses. """
+
+    def send_messages(self, messages):
+        for message in messages:
+            if 'fail@joltem.local' in message.to:
+                raise IOError("Connection reset.")
+        return super(FailingBackend, self).send_messages(messages)
+
+
+def get_messages(*recipients):
+    """ Make messages with HTML alternatives. """
+    messages = []
+    for to in recipients:
+        message = EmailMultiAlternatives(
+            "Subject", "Text.", 'support@joltem.local', [to])
+        message.attach_alternative("<p>Text.</p>", "text/html")
+        messages.append(message)
+    return messages
+
+
+class OutboxTest(TestCase):
+
+    """ Emails are queued and sent in batches. """
+
+    def setUp(self):
+        cache.add(OUTBOX_LOCK_CACHE_KEY, 1)
+
+    def tearDown(self):
+        cache.delete(OUTBOX_LOCK_CACHE_KEY)
+
+    @override_settings(OUTBOX_BATCH_SIZE=2)
+    def test_drain(self):
+        OutboundEmail.objects.enqueue(get_messages(
+            'a@joltem.local', 'b@joltem.local', 'c@joltem.local'))
+        self.assertEqual(OutboundEmail.objects.count(), 3)
+        self.assertFalse(mail.outbox)
+
+        cache.delete(OUTBOX_LOCK_CACHE_KEY)
+        report = drain_outbox()
+        self.assertEqual(report['sent'], 3)
+        self.assertFalse(OutboundEmail.objects.exists())
+        self.assertEqual([m.to for m in mail.outbox], [
+            ['a@joltem.local'], ['b@joltem.local'], ['c@joltem.local']])
+        self.assertEqual(mail.outbox[0].alternatives,
+                         [("<p>Text.</p>", "text/html")])
+
+    def test_deadline(self):
+        """ Drains stop in time, the next one sends the rest. """
+        OutboundEmail.objects.enqueue(get_messages('a@joltem.local'))
+        cache.delete(OUTBOX_LOCK_CACHE_KEY)
+        with self.settings(OUTBOX_SECONDS=0):
+            self.assertEqual(drain_outbox()['sent'], 0)
+        self.assertEqual(OutboundEmail.objects.count(), 1)
+        self.assertEqual(drain_outbox()['sent'], 1)
+        self.assertFalse(OutboundEmail.objects.exists())
+
+    @override_settings(
+        EMAIL_BACKEND='joltem.tests.test_outbox.FailingBackend',
+        OUTBOX_MAX_ATTEMPTS=2)
+    def test_retry(self):
+        OutboundEmail.objects.enqueue(get_messages(
+            'fail@joltem.local', 'a@joltem.local'))
+        cache.delete(OUTBOX_LOCK_CACHE_KEY)
+        report = drain_outbox()
+        self.assertEqual((report['sent'], report['deferred']), (1, 1))
+        [email] = OutboundEmail.objects.all()
+        self.assertEqual(email.attempts, 1)
+        self.assertIn("Connection reset.", email.error)
+
+        # Deferred emails wait for their next attempt
+        self.assertEqual(drain_outbox()['deferred'], 0)
+        OutboundEmail.objects.update(time_next_attempt=email.time_queued)
+        self.assertEqual(drain_outbox()['failed'], 1)
+        self.assertEqual(OutboundEmail.objects.get().status,
+                         OutboundEmail.STATUS_CHOICES.failed)
+        self.assertEqual(len(mail.outbox), 1)
+
+    @override_settings(
+        EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+        EMAIL_HOST='localhost', EMAIL_PORT=0, EMAIL_USE_TLS=False)
+    def test_sink(self):
+        sink = SinkServer(('localhost', 0))
+        thread = threading.Thread(
+            target=asyncore.loop, kwargs=dict(timeout=0.01))
+        thread.start()
+        try:
+            with self.settings(EMAIL_PORT=sink.socket.getsockname()[1]):
+                OutboundEmail.objects.enqueue(get_messages(
+                    'a@joltem.local', 'b@joltem.local'))
+                cache.delete(OUTBOX_LOCK_CACHE_KEY)
+                self.assertEqual(drain_outbox()['sent'], 2)
+        finally:
+            sink.close()
+            thread.join()
+        self.assertEqual(sink.received, 2)
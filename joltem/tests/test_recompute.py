@@ -0,0 +1,63 @@
+""" Test coalescing of stale metrics. """
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.test import TestCase
+
+from joltem.libs import mixer
+from joltem.models import RecomputeKey, User
+from joltem.tasks import drain_recompute_queue, RECOMPUTE_LOCK_CACHE_KEY
+from project.models import Impact
+
+
+class RecomputeKeyTest(TestCase):
+
+    """ Keys are collected while a drain is running. """
+
+    def setUp(self):
+        self.project = mixer.blend('project.project')
+        self.owner = mixer.blend('joltem.user')
+        self.solution = mixer.blend(
+            'solution.solution', project=self.project, owner=self.owner)
+        self.solution.mark_complete(100)
+        self.assertFalse(RecomputeKey.objects.exists())
+        cache.add(RECOMPUTE_LOCK_CACHE_KEY, 1)
+
+    def tearDown(self):
+        cache.delete(RECOMPUTE_LOCK_CACHE_KEY)
+
+    def test_burst_of_votes(self):
+        """ Votes on a solution collapse into one key. """
+        for _ in range(3):
+            self.solution.add_vote(mixer.blend('joltem.user', impact=10), True)
+        self.assertEqual(
+            list(RecomputeKey.objects.values_list('key', flat=True)),
+            ['voteable:%d:%d' % (ContentType.objects.get_for_model(
+                self.solution).id, self.solution.pk)])
+        self.assertEqual(User.objects.get(pk=self.owner.pk).impact, 0)
+
+        # Impacts take the change of the contribution, they are not
+        # computed again by impact and user keys
+        cache.delete(RECOMPUTE_LOCK_CACHE_KEY)
+        self.assertEqual(drain_recompute_queue(), 1)
+        self.assertFalse(RecomputeKey.objects.exists())
+        owner = User.objects.get(pk=self.owner.pk)
+        self.assertEqual((owner.impact, owner.completed), (100, 1))
+        impact = Impact.objects.get(project=self.project, user=self.owner)
+        self.assertEqual((impact.impact, impact.completed), (100, 1))
+
+    def test_locked(self):
+        """ Drain quits while another one runs. """
+        self.project.admin_set.add(self.owner)
+        self.project.save()
+        self.assertEqual(drain_recompute_queue(), 0)
+        self.assertTrue(RecomputeKey.objects.filter(
+            kind=RecomputeKey.KIND_CHOICES.impact).exists())
+
+    def test_deleted_user(self):
+        """ Keys of deleted objects are dropped. """
+        RecomputeKey.mark_impact(self.project.pk, self.owner.pk)
+        RecomputeKey.mark_user(self.owner.pk)
+        self.owner.delete()
+        cache.delete(RECOMPUTE_LOCK_CACHE_KEY)
+        self.assertEqual(drain_recompute_queue(), 2)
+        self.assertFalse(RecomputeKey.objects.exists())
@@ -1,7 +1,12 @@
 """ View related tests for core app. """
+import json
+
 from django.test.testcases import TestCase
 from django.core.urlresolvers import reverse
+from django.utils import timezone
+from joltem import pubsub
 from joltem.libs import mixer
+from joltem.models import Notification, User
 
 
 class TestJoltemViews(TestCase):
@@ -54,7 +59,8 @@ class TestJoltemViews(TestCase):
         self.assertEqual(self.user.notification_set.count(), 4)
 
         self.client.login(username=self.user.username, password='test')
-        with self.assertNumQueries(10):
+        # The unread counter is not cached yet
+        with self.assertNumQueries(3):
             response = self.client.get('/notifications/')
         self.assertContains(response, guest.first_name)
 
@@ -63,10 +69,92 @@ class TestJoltemViews(TestCase):
         self.assertTrue(self.user.notifications)
         self.user.save()
 
-        with self.assertNumQueries(5):
+        with self.assertNumQueries(4):
             response = self.client.post('/notifications/', data=dict(
                 clear_all=True))
         self.assertFalse(
             self.user.notification_set.filter(is_cleared=False).count())
         self.user = type(self.user).objects.get(pk=self.user.pk)
         self.assertFalse(self.user.notifications)
+
+    def test_notifications_pages(self):
+        task = mixer.blend('task.task')
+        time_notified = timezone.now()
+        Notification.objects.bulk_create([
+            Notification(user=self.user, notifying=task, type='task_posted',
+                         time_notified=time_notified)
+            for _ in range(25)])
+        newest = list(self.user.notification_set.order_by(
+            '-time_notified', '-pk'))
+
+        self.client.login(username=self.user.username, password='test')
+        response = self.client.get('/notifications/')
+        self.assertEqual(list(response.context['notification_list']),
+                         newest[:10])
+        self.assertNotIn('newer', response.context)
+
+        response = self.client.get(
+            '/notifications/?before=' + response.context['older'])
+        self.assertEqual(list(response.context['notification_list']),
+                         newest[10:20])
+        older = response.context['older']
+
+        with self.assertNumQueries(3):
+            response = self.client.get('/notifications/?before=' + older)
+        self.assertEqual(list(response.context['notification_list']),
+                         newest[20:])
+        self.assertNotIn('older', response.context)
+
+        response = self.client.get(
+            '/notifications/?after=' + response.context['newer'])
+        self.assertEqual(list(response.context['notification_list']),
+                         newest[10:20])
+
+    def test_notifications_deleted_page(self):
+        task = mixer.blend('task.task')
+        now = timezone.now()
+        older = [Notification(user=self.user, notifying=task,
+                              type='task_posted',
+                              time_notified=now - timezone.timedelta(days=1))]
+        deleted = [Notification(
+            user=self.user, notifying_type=older[0].notifying_type,
+            notifying_id=task.pk + 1, type='task_posted', time_notified=now)
+            for _ in range(10)]
+        Notification.objects.bulk_create(older + deleted)
+
+        self.client.login(username=self.user.username, password='test')
+        response = self.client.get('/notifications/')
+        self.assertFalse(response.context['notification_list'])
+        response = self.client.get(
+            '/notifications/?before=' + response.context['older'])
+        self.assertEqual(len(response.context['notification_list']), 1)
+
+    def test_notification_poll(self):
+        self.client.login(username=self.user.username, password='test')
+        self.assertContains(self.client.get('/'), 'data-poll-cursor')
+        task = mixer.blend('task.task', owner=self.user)
+        task.add_comment(mixer.blend('joltem.user'), mixer.G.get_string())
+        count = User.objects.get(pk=self.user.pk).notifications
+
+        response = self.client.get('/notifications/poll/')
+        data = json.loads(response.content)
+        self.assertEqual(data['count'], count)
+        self.assertEqual(data['notifications'], [])
+
+        # Notifications sent after the cursor are summarized, the session
+        # user and the notifications are loaded, the counter is cached
+        task.add_comment(mixer.blend('joltem.user'), mixer.G.get_string())
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                '/notifications/poll/', dict(since=data['cursor']))
+        summaries = json.loads(response.content)['notifications']
+        notification = Notification.objects.get(user=self.user)
+        self.assertEqual(summaries, [dict(
+            id=notification.pk, type=notification.type,
+            text=notification.get_text(),
+            url=reverse('notification_redirect', args=[notification.pk]))])
+
+    def test_pubsub_unavailable(self):
+        """ Redis outage means no events, not errors. """
+        backend = pubsub.RedisPubSub('redis://localhost:1/0')
+        self.assertEqual(list(backend.listen('joltem:test', 0.1)), [])
@@ -16,6 +16,9 @@ urlpatterns = [
     url(r'^notifications/(?P<notification_id>([0-9])+)/', login_required(
         views.NotificationRedirectView.as_view()),
         name='notification_redirect'),
+    url(r'^notifications/poll/$', login_required(
+        views.NotificationPollView.as_view()),
+        name='notification_poll'),
     url(r'^notifications/', login_required(
         views.NotificationsView.as_view()), name='notifications'),
     url(r'^comment/(?P<comment_id>([0-9])+)/', login_required(
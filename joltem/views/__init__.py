@@ -1,11 +1,14 @@
 # coding: utf-8
 """ Joltem views. """
 
-from collections import defaultdict
+from django.conf import settings
 from django.core.paginator import Paginator
+from django.core.urlresolvers import reverse
 from django.db.models import Q
 from django.http.response import HttpResponse, HttpResponseRedirect
 from django.shortcuts import redirect, get_object_or_404
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.views.generic import (
     TemplateView, RedirectView, View, DetailView, ListView)
 import json
@@ -13,6 +16,7 @@ import json
 from joltem.models import Notification, Comment, User
 from joltem.models.utils import Tag
 from joltem.views.generic import RequestBaseView
+from task.recommendations import recommend
 
 
 class HomeView(RequestBaseView, TemplateView):
@@ -45,6 +49,7 @@ class HomeView(RequestBaseView, TemplateView):
             kwargs['watching'] = \
                 [ProjectHolder(project)
                  for project in self.user.subscriber_project_set.all()]
+            kwargs['recommended'] = recommend(self.user, 5)
             return super(HomeView, self).get_context_data(**kwargs)
         else:
             return {}  # empty context
@@ -137,7 +142,9 @@ class NotificationsView(RequestBaseView, ListView):
     """ Displays the users notifications. """
 
     template_name = "joltem/notifications.html"
-    paginate_by = 10
+    context_object_name = "notification_list"
+    # Pages are sliced by keyset_page, not by the paginator
+    page_size = 10
 
     @staticmethod
     def post(request, *args, **kwargs):
@@ -159,30 +166,27 @@ class NotificationsView(RequestBaseView, ListView):
 
         """
         kwargs["nav_tab"] = "notifications"
+        # Cursors come from the page before notifications of deleted
+        # objects are dropped, which may drop all of them
+        page = self.page
+        if self.has_newer and page:
+            kwargs["newer"] = page[0].cursor
+        if self.has_older and page:
+            kwargs["older"] = page[-1].cursor
 
         return super(NotificationsView, self).get_context_data(**kwargs)
 
     def get_queryset(self):
-        """ Preload notifications.
+        """ Preload a page of notifications.
 
         :return list:
 
         """
-        notifications = self.user.notification_set.select_related()\
-            .order_by('-time_notified')
-        cache = defaultdict(list)
-        for notify in notifications:
-            cache[notify.notifying_type].append(notify.notifying_id)
-
-        for ct_type in cache.keys():
-            cache[ct_type] = ct_type.model_class().objects.select_related()\
-                .in_bulk(cache[ct_type])
-
-        for notify in notifications:
-            notify.notifying = cache[
-                notify.notifying_type][notify.notifying_id]
-
-        return notifications
+        self.page, self.has_newer, self.has_older = \
+            self.user.notification_set.keyset_page(
+                self.page_size, before=self.request.GET.get('before'),
+                after=self.request.GET.get('after'))
+        return Notification.objects.prefetch_notifying(self.page)
 
 
 class NotificationRedirectView(TemplateView):
@@ -205,6 +209,42 @@ class NotificationRedirectView(TemplateView):
             return HttpResponseRedirect(n.notifying.get_notification_url(n))
 
 
+class NotificationPollView(View):
+
+    """ Return the unread counter and summaries of new notifications.
+
+    Pages poll every NOTIFICATION_POLL_INTERVAL seconds and pass back the
+    cursor of the previous response, so no notification is missed between
+    polls. The counter is cached, a poll waits for nothing and queries the
+    notifications only when there are unread ones.
+
+    """
+
+    def get(self, request):
+        """ Summarize unread notifications sent after the cursor.
+
+        :return HttpResponse: JSON with the count, the summaries, newest
+            first, and the cursor of the next poll
+
+        """
+        now = timezone.now()
+        since = parse_datetime(request.GET.get('since', ''))
+        count = Notification.objects.get_unread_count(request.user)
+        notifications = []
+        if since is not None and count > 0:
+            notifications = list(Notification.objects.filter(
+                user_id=request.user.pk, is_cleared=False,
+                time_notified__gt=since, time_notified__lte=now,
+            ).order_by('-time_notified')[:settings.NOTIFICATION_POLL_SIZE])
+        summaries = [dict(
+            id=n.pk, type=n.type, text=n.kwargs['text'],
+            url=reverse('notification_redirect', args=[n.pk])
+        ) for n in notifications if n.kwargs and n.kwargs.get('text')]
+        return HttpResponse(json.dumps(dict(
+            count=count, notifications=summaries, cursor=now.isoformat())),
+            content_type='application/json')
+
+
 class IntroductionView(TemplateView, RequestBaseView):
 
     """ A view to display a basic introduction to the site.
@@ -1,6 +1,6 @@
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, m2m_changed
 
-from .models import Project, Impact
+from .models import Project, Impact, ROLES
 from .receivers import *
 
 
@@ -11,3 +11,11 @@ post_delete.connect(update_project_impact_from_project, sender=Project)
 post_save.connect(update_user_metrics_from_project_impact, sender=Impact)
 
 post_delete.connect(update_user_metrics_from_project_impact, sender=Impact)
+
+post_save.connect(update_project_roles_from_project, sender=Project)
+
+post_delete.connect(update_project_roles_from_project, sender=Project)
+
+for role in ROLES:
+    m2m_changed.connect(update_project_roles,
+                        sender=getattr(Project, '%s_set' % role).through)
@@ -0,0 +1,31 @@
+""" Custom managers for project models. """
+
+from collections import defaultdict
+
+from django.db.models import F
+from django.db.models.query import QuerySet
+
+
+class ImpactQuerySet(QuerySet):
+
+    """ Project specific impacts. """
+
+    def apply_deltas(self, deltas):
+        """ Add impact changes to project impacts and impacts of users.
+
+        Updates are relative, so concurrent changes are not lost.
+
+        :param deltas: dict of impact changes by (project id, user id)
+
+        """
+        from joltem.models import User
+        user_deltas = defaultdict(int)
+        for (project_id, user_id), delta in deltas.items():
+            if not delta:
+                continue
+            self.get_or_create(project_id=project_id, user_id=user_id)
+            self.filter(project_id=project_id, user_id=user_id).update(
+                impact=F('impact') + delta)
+            user_deltas[user_id] += delta
+        for user_id, delta in user_deltas.items():
+            User.objects.filter(pk=user_id).update(impact=F('impact') + delta)
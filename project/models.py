@@ -1,18 +1,25 @@
 """ Project's related models. """
 
 import operator
-from django.db import models
+from django.db import models, connection
 from django.utils import timezone
 from django.conf import settings
 from django.core.cache import cache
 from django.core.urlresolvers import reverse
+from django.db.models import Sum
+from model_utils.managers import PassThroughManager
 import logging
 
+from .managers import ImpactQuerySet
 from joltem.models import Notifying
 
 
 logger = logging.getLogger('joltem')
 
+# Memberships resolved by Project.get_roles
+ROLES = ('admin', 'manager', 'developer', 'invitee')
+ROLES_CACHE_TIMEOUT = 60 * 60
+
 
 class Project(Notifying):
 
@@ -74,6 +81,72 @@ class Project(Notifying):
         settings.AUTH_USER_MODEL, related_name='founder_project_set',
         blank=True)
 
+    @property
+    def cache_namespace(self):
+        """ Cache namespace of data invalidated by changes in the project.
+
+        :return Namespace:
+
+        """
+        from joltem.libs.cache import Namespace  # avoid circular import
+        return Namespace('project:%s' % self.pk)
+
+    @property
+    def roles_cache_namespace(self):
+        """ Cache namespace of roles invalidated by changes of memberships.
+
+        :return Namespace:
+
+        """
+        from joltem.libs.cache import Namespace  # avoid circular import
+        return Namespace('project:%s:roles' % self.pk)
+
+    def get_roles(self, user_id):
+        """ Get roles of the user in the project in one query.
+
+        Roles are memoized on the instance, which lives for a request,
+        and cached for the generation of the memberships.
+
+        :param user_id:
+        :return frozenset: names of roles, e.g. 'admin', 'invitee'
+
+        """
+        if user_id is None:
+            return frozenset()
+        memo = self.__dict__.setdefault('_roles', {})
+        if user_id not in memo:
+            key = self.roles_cache_namespace.make_key(user_id)
+            roles = cache.get(key)
+            if roles is None:
+                roles = frozenset(self._get_roles(user_id))
+                cache.set(key, roles, ROLES_CACHE_TIMEOUT)
+            memo[user_id] = roles
+        return memo[user_id]
+
+    def _get_roles(self, user_id):
+        """ Select roles of the user from the membership tables.
+
+        :return list:
+
+        """
+        selects, params = [], []
+        for role in ROLES:
+            field = self._meta.get_field('%s_set' % role)
+            selects.append("SELECT %s FROM {table} WHERE {project} = %s "
+                           "AND {user} = %s".format(
+                               table=field.m2m_db_table(),
+                               project=field.m2m_column_name(),
+                               user=field.m2m_reverse_name()))
+            params.extend([role, self.pk, user_id])
+        cursor = connection.cursor()
+        cursor.execute(" UNION ALL ".join(selects), params)
+        return [role for role, in cursor.fetchall()]
+
+    def bump_roles_generation(self):
+        """ Invalidate cached roles after a change of memberships. """
+        self.roles_cache_namespace.bump()
+        self.__dict__.pop('_roles', None)
+
     def is_admin(self, user_id):
         """ Check if the user is an admin of the project.
 
@@ -81,7 +154,7 @@ class Project(Notifying):
         :return bool:
 
         """
-        return self.admin_set.filter(id=user_id).exists()
+        return 'admin' in self.get_roles(user_id)
 
     def is_manager(self, user_id):
         """ Check if the user is a manager of the project.
@@ -90,7 +163,7 @@ class Project(Notifying):
         :return bool:
 
         """
-        return self.manager_set.filter(id=user_id).exists()
+        return 'manager' in self.get_roles(user_id)
 
     def is_developer(self, user_id):
         """ Check if the user is a developer of the project.
@@ -99,7 +172,7 @@ class Project(Notifying):
         :return bool:
 
         """
-        return self.developer_set.filter(id=user_id).exists()
+        return 'developer' in self.get_roles(user_id)
 
     def is_invitee(self, user_id):
         """ Check if the user is a invitee of the project.
@@ -108,7 +181,7 @@ class Project(Notifying):
         :return bool:
 
         """
-        return self.invitee_set.filter(id=user_id).exists()
+        return 'invitee' in self.get_roles(user_id)
 
     def has_access(self, user_id):
         """ Determine if the user can access project.
@@ -117,11 +190,7 @@ class Project(Notifying):
         :return bool:
 
         """
-        return not self.is_private \
-            or self.is_invitee(user_id) \
-            or self.is_developer(user_id) \
-            or self.is_manager(user_id) \
-            or self.is_admin(user_id)
+        return not self.is_private or bool(self.get_roles(user_id))
 
     def __unicode__(self):
         return self.title
@@ -213,7 +282,7 @@ class Project(Notifying):
         :return dict: overview
 
         """
-        key = 'project:overview:%s:limit:%d' % (self.id, limit)
+        key = self.cache_namespace.make_key('overview:%d' % limit)
         overview = cache.get(key)
         if not overview:
             overview = self.get_overview()
@@ -242,6 +311,8 @@ class Impact(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL, related_name="impact_set")
 
+    objects = PassThroughManager.for_queryset_class(ImpactQuerySet)()
+
     class Meta:
         unique_together = ['project', 'user']
 
@@ -261,6 +332,9 @@ class Impact(models.Model):
     def get_impact(self):
         """ Calculate impact.
 
+        Sums contributions stored by solutions, see
+        `SolutionQuerySet.update_contributions`.
+
         :return int:
 
         """
@@ -270,8 +344,8 @@ class Impact(models.Model):
         if self.project.is_admin(self.user.id):
             impact += 1
         # Impact from solutions
-        for solution in self.get_solutions_qs():
-            impact += solution.get_impact()
+        impact += self.get_solutions_qs().aggregate(
+            contribution=Sum('contribution'))['contribution'] or 0
         return impact
 
     def get_completed(self):
@@ -2,25 +2,56 @@
 
 
 def update_user_metrics_from_project_impact(sender, instance=None, **kwargs):
-    """ Update user metrics from project impact. """
+    """ Mark user metrics stale due to project impact change. """
+    from joltem.models import RecomputeKey  # avoid circular import
     project_impact = instance
     if project_impact:
-        project_impact.user.update().save()
+        RecomputeKey.mark_user(project_impact.user_id)
 
 
 def update_project_impact_from_project(sender, **kwargs):
-    """ Update project specific impact due project modification.
+    """ Mark project specific impacts stale due project modification.
 
     Mainly change to the admin set.
 
     """
-    from project.models import Impact  # avoid circular import
+    from joltem.models import RecomputeKey  # avoid circular import
     project = kwargs.get('instance')
     if project:
-        for admin in project.admin_set.all():
-            (project_impact, _) = Impact.objects.get_or_create(
-                project_id=project.id,
-                user_id=admin.id
-            )
-            project_impact.impact = project_impact.get_impact()
-            project_impact.save()
+        for admin_id in project.admin_set.values_list('id', flat=True):
+            RecomputeKey.mark_impact(project.id, admin_id)
+
+
+def update_project_roles_from_project(sender, instance=None, created=True,
+                                      **kwargs):
+    """ Invalidate cached roles of a new or deleted project.
+
+    Ids of deleted projects may be reused, and their memberships are
+    deleted without m2m signals.
+
+    """
+    if instance and created:
+        instance.bump_roles_generation()
+
+
+def update_project_roles(sender, instance=None, action=None, reverse=False,
+                         pk_set=None, **kwargs):
+    """ Invalidate cached roles after a change of a membership set.
+
+    Changes from the user side, e.g. `user.admin_project_set.add()`,
+    invalidate each project, cleared ones are collected before clearing.
+
+    """
+    from .models import Project  # avoid circular import
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            instance.bump_roles_generation()
+        return
+
+    if action == 'pre_clear':
+        pk_set = sender.objects.filter(user=instance).values_list(
+            'project', flat=True)
+    elif action not in ('post_add', 'post_remove'):
+        return
+    for project_id in pk_set:
+        Project(pk=project_id).bump_roles_generation()
@@ -44,6 +44,44 @@ class ProjectModelTest(TestCase):
         self.assertTrue('completed_tasks_count' in overview)
 
 
+class ProjectRolesTest(TestCase):
+
+    """ Roles of users are resolved in one query and cached. """
+
+    def setUp(self):
+        self.project = mixer.blend(Project, is_private=True)
+        self.user = mixer.blend('joltem.user')
+
+    def test_get_roles(self):
+        self.project.admin_set.add(self.user)
+        self.project.invitee_set.add(self.user)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.project.get_roles(self.user.pk),
+                             frozenset(['admin', 'invitee']))
+            self.assertTrue(self.project.has_access(self.user.pk))
+            self.assertTrue(self.project.is_admin(self.user.pk))
+            self.assertFalse(self.project.is_manager(self.user.pk))
+
+        project = Project.objects.get(pk=self.project.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(project.is_invitee(self.user.pk))
+        self.assertFalse(project.has_access(None))
+
+    def test_invalidate(self):
+        self.assertFalse(self.project.has_access(self.user.pk))
+        self.project.developer_set.add(self.user)
+        self.assertTrue(self.project.is_developer(self.user.pk))
+
+        project = Project.objects.get(pk=self.project.pk)
+        self.user.developer_project_set.clear()
+        self.assertFalse(project.has_access(self.user.pk))
+        self.user.manager_project_set.add(self.project)
+        # Roles stay memoized for the instance, i.e. for the request
+        self.assertFalse(project.is_manager(self.user.pk))
+        project = Project.objects.get(pk=self.project.pk)
+        self.assertTrue(project.is_manager(self.user.pk))
+
+
 class ProjectCompletedCountTest(TestCase):
 
     """ Tests related to project specific completed count. """
@@ -1,5 +1,4 @@
 """ View related tests for project app. """
-from django.core.cache import cache
 from django.core.urlresolvers import reverse
 from django.test.testcases import TestCase
 
@@ -191,11 +190,6 @@ class TestProjectViews(TestCase):
             'joltem.comment', commentable=mixer.RANDOM(*solutions),
             owner=mixer.SELECT('joltem.user'), project=self.project)
 
-        response = self.client.get(uri)
-        self.assertFalse(response.context['feed'])
-
-        cache.set('project:overview:%s:limit:30' % self.project.id, None)
-
         # with self.assertNumQueries(17):
             # response = self.client.get(uri)
         response = self.client.get(uri)
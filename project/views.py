@@ -6,7 +6,9 @@ from django.core.exceptions import ImproperlyConfigured
 from django.core.urlresolvers import reverse
 from django_markdown.utils import markdown
 from django.contrib.syndication.views import Feed
+from django.db import connection, connections
 from django.db.models import Q
+from django.utils.datastructures import SortedDict
 from django.http import Http404
 from django.shortcuts import get_object_or_404, redirect
 from django.utils.functional import cached_property
@@ -118,6 +120,41 @@ class ProjectBaseListView(ProjectBaseView, ListView):
     is_personal = False
     order_by = ()
 
+    def count_tabs(self):
+        """ Count items of all tabs, one query by model.
+
+        Each tab adds a `COUNT(CASE WHEN ...)` column compiled from its
+        filters. Personal tabs are counted for authenticated users.
+
+        :return tuple: counts and personal counts, dicts name => count
+
+        """
+        models = SortedDict()
+        for cls in ProjectBaseListView.tabs:
+            if not cls.is_personal or self.user.is_authenticated():
+                model = cls._get_raw_queryset(self.project).model
+                models.setdefault(model, []).append(cls)
+
+        counts, personal_counts = {}, {}
+        cursor = connection.cursor()
+        qn = connection.ops.quote_name
+        for model, tabs in models.items():
+            columns, params = [], []
+            for cls in tabs:
+                sql, condition_params = cls._get_count_condition(self)
+                columns.append("COUNT(CASE WHEN %s THEN 1 END)" % sql)
+                params.extend(condition_params)
+            cursor.execute("SELECT %s FROM %s WHERE %s = %%s" % (
+                ", ".join(columns), qn(model._meta.db_table),
+                qn(model._meta.get_field('project').column)),
+                params + [self.project.pk])
+            for cls, count in zip(tabs, cursor.fetchone()):
+                if cls.is_personal:
+                    personal_counts[cls.tab] = count
+                else:
+                    counts[cls.tab] = count
+        return counts, personal_counts
+
     def get_tab_counts(self, is_personal=False):
         """ Get the counts for each list.
 
@@ -125,13 +162,15 @@ class ProjectBaseListView(ProjectBaseView, ListView):
         :return dict: name => count
 
         """
-        return {cls.tab: cls._get_queryset(self, **cls.filters).count() # noqa
-                for cls in ProjectBaseListView.tabs
-                if cls.is_personal == is_personal}
+        counts, personal_counts = self.count_tabs()
+        return personal_counts if is_personal else counts
 
     def get_cached_tab_counts(self, is_personal=False):
         """ Get the cached counts, if cached, otherwise query and set.
 
+        Public and personal counts are queried and cached together, in
+        the cache namespace of the project.
+
         :param is_personal: filter views by is_personal attribute
         :return dict: name => count
 
@@ -139,28 +178,33 @@ class ProjectBaseListView(ProjectBaseView, ListView):
         key = self.personal_tab_counts_cache_key if is_personal \
             else self.tab_counts_cache_key
         value = cache.get(key)
-        if not value:
-            value = self.get_tab_counts(is_personal)
-            cache.set(key, value)
+        if value is None:
+            counts, personal_counts = self.count_tabs()
+            values = {self.tab_counts_cache_key: counts}
+            if self.user.is_authenticated():
+                values[self.personal_tab_counts_cache_key] = personal_counts
+            cache.set_many(values)
+            value = personal_counts if is_personal else counts
         return value
 
-    @cached_property
+    @property
     def tab_counts_cache_key(self):
-        """ Make tabs cache key from project ID.
+        """ Make tabs cache key in the project namespace.
 
         :returns: Key's string
 
         """
-        return "project:%s:tabs" % self.project.pk
+        return self.project.cache_namespace.make_key('tabs')
 
-    @cached_property
+    @property
     def personal_tab_counts_cache_key(self):
-        """ Make tabs cache key from project ID and current user ID.
+        """ Make tabs cache key in the project namespace from user ID.
 
         :returns: Key's string
 
         """
-        return "project:%s:user:%s:tabs" % (self.project.pk, self.user.pk)
+        return self.project.cache_namespace.make_key(
+            'user:%s:tabs' % self.user.pk)
 
     def get_context_data(self, **kwargs):
         """ Get context data for templates.
@@ -209,6 +253,26 @@ class ProjectBaseListView(ProjectBaseView, ListView):
                 qs = qs.filter(**{k: filters[k]})
         return qs.order_by(*cls.order_by)
 
+    @classmethod
+    def _get_count_condition(cls, context):
+        """ Compile filters into a condition on the unfiltered table.
+
+        Filters joining other tables are checked with a subquery.
+
+        :param context: an instance of a ProjectBaseView.
+        :return tuple: (sql, params)
+
+        """
+        qs = cls._get_queryset(context).order_by()
+        query = qs.query
+        alias = query.get_initial_alias()
+        qn = query.get_compiler(using=qs.db).quote_name_unless_alias
+        if any(query.alias_refcount[a] for a in query.tables if a != alias):
+            sql, params = qs.values('pk').query.sql_with_params()
+            return "%s.%s IN (%s)" % (
+                qn(alias), qn(qs.model._meta.pk.column), sql), params
+        return query.where.as_sql(qn, connections[qs.db])
+
     def get_queryset(self, **filters):
         """ Return queryset for the extending class.
 
@@ -9,4 +9,6 @@ post_save.connect(
     receivers.update_project_impact_from_voteables, sender=Solution)
 
 post_delete.connect(
-    receivers.update_project_impact_from_voteables, sender=Solution)
+    receivers.update_project_impact_from_deleted_voteables, sender=Solution)
+
+post_save.connect(receivers.update_followers_from_owned, sender=Solution)
@@ -1,9 +1,13 @@
 """ Custom manager for Solution model. """
 
-from django.db.models.query import QuerySet
+from collections import defaultdict
 
+from django.db import transaction
 
-class SolutionQuerySet(QuerySet):
+from joltem.models.votes import VoteableQuerySet
+
+
+class SolutionQuerySet(VoteableQuerySet):
 
     """ Im really dont known what the goal of the Manager.
 
@@ -32,3 +36,68 @@ class SolutionQuerySet(QuerySet):
 
         """
         return self.filter(is_completed=True, is_closed=False)
+
+    def archive(self):
+        """ Mark solutions archived and notify their owners.
+
+        Solutions are locked and updated by one query, so overlapping
+        chunks archive and notify each solution once. Notifications are
+        created in bulk and no signals are sent, so the caches of the
+        projects are invalidated here.
+
+        :return int: number of archived solutions
+
+        """
+        from django.conf import settings
+        from joltem.models import Notification
+        from project.models import Project
+
+        with transaction.atomic():
+            solution_ids = list(self.select_for_update().filter(
+                is_archived=False).values_list('pk', flat=True))
+            self.model.objects.filter(
+                pk__in=solution_ids, is_archived=False).update(
+                    is_archived=True)
+        if not solution_ids:
+            return 0
+        solutions = list(self.model.objects.filter(
+            pk__in=solution_ids).select_related('owner'))
+        for project_id in set(s.project_id for s in solutions):
+            Project(pk=project_id).cache_namespace.bump()
+
+        notifications = []
+        for solution in solutions:
+            solution.is_archived = True
+            notification = Notification(
+                user_id=solution.owner_id,
+                type=settings.NOTIFICATION_TYPES.solution_archived,
+                notifying=solution,
+            )
+            notification.kwargs = solution.get_notification_kwargs(
+                notification)
+            notifications.append(notification)
+        Notification.objects.bulk_deliver(notifications)
+        return len(solutions)
+
+    def update_contributions(self):
+        """ Store current contributions of solutions to impact.
+
+        Only the changes of contributions are applied to project
+        impacts and impacts of the owners.
+
+        :return dict: impact changes by (project id, owner id)
+
+        """
+        from project.models import Impact
+        deltas = defaultdict(int)
+        with transaction.atomic():
+            for solution in self.select_for_update().with_vote_metrics():
+                contribution = solution.get_contribution()
+                if contribution == solution.contribution:
+                    continue
+                self.model.objects.filter(pk=solution.pk).update(
+                    contribution=contribution)
+                deltas[(solution.project_id, solution.owner_id)] += \
+                    contribution - solution.contribution
+            Impact.objects.apply_deltas(deltas)
+        return deltas
@@ -3,13 +3,12 @@ import logging
 from django.conf import settings
 from django.core import serializers
 from django.core.urlresolvers import reverse
-from django.core.cache import cache
 from django.db import models
 from django.utils import timezone
 from model_utils.managers import PassThroughManager
 
 from .managers import SolutionQuerySet
-from joltem.models import Voteable, Commentable
+from joltem.models import Voteable, Commentable, Follower
 from joltem.models.generic import Updatable
 
 
@@ -44,6 +43,8 @@ class Solution(Voteable, Commentable, Updatable):
     is_closed = models.BooleanField(default=False)
     # Whether solution was marked archived
     is_archived = models.BooleanField(default=False)
+    # Impact added to the owner's project impact by the solution
+    contribution = models.BigIntegerField(default=0)
 
     # NOTE : No parenthesis on timezone.now
     # because I'm passing the function not the current value
@@ -61,6 +62,10 @@ class Solution(Voteable, Commentable, Updatable):
 
     objects = PassThroughManager.for_queryset_class(SolutionQuerySet)()
 
+    rejection_requires_comment = True
+    follower_reasons = (
+        Follower.REASON_CHOICES.owner, Follower.REASON_CHOICES.comment)
+
     def __unicode__(self):
         return "%s %s" % (
             self.pk, '/'.join(filter(None, [
@@ -69,22 +74,14 @@ class Solution(Voteable, Commentable, Updatable):
                 self.is_archived and 'arc',
             ])))
 
-    @property
-    def followers(self):
-        """ Get users for notify.
-
-        :returns: A set of users.
-
-        """
-        return set([self.owner] + list(self.iterate_commentators()))
-
     def save(self, **kwargs):
         """ Notify at creation. """
+        from task.models import Closure
         created = not self.pk
         super(Solution, self).save(**kwargs)
+        Closure.objects.sync(self)
         if created:
             self.notify_created()
-        cache.delete('%s:solutions_tabs' % self.project_id)
 
     @property
     def default_title(self):
@@ -93,7 +90,7 @@ class Solution(Voteable, Commentable, Updatable):
         Defaults to title of the parent task.
 
         """
-        if self.title:
+        if self.title or self.task is None:
             return self.title
         else:
             return self.task.title
@@ -115,6 +112,16 @@ class Solution(Voteable, Commentable, Updatable):
             return self.impact  # demanded impact
         return calculated_impact
 
+    def get_contribution(self):
+        """ Calculate impact the solution adds to its owner's impact.
+
+        :return int:
+
+        """
+        if not self.is_completed or self.impact is None:
+            return 0
+        return self.get_impact() or 0
+
     def is_vote_valid(self, vote):
         """ Return whether vote should count.
 
@@ -124,16 +131,6 @@ class Solution(Voteable, Commentable, Updatable):
         """
         return vote.is_accepted or self.has_commented(vote.voter_id)
 
-    @property
-    def valid_vote_count(self):
-        """ Return count of valid votes.
-
-        :return int: count of valid votes.
-
-        """
-        return len([vote for vote in self.vote_set.all()
-                    if self.is_vote_valid(vote)])
-
     def get_subtask_count(
             self, solution_is_completed=False, solution_is_closed=False,
             task_is_reviewed=False, task_is_accepted=False,
@@ -153,16 +150,11 @@ class Solution(Voteable, Commentable, Updatable):
             should be closed.
 
         """
-        subtasks = self.subtask_set.filter(is_reviewed=task_is_reviewed,
-                                           is_accepted=task_is_accepted,
-                                           is_closed=task_is_closed)
-        count = 0
-        for subtask in subtasks:
-            count += 1  # for the task it self
-            count += subtask.get_subtask_count(
-                solution_is_completed, solution_is_closed,
-                task_is_reviewed, task_is_accepted, task_is_closed)
-        return count
+        from task.managers import get_node
+        from task.models import Closure
+        return Closure.objects.count_subtasks(
+            get_node(self), solution_is_completed, solution_is_closed,
+            task_is_reviewed, task_is_accepted, task_is_closed)
 
     def change_evaluation(self, value):
         """ Change evaluation of solution.
@@ -237,10 +229,9 @@ class Solution(Voteable, Commentable, Updatable):
         Notify all the people who had previously voted on the solution.
 
         """
-        for vote in self.vote_set.all():
-            self.notify(
-                vote.voter,
-                settings.NOTIFICATION_TYPES.solution_evaluation_changed, False)
+        self.notify_many(
+            self.iterate_voters(),
+            settings.NOTIFICATION_TYPES.solution_evaluation_changed, False)
 
     def notify_created(self):
         """ Send out notifications about the solution being posted. """
@@ -256,11 +247,10 @@ class Solution(Voteable, Commentable, Updatable):
                 settings.NOTIFICATION_TYPES.solution_posted, True,
                 kwargs={"role": "parent_solution"})
         else:  # no parent, notify project admins
-            for admin in self.project.admin_set.all():
-                if admin.id != self.owner_id:
-                    self.notify(
-                        admin, settings.NOTIFICATION_TYPES.solution_posted,
-                        True, kwargs={"role": "project_admin"})
+            self.notify_many(
+                self.project.admin_set.exclude(pk=self.owner_id),
+                settings.NOTIFICATION_TYPES.solution_posted, True,
+                kwargs={"role": "project_admin"})
 
     def notify_complete(self):
         """ Send out completion notifications. """
@@ -426,3 +416,31 @@ class Solution(Voteable, Commentable, Updatable):
         return DiffHolder(
             pygit_repository.diff(pygit_repository[checkout_oid],
                                   pygit_repository[solution_branch_oid]))
+
+
+class ReviewRun(models.Model):
+
+    """ Run of `review_solutions` task.
+
+    Solutions completed up to the frontier of the last run are reviewed.
+
+    """
+
+    frontier = models.DateTimeField(db_index=True)
+    time_started = models.DateTimeField(default=timezone.now)
+    duration = models.FloatField(null=True, blank=True)  # seconds
+    solution_count = models.IntegerField(default=0)
+    impact_count = models.IntegerField(default=0)
+
+    def __unicode__(self):
+        return unicode(self.frontier)
+
+    @classmethod
+    def get_last_frontier(cls):
+        """ Get frontier of the last run.
+
+        :return datetime: None when there was no run yet
+
+        """
+        last_run = cls.objects.order_by('-frontier').first()
+        return last_run.frontier if last_run else None
@@ -6,6 +6,28 @@ from joltem.notifications import _NotifyInterface
 from joltem.utils import list_string_join
 
 
+def get_commentators(solution):
+    """ Get distinct commentators of the solution, the latest first.
+
+    :returns: A list of users
+
+    """
+    return list(solution.iterate_commentators(
+        queryset=solution.comment_set.select_related('owner').order_by(
+            "-time_commented")))
+
+
+def get_voters(solution):
+    """ Get distinct voters of the solution, the latest first.
+
+    :returns: A list of users
+
+    """
+    return list(solution.iterate_voters(
+        queryset=solution.vote_set.select_related('voter').order_by(
+            "-time_voted")))
+
+
 class CommentAdded(_NotifyInterface):
 
     """ Notify about added comment to solution."""
@@ -13,25 +35,36 @@ class CommentAdded(_NotifyInterface):
     ntype = settings.NOTIFICATION_TYPES.comment_added
     model = 'solution.solution'
 
-    def get_text(self, notifying=None, user=None):
+    def get_text(self, notifying=None, user=None, commentators=None):
         """ Get text for current notification.
 
+        :param commentators: distinct commentators, the latest first.
         :returns: Comment added text.
 
         """
         if notifying is None:
             notifying = self.notification.notifying
+        if commentators is None:
+            commentators = get_commentators(notifying)
         user_id = self.notification.user_id
-        first_names = notifying.get_commentator_first_names(
-            queryset=notifying.comment_set.select_related('owner').exclude(
-                owner_id=user_id).order_by("-time_commented")
-        )
+        first_names = [u.first_name for u in commentators if u.id != user_id]
         prefix = ''
         if notifying.owner_id == user_id:
             prefix = 'your '
         return "%s commented on %ssolution \"%s\"" % (
             list_string_join(first_names), prefix, notifying.default_title)
 
+    @classmethod
+    def get_texts(cls, notifications, notifying):
+        """ Get texts with one query for the commentators.
+
+        :returns: A list of texts
+
+        """
+        commentators = get_commentators(notifying)
+        return [cls(n).get_text(notifying, commentators=commentators)
+                for n in notifications]
+
 
 class VoteAdded(_NotifyInterface):
 
@@ -40,25 +73,37 @@ class VoteAdded(_NotifyInterface):
     ntype = settings.NOTIFICATION_TYPES.vote_added
     model = 'solution.solution'
 
-    def get_text(self, notifying=None, user=None):
+    def get_text(self, notifying=None, user=None, voters=None):
         """ Get text for current notification.
 
+        :param voters: distinct voters, the latest first.
         :returns: A text
 
         """
         if notifying is None:
             notifying = self.notification.notifying
-        first_names = notifying.get_voter_first_names(
-            queryset=notifying.vote_set.select_related('voter').exclude(
-                voter_id=self.notification.user_id).order_by("-time_voted")
-        )
+        if voters is None:
+            voters = get_voters(notifying)
+        user_id = self.notification.user_id
+        first_names = [u.first_name for u in voters if u.id != user_id]
         prefix = ''
-        if notifying.owner_id == self.notification.user_id:
+        if notifying.owner_id == user_id:
             prefix = 'your '
 
         return "%s voted on %ssolution \"%s\"" % \
                (list_string_join(first_names), prefix, notifying.default_title)
 
+    @classmethod
+    def get_texts(cls, notifications, notifying):
+        """ Get texts with one query for the voters.
+
+        :returns: A list of texts
+
+        """
+        voters = get_voters(notifying)
+        return [cls(n).get_text(notifying, voters=voters)
+                for n in notifications]
+
 
 class VoteUpdated(_NotifyInterface):
 
@@ -1,25 +1,40 @@
 """ Solution's tasks. """
+import time
+
 from django.conf import settings
 from django.utils.timezone import timedelta, now
 
-from .models import Solution
-from project.models import Impact
+from .models import Solution, ReviewRun
 from joltem.celery import app
+from joltem.libs import iterate_chunks
+
+ARCHIVE_CHUNK_SIZE = 500
 
 
 @app.task(ignore_result=True)
 def archive_solutions():
-    """ Archive solutions after a time period. """
+    """ Archive solutions after a time period.
+
+    Ids of due solutions are dispatched in chunks.
+
+    """
     frontier = now() - timedelta(seconds=settings.SOLUTION_LIFE_PERIOD_SECONDS)
-    for solution in Solution.objects.select_related('owner').filter(
-            time_completed__lte=frontier, is_archived=False):
-        archive_solution.delay(solution)
+    solution_ids = Solution.objects.filter(
+        time_completed__lte=frontier, is_archived=False
+    ).order_by('pk').values_list('pk', flat=True)
+    for chunk in iterate_chunks(solution_ids.iterator(), ARCHIVE_CHUNK_SIZE):
+        archive_solution_chunk.delay(chunk)
 
 
 @app.task(ignore_result=True)
-def archive_solution(solution):
-    """ Make a solution is archived. """
-    solution.mark_archived()
+def archive_solution_chunk(solution_ids):
+    """ Make solutions archived.
+
+    :param solution_ids: list of solution ids
+    :return int: number of archived solutions
+
+    """
+    return Solution.objects.filter(pk__in=solution_ids).archive()
 
 
 @app.task(ignore_result=True)
@@ -30,18 +45,23 @@ def review_solutions():
     the contributor will be awarded the demanded impact. This
     task updates the impact for users that pass this threshold.
 
+    Only solutions completed after the frontier of the last run are
+    checked, later changes of older solutions are handled by signals.
+
+    :return ReviewRun:
+
     """
-    frontier = now() - timedelta(
-        seconds=settings.SOLUTION_REVIEW_PERIOD_SECONDS)
-    for solution in Solution.objects\
-            .filter(
-                time_completed__lte=frontier,
-                is_completed=True):
-        # Update project specific impact
-        try:
-            impact = Impact.objects.get(user_id=solution.owner_id,
-                                        project_id=solution.project_id)
-        except Impact.DoesNotExist:
-            impact = Impact(user=solution.owner, project=solution.project)
-        impact.impact = impact.get_impact()
-        impact.save()
+    start = time.time()
+    run = ReviewRun(frontier=now() - timedelta(
+        seconds=settings.SOLUTION_REVIEW_PERIOD_SECONDS))
+    solutions = Solution.objects.filter(
+        time_completed__lte=run.frontier, is_completed=True)
+    last_frontier = ReviewRun.get_last_frontier()
+    if last_frontier is not None:
+        solutions = solutions.filter(time_completed__gt=last_frontier)
+    run.solution_count = solutions.count()
+    # Contributions are applied once per (project, owner)
+    run.impact_count = len(solutions.update_contributions())
+    run.duration = time.time() - start
+    run.save()
+    return run
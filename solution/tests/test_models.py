@@ -67,9 +67,11 @@ class SolutionModelTest(TestCase):
         self.assertEqual(self.solution.vote_set.count(), 0)
 
     def test_invalidate_cache(self):
-        cache.set('%s:solutions_tabs' % self.project.pk, True)
+        key = self.project.cache_namespace.make_key('tabs')
+        cache.set(key, True)
         mixer.blend('solution', project=self.project)
-        self.assertFalse(cache.get('%s:solutions_tabs' % self.project.pk))
+        self.assertIsNone(
+            cache.get(self.project.cache_namespace.make_key('tabs')))
 
     def test_add_comment(self):
         solution = mixer.blend(Solution)
@@ -126,3 +128,103 @@ class SolutionImpactDefaultingTest(TestCase):
         self.solution.time_completed = self._expired
         self.solution.save()
         self.assertEqual(self.solution.get_impact(), 0)
+
+
+class SolutionContributionTest(TestCase):
+
+    """ Tests for the impact ledger of solutions. """
+
+    def setUp(self):
+        self.solution = mixer.blend('solution.solution')
+        self.solution.mark_complete(10)
+        self.owner = self.solution.owner
+
+    def _reload(self, obj):
+        return type(obj).objects.get(pk=obj.pk)
+
+    def assertImpactEqual(self, expected):
+        from project.models import Impact
+        impact = Impact.objects.get(
+            project_id=self.solution.project_id, user_id=self.owner.id)
+        self.assertEqual(impact.impact, expected)
+        self.assertEqual(impact.get_impact(), expected)
+        self.assertEqual(self._reload(self.owner).impact, expected)
+        self.assertEqual(self._reload(self.solution).contribution, expected)
+
+    def test_vote(self):
+        """ Accepted vote adds contribution to impacts. """
+        self.assertImpactEqual(0)
+        self.solution.put_vote(mixer.blend('joltem.user', impact=1), True)
+        self.assertImpactEqual(10)
+
+        rejecter = mixer.blend('joltem.user', impact=2)
+        self.solution.put_vote(rejecter, False)
+        self.assertImpactEqual(10)  # rejection without comment
+        self.solution.add_comment(rejecter, "Not good.")
+        self.assertImpactEqual(0)
+
+    def test_other_solutions_untouched(self):
+        """ Only contribution of the voted solution changes. """
+        other = mixer.blend('solution.solution', owner=self.owner,
+                            project=self.solution.project)
+        other.mark_complete(5)
+        other.put_vote(mixer.blend('joltem.user', impact=1), True)
+        Solution.objects.filter(pk=other.pk).update(impact=7)
+        self.solution.put_vote(mixer.blend('joltem.user', impact=1), True)
+        self.assertEqual(self._reload(other).contribution, 5)
+        self.assertEqual(self._reload(self.owner).impact, 15)
+
+    def test_delete(self):
+        """ Contribution of deleted solution is removed. """
+        self.solution.put_vote(mixer.blend('joltem.user', impact=1), True)
+        self.solution = self._reload(self.solution)
+        self.solution.delete()
+        self.assertEqual(self._reload(self.owner).impact, 0)
+
+    def test_update_contributions(self):
+        """ Deltas are grouped by project and owner. """
+        mixer.blend('joltem.vote', voteable=self.solution, voter_impact=1,
+                    is_accepted=True)
+        Solution.objects.filter(pk=self.solution.pk).update(contribution=0)
+        deltas = Solution.objects.all().update_contributions()
+        self.assertEqual(
+            deltas, {(self.solution.project_id, self.owner.id): 10})
+        self.assertEqual(Solution.objects.all().update_contributions(), {})
+
+
+class SolutionVoteMetricsTest(TestCase):
+
+    """ Tests for set-based acceptance of solutions. """
+
+    def setUp(self):
+        self.solution = mixer.blend('solution.solution')
+        self.solution.mark_complete(10)
+        for is_accepted, voter_impact in (
+                (True, 30), (False, 10), (False, 20), (True, 0)):
+            mixer.blend('joltem.vote', voteable=self.solution,
+                        voter_impact=voter_impact, is_accepted=is_accepted)
+        # Only the first rejection is valid
+        voter_id = self.solution.vote_set.get(voter_impact=10).voter_id
+        mixer.blend('joltem.comment', commentable=self.solution,
+                    project=self.solution.project, owner_id=voter_id)
+        # Comment on another solution doesn't count
+        voter_id = self.solution.vote_set.get(voter_impact=20).voter_id
+        mixer.blend('joltem.comment', commentable=mixer.blend(
+            'solution.solution'), owner_id=voter_id)
+
+    def test_acceptance(self):
+        """ Acceptance takes one query. """
+        with self.assertNumQueries(1):
+            self.assertEqual(self.solution.get_acceptance(), 75)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.solution.valid_vote_count, 3)
+
+    def test_annotation(self):
+        """ Annotated solutions need no queries. """
+        mixer.blend('solution.solution')
+        solutions = list(Solution.objects.with_vote_metrics().order_by('pk'))
+        with self.assertNumQueries(0):
+            self.assertEqual(solutions[0].get_acceptance(), 75)
+            self.assertEqual(solutions[0].valid_vote_count, 3)
+            self.assertEqual(solutions[-1].get_acceptance(), None)
+            self.assertEqual(solutions[-1].valid_vote_count, 0)
@@ -42,6 +42,36 @@ class SolutionTasksTest(TestCase):
         self.assertEqual(
             notify.get_text(), 'Solution "%s" was archived' % s2.default_title)
 
+    def test_archive_solutions_chunks(self):
+        """ Test solutions are archived in chunks. """
+        from solution import tasks
+        frontier = now() - timedelta(
+            seconds=settings.SOLUTION_LIFE_PERIOD_SECONDS + 300)
+        owner = mixer.blend('joltem.user')
+        mixer.cycle(5).blend('solution.solution', owner=owner,
+                             time_completed=frontier)
+        chunk_size = tasks.ARCHIVE_CHUNK_SIZE
+        tasks.ARCHIVE_CHUNK_SIZE = 2
+        try:
+            tasks.archive_solutions.delay()
+        finally:
+            tasks.ARCHIVE_CHUNK_SIZE = chunk_size
+        self.assertFalse(Solution.objects.filter(is_archived=False).exists())
+        self.assertEqual(load_model(owner).notifications, 5)
+        self.assertEqual(Solution.objects.all().archive(), 0)
+        self.assertEqual(load_model(owner).notifications, 5)
+
+    def test_archive_queries(self):
+        """ Test archived solutions invalidate their project caches. """
+        solutions = mixer.cycle(3).blend('solution.solution')
+        project = solutions[0].project
+        key = project.cache_namespace.make_key('tabs')
+        # Owners are loaded with the solutions, not one by one
+        with self.assertNumQueries(9):
+            self.assertEqual(Solution.objects.filter(
+                pk__in=[s.pk for s in solutions]).archive(), 3)
+        self.assertNotEqual(project.cache_namespace.make_key('tabs'), key)
+
     def test_defaulting_solutions(self):
         """ Test task that defaults solutions impacts.
 
@@ -66,3 +96,29 @@ class SolutionTasksTest(TestCase):
         self.assertEqual(load_model(s.owner).impact, 1)
         pi = Impact.objects.get(user_id=s.owner_id, project_id=s.project_id)
         self.assertEqual(pi.impact, 1)
+
+    def test_review_frontier(self):
+        """ Solutions before frontier of the last run are skipped. """
+        from solution.models import ReviewRun
+        from solution.tasks import review_solutions
+        expired = now() - timedelta(
+            seconds=settings.SOLUTION_REVIEW_PERIOD_SECONDS + 1)
+        s1 = mixer.blend('solution.solution', impact=1, is_completed=True,
+                         time_completed=expired)
+        run = review_solutions()
+        self.assertEqual(run.solution_count, 1)
+        self.assertTrue(run.frontier > s1.time_completed)
+        self.assertEqual(ReviewRun.get_last_frontier(), run.frontier)
+
+        Solution.objects.filter(pk=s1.pk).update(contribution=0)
+        s2 = mixer.blend('solution.solution', impact=2, is_completed=True,
+                         time_completed=run.frontier + timedelta(seconds=1))
+        Solution.objects.filter(pk=s2.pk).update(contribution=0)
+        self.assertEqual(review_solutions().solution_count, 0)
+
+        with self.settings(SOLUTION_REVIEW_PERIOD_SECONDS=0):
+            run = review_solutions()
+        self.assertEqual(run.solution_count, 1)
+        self.assertEqual(run.impact_count, 1)
+        self.assertEqual(Solution.objects.get(pk=s1.pk).contribution, 0)
+        self.assertEqual(Solution.objects.get(pk=s2.pk).contribution, 2)
@@ -8,6 +8,7 @@ from django_webtest import WebTest
 from joltem.libs import mixer, load_model
 from joltem.libs.mock import models, requests
 from joltem.libs.tests import ViewTestMixin
+from project.views import ProjectBaseListView
 from project.tests.test_views import BaseProjectViewTest, BaseProjectPermissionsTestCase
 from solution import views
 from solution.models import Solution
@@ -791,6 +792,29 @@ class SolutionListsCaching(TestCase):
         counts = v.get_cached_tab_counts(is_personal=True)
         self.assertEqual(counts['solutions_my_review'], 1)
 
+    def test_count_tabs(self):
+        """ Test counts of all tabs match the lists, one query by model. """
+        bill = mixer.blend('joltem.user', username='bill')
+        jill = mixer.blend('joltem.user', username='jill')
+        v = self.mock_view(views.MyReviewSolutionsView, bill)
+        task = mixer.blend('task.task', project=self.project)
+        solutions = mixer.cycle(4).blend(
+            'solution.solution', project=self.project, task=task, owner=(u for u in (bill, jill) * 2),
+            is_completed=(c for c in (True, False, True, True)),
+            is_closed=(c for c in (False, False, True, False)))
+        solutions[0].put_vote(bill, True)
+        task.put_vote(bill, False)
+        with self.assertNumQueries(2):
+            counts, personal_counts = v.count_tabs()
+        counts.update(personal_counts)
+        self.assertEqual(counts, dict(
+            (cls.tab, cls._get_queryset(v).count())
+            for cls in ProjectBaseListView.tabs))
+
+        with self.assertNumQueries(2):
+            v.get_cached_tab_counts()
+            v.get_cached_tab_counts(is_personal=True)
+
     def test_review_anonymous(self):
         """ Test access as anonymous user.
 
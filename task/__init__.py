@@ -0,0 +1 @@
+from .listeners import *
@@ -0,0 +1,27 @@
+""" Signal's subscribers. """
+from django.db.models.signals import (
+    post_save, post_delete, pre_save, m2m_changed)
+
+from .models import Task, Vote
+from joltem import receivers
+from project.models import Project, ROLES
+
+
+post_save.connect(receivers.update_followers_from_owned, sender=Task)
+
+post_save.connect(receivers.update_recommendations_from_task, sender=Task)
+
+post_delete.connect(receivers.update_recommendations_from_task, sender=Task)
+
+post_save.connect(receivers.update_followers_from_task_vote, sender=Vote)
+
+post_delete.connect(receivers.update_followers_from_task_vote, sender=Vote)
+
+pre_save.connect(receivers.check_project_privacy, sender=Project)
+
+post_save.connect(receivers.update_recommendations_from_project,
+                  sender=Project)
+
+for role in ROLES:
+    m2m_changed.connect(receivers.update_recommendations_from_membership,
+                        sender=getattr(Project, '%s_set' % role).through)
@@ -0,0 +1,149 @@
+""" Custom managers for task models. """
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.query import QuerySet
+
+
+def get_node(instance):
+    """ Get closure node of a task or solution.
+
+    :return tuple: (model name, id)
+
+    """
+    return instance.model_name, instance.pk
+
+
+def get_parent_node(instance):
+    """ Get closure node of the parent of a task or solution.
+
+    A solution suggested to another solution belongs to the latter.
+
+    :return tuple: (model name, id) or None
+
+    """
+    if instance.model_name == 'task':
+        parent = ('solution', instance.parent_id)
+    elif instance.solution_id:
+        parent = ('solution', instance.solution_id)
+    else:
+        parent = ('task', instance.task_id)
+    return parent if parent[1] else None
+
+
+class ClosureQuerySet(QuerySet):
+
+    """ Ancestor and descendant pairs of tasks and solutions. """
+
+    def ancestors_of(self, node, depth=0):
+        """ Filter pairs by descendant.
+
+        :param node: (model name, id)
+        :param depth: minimal depth, 0 includes the node itself
+        :return QuerySet:
+
+        """
+        return self.filter(depth__gte=depth, **{
+            'descendant_%s_id' % node[0]: node[1]})
+
+    def descendants_of(self, node, depth=0):
+        """ Filter pairs by ancestor.
+
+        :param node: (model name, id)
+        :param depth: minimal depth, 0 includes the node itself
+        :return QuerySet:
+
+        """
+        return self.filter(depth__gte=depth, **{
+            'ancestor_%s_id' % node[0]: node[1]})
+
+    def sync(self, instance):
+        """ Insert a saved task or solution, or move it to a new parent.
+
+        :param instance: task or solution
+
+        """
+        node, parent = get_node(instance), get_parent_node(instance)
+        rows = list(self.ancestors_of(node).filter(depth__lte=1))
+        if not rows:
+            self.create(depth=0, **dict(
+                ('%s_%s_id' % (prefix, node[0]), node[1])
+                for prefix in ('ancestor', 'descendant')))
+            subtree = [(node, 0)]
+        else:
+            current = [r.ancestor_node for r in rows if r.depth == 1]
+            if current == ([parent] if parent else []):
+                return
+            subtree = [(r.descendant_node, r.depth)
+                       for r in self.descendants_of(node)]
+            self.detach([n for n, _ in subtree])
+
+        if parent is None:
+            return
+        self.bulk_create([
+            self.model(depth=ancestor.depth + depth + 1, **{
+                'ancestor_%s_id' % ancestor.ancestor_node[0]:
+                ancestor.ancestor_node[1],
+                'descendant_%s_id' % descendant[0]: descendant[1]})
+            for ancestor in self.ancestors_of(parent)
+            for descendant, depth in subtree])
+
+    def detach(self, nodes):
+        """ Remove pairs linking the subtree nodes to outer ancestors. """
+        ids = dict(task=[], solution=[])
+        for kind, pk in nodes:
+            ids[kind].append(pk)
+        self.filter(
+            Q(descendant_task_id__in=ids['task']) |
+            Q(descendant_solution_id__in=ids['solution'])
+        ).exclude(
+            Q(ancestor_task_id__in=ids['task']) |
+            Q(ancestor_solution_id__in=ids['solution'])
+        ).delete()
+
+    def count_subtasks(self, node, solution_is_completed=False,
+                       solution_is_closed=False, task_is_reviewed=False,
+                       task_is_accepted=False, task_is_closed=False):
+        """ Count tasks stemming from the node in one query.
+
+        A task is counted when it and all tasks and solutions between it
+        and the node meet the state criteria. Solutions suggested to other
+        solutions are not followed.
+
+        :param node: (model name, id)
+        :return int:
+
+        """
+        from solution.models import Solution
+        from .models import Task
+
+        task_state = "{0}.is_reviewed = %s AND {0}.is_accepted = %s " \
+            "AND {0}.is_closed = %s"
+        task_params = [task_is_reviewed, task_is_accepted, task_is_closed]
+        solution_params = [solution_is_completed, solution_is_closed]
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT COUNT(*) FROM {closure} c
+            JOIN {task} t ON t.id = c.descendant_task_id
+            WHERE c.ancestor_{kind}_id = %s AND c.depth > 0
+            AND {t_state}
+            AND NOT EXISTS (
+                SELECT 1 FROM {closure} a
+                JOIN {closure} b ON (
+                    b.ancestor_task_id = a.descendant_task_id
+                    OR b.ancestor_solution_id = a.descendant_solution_id)
+                LEFT JOIN {task} nt ON nt.id = a.descendant_task_id
+                LEFT JOIN {solution} ns ON ns.id = a.descendant_solution_id
+                WHERE a.ancestor_{kind}_id = %s AND a.depth > 0
+                AND b.descendant_task_id = t.id AND b.depth > 0
+                AND (nt.id IS NOT NULL AND NOT ({nt_state})
+                    OR ns.id IS NOT NULL AND (
+                        ns.solution_id IS NOT NULL
+                        OR NOT (ns.is_completed = %s AND ns.is_closed = %s)))
+            )
+        """.format(
+            closure=self.model._meta.db_table, task=Task._meta.db_table,
+            solution=Solution._meta.db_table, kind=node[0],
+            t_state=task_state.format('t'), nt_state=task_state.format('nt'),
+        ), [node[1]] + task_params + [node[1]] + task_params + solution_params)
+        return cursor.fetchone()[0]
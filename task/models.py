@@ -5,13 +5,15 @@ from django.core.urlresolvers import reverse
 from django.utils import timezone
 from django.core import serializers
 from django.conf import settings
-from django.core.cache import cache
+from model_utils.managers import PassThroughManager
 from taggit.managers import TaggableManager
 
-from joltem.models import Commentable
+from joltem.models import Commentable, Follower
 from joltem.models.generic import Updatable
 from joltem.models.utils import TaggedItem
 
+from .managers import ClosureQuerySet, get_node
+
 
 class Task(Commentable, Updatable):
 
@@ -59,6 +61,9 @@ class Task(Commentable, Updatable):
     )
 
     model_name = "task"
+    follower_reasons = (
+        Follower.REASON_CHOICES.owner, Follower.REASON_CHOICES.comment,
+        Follower.REASON_CHOICES.vote)
 
     title = models.CharField(max_length=200)
     description = models.TextField(null=True, blank=True)
@@ -81,17 +86,6 @@ class Task(Commentable, Updatable):
     def __unicode__(self):
         return self.title
 
-    @property
-    def followers(self):
-        """ Get users for notify.
-
-        :returns: A set of users.
-
-        """
-        return set(
-            [self.owner] + list(self.iterate_commentators()) +
-            [v.voter for v in self.vote_set.select_related('voter')])
-
     def get_subtask_count(
             self, solution_is_completed=False, solution_is_closed=False,
             task_is_reviewed=False, task_is_accepted=False,
@@ -112,44 +106,30 @@ class Task(Commentable, Updatable):
         :return int: Count
 
         """
-        count = 0
-        for solution in self.solution_set.filter(
-                is_completed=solution_is_completed,
-                is_closed=solution_is_closed):
-            count += solution.get_subtask_count(
-                solution_is_completed, solution_is_closed,
-                task_is_reviewed, task_is_accepted, task_is_closed
-            )
-        return count
+        return Closure.objects.count_subtasks(
+            get_node(self), solution_is_completed, solution_is_closed,
+            task_is_reviewed, task_is_accepted, task_is_closed)
 
     def iterate_parents(self):
-        """ Iterate through parents.
+        """ Iterate through parents, starting from the closest one.
 
         Returns a tuple with the parent solution and task.
 
         """
-        parent_solution, parent_task = self.parent, None
-        yield parent_solution, parent_task
-        while parent_solution or parent_task:
-            if parent_solution:
-                parent_solution, parent_task = (
-                    parent_solution.solution, parent_solution.task)
-            elif parent_task:
-                parent_solution, parent_task = parent_task.parent, None
-            if parent_solution or parent_task:
-                yield parent_solution, parent_task
+        for closure in Closure.objects.ancestors_of(
+                get_node(self), depth=1).select_related(
+                    'ancestor_task', 'ancestor_solution').order_by('depth'):
+            yield closure.ancestor_solution, closure.ancestor_task
 
     def save(self, **kwargs):
         """ Override to notify at creation. """
 
         created = not self.pk
         super(Task, self).save(**kwargs)
+        Closure.objects.sync(self)
         if created:
             self.notify_created()
 
-        # Clear tabs counter cache
-        cache.delete('%s:tasks_tabs' % self.project_id)
-
     def put_vote(self, voter, is_accepted):
         """ Cast or overwrites a vote cast while reviewing a task.
 
@@ -168,15 +148,15 @@ class Task(Commentable, Updatable):
         vote.save()
 
         ntype = settings.NOTIFICATION_TYPES.vote_added if create else settings.NOTIFICATION_TYPES.vote_updated # noqa
-        for user in self.followers:
-            if user == vote.voter:
-                continue
-
-            self.notify(user, ntype, create, kwargs={
-                "voter_first_name": vote.voter.first_name,
-                "type": "task",
-                "title": self.title,
-            })
+        self.notify_many(self.followers - set([vote.voter]), ntype, create, {
+            "voter_first_name": vote.voter.first_name,
+            "type": "task",
+            "title": self.title,
+        })
+        if not create:
+            # the latest voters are listed first
+            self.update_notification_texts(
+                settings.NOTIFICATION_TYPES.vote_added)
 
         self.determine_acceptance(vote)
 
@@ -227,9 +207,7 @@ class Task(Commentable, Updatable):
         ntype = settings.NOTIFICATION_TYPES.task_accepted if is_accepted\
             else settings.NOTIFICATION_TYPES.task_rejected
 
-        listeners = self.followers - set([acceptor])
-        for user in listeners:
-            self.notify(user, ntype, True)
+        self.notify_many(self.followers - set([acceptor]), ntype, True)
 
     def notify_created(self):
         """ Send out appropriate notifications about the task being posted. """
@@ -239,11 +217,10 @@ class Task(Commentable, Updatable):
                     self.parent.owner, settings.NOTIFICATION_TYPES.task_posted,
                     True, kwargs={"role": "parent_solution"})
         else:
-            for admin in self.project.admin_set.all():
-                if admin.id != self.owner_id:
-                    self.notify(
-                        admin, settings.NOTIFICATION_TYPES.task_posted, True,
-                        kwargs={"role": "project_admin"})
+            self.notify_many(
+                self.project.admin_set.exclude(pk=self.owner_id),
+                settings.NOTIFICATION_TYPES.task_posted, True,
+                kwargs={"role": "project_admin"})
 
     def default_title(self):
         """ Just prevent conflict with solutions.
@@ -307,3 +284,55 @@ class Vote(models.Model):
 
     class Meta:
         unique_together = ['voter', 'task']
+
+
+class Closure(models.Model):
+
+    """ Ancestor and descendant pair in the tree of tasks and solutions.
+
+    Every task and solution is paired with itself and with each of its
+    ancestors. Exactly one of the ancestor fields and one of the
+    descendant fields is set.
+
+    Attributes :
+    depth -- number of hops from the ancestor to the descendant, 0 for the
+        pair of a node with itself.
+
+    """
+
+    ancestor_task = models.ForeignKey(
+        Task, null=True, blank=True, related_name='descendant_closure_set')
+    ancestor_solution = models.ForeignKey(
+        'solution.Solution', null=True, blank=True,
+        related_name='descendant_closure_set')
+    descendant_task = models.ForeignKey(
+        Task, null=True, blank=True, related_name='ancestor_closure_set')
+    descendant_solution = models.ForeignKey(
+        'solution.Solution', null=True, blank=True,
+        related_name='ancestor_closure_set')
+    depth = models.PositiveIntegerField()
+
+    objects = PassThroughManager.for_queryset_class(ClosureQuerySet)()
+
+    def __unicode__(self):
+        return u'%s:%s > %s:%s' % (
+            self.ancestor_node + self.descendant_node)
+
+    @property
+    def ancestor_node(self):
+        """ Ancestor as (model name, id). """
+        if self.ancestor_task_id:
+            return 'task', self.ancestor_task_id
+        return 'solution', self.ancestor_solution_id
+
+    @property
+    def descendant_node(self):
+        """ Descendant as (model name, id). """
+        if self.descendant_task_id:
+            return 'task', self.descendant_task_id
+        return 'solution', self.descendant_solution_id
+
+    @property
+    def ancestor(self):
+        """ Ancestor task or solution. """
+        return self.ancestor_task or self.ancestor_solution
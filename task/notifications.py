@@ -6,6 +6,27 @@ from joltem.notifications import _NotifyInterface
 from joltem.utils import list_string_join
 
 
+def get_commentators(task):
+    """ Get distinct commentators of the task, the latest first.
+
+    :returns: A list of users
+
+    """
+    return list(task.iterate_commentators(
+        queryset=task.comment_set.select_related('owner').order_by(
+            "-time_commented")))
+
+
+def get_voters(task):
+    """ Get voters of the task, the latest first.
+
+    :returns: A list of users
+
+    """
+    return [v.voter for v in task.vote_set.select_related('voter').order_by(
+        '-time_voted')]
+
+
 class CommentAdded(_NotifyInterface):
 
     """ Notify about added comment to task."""
@@ -13,25 +34,36 @@ class CommentAdded(_NotifyInterface):
     ntype = settings.NOTIFICATION_TYPES.comment_added
     model = 'task.task'
 
-    def get_text(self, notifying=None, user=None):
+    def get_text(self, notifying=None, user=None, commentators=None):
         """ Get text for current notification.
 
+        :param commentators: distinct commentators, the latest first.
         :returns: Comment added text.
 
         """
         if notifying is None:
             notifying = self.notification.notifying
+        if commentators is None:
+            commentators = get_commentators(notifying)
         user_id = self.notification.user_id
-        first_names = notifying.get_commentator_first_names(
-            queryset=notifying.comment_set.select_related('owner').exclude(
-                owner_id=user_id).order_by("-time_commented")
-        )
+        first_names = [u.first_name for u in commentators if u.id != user_id]
         prefix = ''
         if notifying.owner_id == user_id:
             prefix = 'your '
         return "%s commented on %stask \"%s\"" % (
             list_string_join(first_names), prefix, notifying.title)
 
+    @classmethod
+    def get_texts(cls, notifications, notifying):
+        """ Get texts with one query for the commentators.
+
+        :returns: A list of texts
+
+        """
+        commentators = get_commentators(notifying)
+        return [cls(n).get_text(notifying, commentators=commentators)
+                for n in notifications]
+
 
 class TaskPosted(_NotifyInterface):
 
@@ -107,28 +139,40 @@ class VoteAdded(_NotifyInterface):
     ntype = settings.NOTIFICATION_TYPES.vote_added
     model = 'task.task'
 
-    def get_text(self, notifying=None, user=None):
+    def get_text(self, notifying=None, user=None, voters=None):
         """ Get text for current notification.
 
+        :param voters: voters, the latest first.
         :returns: A text
 
         """
         if notifying is None:
             notifying = self.notification.notifying
+        if voters is None:
+            voters = get_voters(notifying)
         owner_id = self.notification.kwargs['owner']['pk']
         user_id = self.notification.user_id
         prefix = ''
         if owner_id == user_id:
             prefix = 'your '
 
-        votes = notifying.vote_set.select_related('voter').exclude(
-            voter_id=user_id).order_by('-time_voted')
-        first_names = list(v.voter.first_name for v in votes)
+        first_names = [u.first_name for u in voters if u.id != user_id]
 
         title = self.notification.kwargs['notifying']['fields']['title']
         return "%s voted on %stask \"%s\"" % \
                (list_string_join(first_names), prefix, title)
 
+    @classmethod
+    def get_texts(cls, notifications, notifying):
+        """ Get texts with one query for the voters.
+
+        :returns: A list of texts
+
+        """
+        voters = get_voters(notifying)
+        return [cls(n).get_text(notifying, voters=voters)
+                for n in notifications]
+
 
 class VoteUpdated(_NotifyInterface):
 
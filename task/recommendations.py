@@ -0,0 +1,297 @@
+""" Recommend open tasks to users by their tags.
+
+Tags of tasks and users form sparse task x tag and user x tag matrices.
+The score of a task for a user is their product, the task weight summed
+over the shared tags, so the index keeps the task matrix by columns: the
+weights of tasks by tag. The weight grows with the priority of a task and
+doubles every half life from an epoch, so newer tasks weigh more and the
+weights loaded at different times stay comparable. Weights and scores are
+kept as base 2 logarithms, which grow linearly with the time and do not
+overflow.
+
+Tasks are ranked by celery workers, each keeps the index in memory.
+Changed tasks are logged in the cache under increasing versions, and the
+index applies the missed changes before ranking, or is rebuilt when the
+log is lost. A lost version restarts from the time, above the versions
+used before.
+
+Ranked tasks are cached by user with the generations of the user and of
+the user's tags. A change of a task bumps its tags, a change of the tags
+or memberships of a user bumps the user, so only the rankings which may
+change are ranked again. Pages read the cached ranking and queue a new
+one when it is stale, without waiting for it.
+
+"""
+import bisect
+import heapq
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.utils import timezone
+
+from joltem.libs.cache import Namespace, get_generations
+
+CHANGES_CACHE_KEY = 'recommend:changes:%d'
+CHANGES_CACHE_TIMEOUT = 60 * 60 * 24
+RANKED_CACHE_KEY = 'recommend:ranked:%d'
+QUEUED_CACHE_KEY = 'recommend:queued:%d'
+QUEUED_CACHE_TIMEOUT = 60
+USER_NAMESPACE = 'recommend:user:%d'
+TAG_NAMESPACE = 'recommend:tag:%d'
+
+# More changes are not applied one by one, the index is rebuilt
+MAX_CHANGES = 500
+
+EPOCH = timezone.datetime(2014, 1, 1, tzinfo=timezone.utc)
+
+_index = None
+_versions = Namespace('recommend')
+
+
+def get_weight(priority, time_posted):
+    """ Get weight of a task in scores, as a base 2 logarithm.
+
+    :return float:
+
+    """
+    days = (time_posted - EPOCH).total_seconds() / 86400.0
+    return math.log(1 + priority, 2) + \
+        days / settings.RECOMMEND_HALF_LIFE_DAYS
+
+
+class TaskIndex(object):
+
+    """ Weights of open tasks by tag, the task x tag matrix by columns.
+
+    Columns are sorted by weight, the heaviest first, so ranking stops
+    once no task left unseen can beat the ones found.
+
+    """
+
+    def __init__(self, version=0):
+        self.version = version
+        # (-weight, task id) by tag
+        self.postings = defaultdict(list)
+        # (project id if private, tags, weight) by task id
+        self.tasks = {}
+
+    def add(self, pk, tags, weight, private_project_id=None):
+        """ Add a task to the index. """
+        self.remove(pk)
+        self.tasks[pk] = (private_project_id, tags, weight)
+        for tag in tags:
+            bisect.insort(self.postings[tag], (-weight, pk))
+
+    def remove(self, pk):
+        """ Remove a task from the index. """
+        _, tags, weight = self.tasks.pop(pk, (None, (), None))
+        for tag in tags:
+            posting = self.postings[tag]
+            i = bisect.bisect_left(posting, (-weight, pk))
+            if i < len(posting) and posting[i][1] == pk:
+                del posting[i]
+
+    def load(self, task_ids=None):
+        """ Load open tasks from the database, one query.
+
+        :param task_ids: reload only the tasks, all when None
+
+        """
+        from task.models import Task
+        tasks = Task.objects.filter(
+            is_accepted=True, is_closed=False, tags__name__isnull=False)
+        if task_ids is not None:
+            for pk in task_ids:
+                self.remove(pk)
+            tasks = tasks.filter(pk__in=task_ids)
+
+        rows = defaultdict(lambda: [None, None, set()])
+        for pk, project_id, is_private, priority, time_posted, tag in \
+                tasks.values_list(
+                    'pk', 'project', 'project__is_private', 'priority',
+                    'time_posted', 'tags__name'):
+            row = rows[pk]
+            row[0] = project_id if is_private else None
+            row[1] = get_weight(priority, time_posted)
+            row[2].add(tag)
+
+        if task_ids is not None:
+            for pk, (private_project_id, weight, tags) in rows.items():
+                self.add(pk, tags, weight, private_project_id)
+            return
+        for pk, (private_project_id, weight, tags) in rows.items():
+            self.tasks[pk] = (private_project_id, tags, weight)
+            for tag in tags:
+                self.postings[tag].append((-weight, pk))
+        for posting in self.postings.values():
+            posting.sort()
+
+    def rank(self, tags, project_ids=(), limit=10):
+        """ Rank tasks by the product of their tags and the user's tags.
+
+        A task scores its weight for each shared tag, the logarithm of the
+        score adds the logarithm of the number of shared tags. Columns of
+        the tags are merged by weight, so the shares of a task come
+        together.
+
+        :param tags: tags of the user
+        :param project_ids: private projects the user belongs to
+        :param limit: number of tasks to return
+        :return list: (score, task id), the best first
+
+        """
+        postings = [self.postings[t] for t in tags if self.postings.get(t)]
+        project_ids = set(project_ids)
+        best = []
+        # No task left can share more tags than the user has
+        most = math.log(len(postings), 2) if postings else 0
+
+        def push(item, count):
+            project_id = self.tasks[item[1]][0]
+            if project_id is None or project_id in project_ids:
+                scored = (-item[0] + math.log(count, 2), item[1])
+                if len(best) < limit:
+                    heapq.heappush(best, scored)
+                else:
+                    heapq.heappushpop(best, scored)
+
+        current, count = None, 0
+        for item in heapq.merge(*postings):
+            if item != current:
+                if current is not None:
+                    push(current, count)
+                if len(best) == limit and -item[0] + most <= best[0][0]:
+                    current = None
+                    break
+                current, count = item, 0
+            count += 1
+        if current is not None:
+            push(current, count)
+        return sorted(best, reverse=True)
+
+
+def get_namespaces(user_id, tag_ids):
+    """ Get namespaces the ranking of the user follows.
+
+    :return list: of the user, then of the tags
+
+    """
+    return [Namespace(USER_NAMESPACE % user_id)] + [
+        Namespace(TAG_NAMESPACE % pk) for pk in tag_ids]
+
+
+def mark_changed(task_ids, tag_ids=()):
+    """ Log changed tasks for the indexes, make rankings of their tags stale.
+
+    :param tag_ids: tags removed from the tasks, current ones are loaded
+
+    """
+    from joltem.models.utils import TaggedItem
+    from task.models import Task
+    task_ids = list(task_ids)
+    version = _versions.bump()
+    cache.set(CHANGES_CACHE_KEY % version, task_ids, CHANGES_CACHE_TIMEOUT)
+    tag_ids = set(tag_ids)
+    tag_ids.update(TaggedItem.objects.filter(
+        content_type=ContentType.objects.get_for_model(Task),
+        object_id__in=task_ids).values_list('tag', flat=True))
+    for pk in tag_ids:
+        Namespace(TAG_NAMESPACE % pk).bump()
+
+
+def get_index():
+    """ Get the index of this process with the logged changes applied.
+
+    :return TaskIndex:
+
+    """
+    global _index
+    version = _versions.get_generation()
+    if _index is not None and _index.version == version:
+        return _index
+
+    if _index is not None and 0 < version - _index.version <= MAX_CHANGES:
+        keys = [CHANGES_CACHE_KEY % v
+                for v in range(_index.version + 1, version + 1)]
+        changes = cache.get_many(keys)
+        if len(changes) == len(keys):
+            _index.load(set(
+                pk for task_ids in changes.values() for pk in task_ids))
+            _index.version = version
+            return _index
+
+    index = TaskIndex(version)
+    index.load()
+    _index = index
+    return _index
+
+
+def get_project_ids(user):
+    """ Get private projects the user can see the tasks of.
+
+    :return set:
+
+    """
+    from project.models import Project
+    project_ids = set()
+    for field in ('invitee_set', 'manager_set', 'admin_set', 'developer_set'):
+        project_ids.update(getattr(Project, field).through.objects.filter(
+            user=user, project__is_private=True).values_list(
+                'project', flat=True))
+    return project_ids
+
+
+def rank(user_id):
+    """ Rank tasks for the user with the index of this process, cache them.
+
+    Generations are read before the ranking, so a change made meanwhile
+    leaves the cached ranking stale.
+
+    """
+    from joltem.models import User
+    user = User(pk=user_id)
+    tags = dict(user.tags.values_list('pk', 'name'))
+    generations = get_generations(get_namespaces(user_id, tags))
+    task_ids = [pk for _, pk in get_index().rank(
+        tags.values(), get_project_ids(user), settings.RECOMMEND_LIMIT)]
+    cache.set(RANKED_CACHE_KEY % user_id, dict(
+        tag_ids=list(tags), generations=generations, task_ids=task_ids
+    ), settings.RECOMMEND_CACHE_TIMEOUT)
+    cache.delete(QUEUED_CACHE_KEY % user_id)
+
+
+def recommend(user, limit=None):
+    """ Get the tasks recommended to the user, the best first.
+
+    The cached ranking is returned, a stale one is ranked again by a
+    celery task and returned meanwhile.
+
+    :return list: tasks
+
+    """
+    from joltem.tasks import rank_recommended_tasks
+    from task.models import Task
+    limit = limit or settings.RECOMMEND_LIMIT
+    key = RANKED_CACHE_KEY % user.pk
+    ranked = cache.get(key)
+    if ranked is None or ranked['generations'] != get_generations(
+            get_namespaces(user.pk, ranked['tag_ids'])):
+        if cache.add(QUEUED_CACHE_KEY % user.pk, True, QUEUED_CACHE_TIMEOUT):
+            rank_recommended_tasks.delay(user.pk)
+            # Ranked already when tasks run eagerly
+            ranked = cache.get(key) or ranked
+    task_ids = ranked['task_ids'] if ranked else []
+
+    # Ranked ids may be older than a change of access, check it again
+    tasks = Task.objects.select_related('project').in_bulk(task_ids)
+    tasks = [tasks[pk] for pk in task_ids if pk in tasks and
+             tasks[pk].project.has_access(user.pk)]
+    return tasks[:limit]
+
+
+def forget_user(user_id):
+    """ Make the ranking of the user stale, tags or memberships changed. """
+    Namespace(USER_NAMESPACE % user_id).bump()
@@ -7,9 +7,10 @@ class TaskModelTest(TestCase):
 
     def test_cache_invalidate(self):
         project = mixer.blend('project')
-        cache.set('%s:tasks_tabs' % project.pk, True)
+        key = project.cache_namespace.make_key('tabs')
+        cache.set(key, True)
         mixer.blend('task', project=project)
-        self.assertFalse(cache.get('%s:tasks_tabs' % project.pk))
+        self.assertNotEqual(project.cache_namespace.make_key('tabs'), key)
 
     def test_add_comment(self):
         task = mixer.blend('task')
@@ -22,3 +23,75 @@ class TaskModelTest(TestCase):
         task.put_vote(mixer.blend('user'), True)
         _task = load_model(task)
         self.assertEqual(task.time_updated, _task.time_updated)
+
+
+class ClosureTest(TestCase):
+
+    """ Tree of tasks and solutions is kept in the closure table. """
+
+    def setUp(self):
+        self.project = mixer.blend('project')
+        self.root = mixer.blend('task', project=self.project, parent=None)
+
+    def add_solution(self, **kwargs):
+        kwargs.setdefault('task', None)
+        kwargs.setdefault('solution', None)
+        return mixer.blend('solution', project=self.project, **kwargs)
+
+    def add_task(self, parent, **kwargs):
+        kwargs.setdefault('is_reviewed', True)
+        kwargs.setdefault('is_accepted', True)
+        return mixer.blend('task', project=self.project, parent=parent,
+                           is_closed=False, **kwargs)
+
+    def test_subtask_count(self):
+        s1 = self.add_solution(task=self.root)
+        t1 = self.add_task(s1)
+        s2 = self.add_solution(task=t1)
+        self.add_task(s2)
+        self.add_task(s2, is_accepted=False)
+        s3 = self.add_solution(task=t1, is_closed=True)
+        self.add_task(s3)
+        suggested = self.add_solution(solution=s1)
+        self.add_task(suggested)
+        rejected = self.add_task(s1, is_accepted=False)
+        self.add_task(self.add_solution(task=rejected))
+
+        states = dict(task_is_reviewed=True, task_is_accepted=True)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.root.get_subtask_count(**states), 2)
+        self.assertEqual(s1.get_subtask_count(**states), 2)
+        self.assertEqual(s3.get_subtask_count(**states), 1)
+        self.assertEqual(self.root.get_subtask_count(
+            solution_is_closed=True, **states), 0)
+        self.assertEqual(self.root.get_subtask_count(
+            task_is_reviewed=True), 1)
+
+    def test_iterate_parents(self):
+        s1 = self.add_solution(task=self.root)
+        s2 = self.add_solution(solution=s1)
+        t2 = self.add_task(s2)
+        with self.assertNumQueries(1):
+            parents = list(t2.iterate_parents())
+        self.assertEqual(
+            parents, [(s2, None), (s1, None), (None, self.root)])
+
+    def test_move(self):
+        from task.models import Closure
+        s1 = self.add_solution(task=self.root)
+        t1 = self.add_task(s1)
+        s2 = self.add_solution(task=t1)
+        t2 = self.add_task(s2)
+        other = self.add_solution(task=mixer.blend(
+            'task', project=self.project, parent=None))
+
+        t1.parent = other
+        t1.save()
+        self.assertEqual(
+            [p for p, _ in t2.iterate_parents()][:3], [s2, None, other])
+        self.assertFalse(Closure.objects.descendants_of(
+            ('task', self.root.pk), depth=1).exclude(
+                descendant_solution=s1).exists())
+
+        t1.delete()
+        self.assertFalse(Closure.objects.ancestors_of(('task', t2.pk)))
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.test import TestCase
 from django.core.urlresolvers import reverse
 from joltem.libs import mixer
@@ -83,15 +84,19 @@ class TaskNotificationsTest(TestCase):
 
         voter3 = mixer.blend('user', first_name="Bob")
         task.put_vote(voter3, False)
+        notify = voter1.notification_set.get()
         self.assertEqual(notify.get_text(), '%s and %s voted on task "%s"' % (
             voter3.first_name, voter2.first_name, task.title))
 
         voter4 = mixer.blend('user', first_name="Bob")
         task.put_vote(voter4, False)
+        notify = voter1.notification_set.get()
         self.assertEqual(notify.get_text(), '%s, %s, and %s voted on task "%s"' % (
             voter4.first_name, voter3.first_name, voter2.first_name, task.title))
 
         task.put_vote(voter3, False)
+        notify = voter1.notification_set.get(
+            type=settings.NOTIFICATION_TYPES.vote_added)
         self.assertEqual(notify.get_text(), '%s, %s, and %s voted on task "%s"' % (
             voter3.first_name, voter4.first_name, voter2.first_name, task.title))
 
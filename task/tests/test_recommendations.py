@@ -0,0 +1,123 @@
+""" Test recommendation of tasks. """
+from django.core.cache import cache
+from django.test import TestCase
+from django.utils import timezone
+
+from joltem.libs import mixer
+from joltem.libs.cache import GENERATION_CACHE_KEY
+from task import recommendations
+from task.recommendations import TaskIndex, get_index, recommend
+
+
+class TaskIndexTest(TestCase):
+
+    """ Tasks are ranked by shared tags and weights. """
+
+    def test_rank(self):
+        index = TaskIndex()
+        index.add(1, set(['python', 'django']), 1.0)
+        index.add(2, set(['python']), 1.5)
+        index.add(3, set(['django']), 3.0, private_project_id=7)
+        index.add(4, set(['ios']), 5.0)
+        self.assertEqual(index.rank(['python', 'django']),
+                         [(2.0, 1), (1.5, 2)])
+        self.assertEqual(index.rank(['python', 'django'], [7], limit=2),
+                         [(3.0, 3), (2.0, 1)])
+
+        index.add(2, set(['python']), 0.5)
+        index.remove(1)
+        self.assertEqual(index.rank(['python', 'django']), [(0.5, 2)])
+
+    def test_weight(self):
+        now = timezone.now()
+        week = timezone.timedelta(days=7)
+        self.assertGreater(recommendations.get_weight(0, now),
+                           recommendations.get_weight(0, now - week))
+        self.assertGreater(recommendations.get_weight(2, now - week),
+                           recommendations.get_weight(0, now))
+        self.assertGreater(recommendations.get_weight(
+            0, now + timezone.timedelta(days=365 * 100)), 0)
+
+
+class RecommendTest(TestCase):
+
+    """ Recommendations follow changes of tags. """
+
+    def setUp(self):
+        recommendations._index = None
+        self.user = mixer.blend('joltem.user')
+        self.user.tags.add('python')
+
+    def blend_task(self, *tags, **kwargs):
+        kwargs.setdefault('project__is_private', False)
+        task = mixer.blend('task.task', is_accepted=True, is_closed=False,
+                           **kwargs)
+        task.tags.add(*tags)
+        return task
+
+    def test_recommend(self):
+        high = self.blend_task('python', priority=1)
+        low = self.blend_task('python', 'django', 'flask', priority=0)
+        self.blend_task('ios')
+        self.assertEqual(recommend(self.user), [high, low])
+        version = get_index().version
+
+        self.user.tags.add('django', 'flask')
+        self.assertEqual(recommend(self.user), [low, high])
+
+        high.tags.add('django')
+        self.assertEqual(recommend(self.user), [high, low])
+        self.assertEqual(get_index().version, version + 1)
+
+        low.is_closed = True
+        low.save()
+        self.assertEqual(recommend(self.user), [high])
+
+    def test_lost_version(self):
+        task = self.blend_task('python')
+        self.assertEqual(recommend(self.user), [task])
+        version = get_index().version
+
+        # Changes after a lost version are not skipped
+        cache.delete(GENERATION_CACHE_KEY % 'recommend')
+        task.is_closed = True
+        task.save()
+        self.assertGreater(get_index().version, version)
+        self.assertEqual(recommend(self.user), [])
+
+    def test_private(self):
+        task = self.blend_task('python', project__is_private=True)
+        self.assertEqual(recommend(self.user), [])
+        task.project.invitee_set.add(self.user)
+        self.assertEqual(recommend(self.user), [task])
+        task.project.invitee_set.remove(self.user)
+        self.assertEqual(recommend(self.user), [])
+
+    def test_privacy(self):
+        task = self.blend_task('python')
+        self.assertEqual(recommend(self.user), [task])
+        task.project.is_private = True
+        task.project.save()
+        self.assertEqual(recommend(self.user), [])
+        self.assertEqual(get_index().tasks[task.pk][0], task.project_id)
+
+        task.project.is_private = False
+        task.project.save()
+        self.assertEqual(recommend(self.user), [task])
+
+    def test_unrelated_task(self):
+        task = self.blend_task('python')
+        other = mixer.blend('joltem.user')
+        other.tags.add('ios')
+        self.assertEqual(recommend(self.user), [task])
+        self.assertEqual(recommend(other), [])
+        key = recommendations.RANKED_CACHE_KEY % self.user.pk
+        ranked = cache.get(key)
+
+        # A task of other tags leaves the ranking in place
+        ios = self.blend_task('ios')
+        ios.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(recommend(self.user), [task])
+        self.assertEqual(cache.get(key), ranked)
+        self.assertEqual(recommend(other), [ios])